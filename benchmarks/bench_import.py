@@ -0,0 +1,42 @@
+"""
+bench_import.py
+Замер времени запуска быстрых команд (--help, --check-formats) и импорта модулей.
+Цель: быстрые команды стартуют заметно быстрее 200 мс
+
+Запуск из корня проекта:
+    python benchmarks/bench_import.py
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPEATS = 10
+TARGET_MS = 200
+
+COMMANDS = {
+    'python -c pass (базовая линия)': [sys.executable, '-c', 'pass'],
+    'main.py --help': [sys.executable, 'main.py', '--help'],
+    'main.py --check-formats': [sys.executable, 'main.py', '--check-formats'],
+    'import core.config': [sys.executable, '-c', 'import core.config'],
+    'import core.loader (pandas)': [sys.executable, '-c', 'import core.loader'],
+}
+
+
+def measure(command, repeats=REPEATS):
+    """Медианное время выполнения команды в миллисекундах"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+if __name__ == "__main__":
+    for name, command in COMMANDS.items():
+        elapsed = measure(command)
+        mark = '' if 'pandas' in name or elapsed < TARGET_MS else f'  <- больше {TARGET_MS} мс'
+        print(f"{name:35s} {elapsed:8.1f} мс{mark}")
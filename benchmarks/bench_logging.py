@@ -0,0 +1,62 @@
+"""
+bench_logging.py
+Замер накладных расходов логирования на горячих путях:
+стоимость отключенного debug с ленивым форматированием и f-строкой,
+стоимость записи через очередь (setup_logging) и синхронного FileHandler
+
+Запуск из корня проекта:
+    python benchmarks/bench_logging.py
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.config import setup_logging
+
+N = 200_000
+
+
+def per_call_us(func, n=N):
+    start = time.perf_counter()
+    func(n)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def debug_fstring(n):
+    for pu in range(n):
+        logging.debug(f"Поиск лучших показаний для ПУ {pu}")
+
+
+def debug_lazy(n):
+    for pu in range(n):
+        logging.debug("Поиск лучших показаний для ПУ %s", pu)
+
+
+def info_records(n):
+    for pu in range(n):
+        logging.info("Обработано %d приборов учета", pu)
+
+
+if __name__ == "__main__":
+    folder = tempfile.mkdtemp()
+    logging.basicConfig(level=logging.INFO, handlers=[logging.FileHandler(os.path.join(folder, 'sync.log'))],
+                        force=True)
+    print(f"debug отключен, f-строка:        {per_call_us(debug_fstring):6.2f} мкс/вызов")
+    print(f"debug отключен, ленивый формат:  {per_call_us(debug_lazy):6.2f} мкс/вызов")
+    print(f"info, синхронный FileHandler:    {per_call_us(info_records, N // 10):6.2f} мкс/запись")
+
+    logging.getLogger().handlers[0].close()
+    listener = setup_logging(os.path.join(folder, 'async.log'))
+    logging.getLogger().handlers[0].setLevel(logging.INFO)
+    # Консольный вывод не нужен для замера
+    listener.handlers = listener.handlers[:1]
+    queued = per_call_us(info_records, N // 10)
+    print(f"info, через очередь:             {queued:6.2f} мкс/запись")
+    listener.stop()
+
+    # На 1 млн ПУ add_best_readings пишет запись о ходе работы раз в 1000 ПУ и несколько сводных записей
+    records = 1_000_000 // 1000 + 20
+    print(f"Оценка логирования на 1 млн ПУ: {records} записей, {records * queued / 1e6:.3f} с")
@@ -0,0 +1,77 @@
+"""
+bench_memory.py
+Замер пиковой памяти этапов конвейера в памяти (удаление дублей, лучшие показания,
+широкая таблица) на синтетических источниках, с режимом копирования при записи pandas и без него.
+Пик считается через tracemalloc и выводится в МБ и в долях от объёма загруженных источников
+
+Запуск из корня проекта:
+    python benchmarks/bench_memory.py [число ПУ] [число источников]
+"""
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.config import COLS_KP
+from core.processor import delete_duplicates, add_best_readings, add_additional_readings
+
+METERS = 200_000
+SOURCES = 4
+
+
+def make_sources(n_meters=METERS, n_sources=SOURCES, seed=0):
+    """Источники в виде результата load_sources: по строке на ПУ, часть ПУ есть в нескольких источниках"""
+    rng = np.random.default_rng(seed)
+    sources = {}
+    for index in range(n_sources):
+        meters = rng.choice(n_meters, size=n_meters // 2, replace=False).astype(str)
+        total = rng.random(len(meters)) * 10_000
+        sources[f'источник_{index}.csv'] = [pd.DataFrame({
+            'Номер ПУ': meters,
+            'Дата КП': pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 180, len(meters)), 'D'),
+            'Общий': total, 'День': total * 0.6, 'Ночь': total * 0.4,
+        }), 'SIMS']
+    return sources
+
+
+def run_pipeline(sources):
+    """Этапы main() после загрузки источников"""
+    main_table = delete_duplicates(pd.concat([df for df, _ in sources.values()], ignore_index=True))
+    best = add_best_readings(main_table, sources, ['2025-06-30'])
+    del main_table
+    return add_additional_readings(best, sources, COLS_KP)
+
+
+def measure(copy_on_write, n_meters=METERS, n_sources=SOURCES):
+    """
+    Возвращает:
+        tuple: (объём источников в МБ, пик памяти этапов в МБ, время в секундах)
+    """
+    pd.set_option('mode.copy_on_write', copy_on_write)
+    try:
+        sources = make_sources(n_meters, n_sources)
+        input_mb = sum(df.memory_usage(deep=True).sum() for df, _ in sources.values()) / 2 ** 20
+        tracemalloc.start()
+        start = time.perf_counter()
+        run_pipeline(sources)
+        elapsed = time.perf_counter() - start
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+        return input_mb, peak_mb, elapsed
+    finally:
+        pd.set_option('mode.copy_on_write', False)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    n_meters = int(sys.argv[1]) if len(sys.argv) > 1 else METERS
+    n_sources = int(sys.argv[2]) if len(sys.argv) > 2 else SOURCES
+    for copy_on_write in (False, True):
+        input_mb, peak_mb, elapsed = measure(copy_on_write, n_meters, n_sources)
+        print(f"copy_on_write={copy_on_write!s:5s} источники {input_mb:7.1f} МБ, пик {peak_mb:7.1f} МБ "
+              f"({peak_mb / input_mb:.2f} от источников), {elapsed:.2f} сек")
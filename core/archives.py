@@ -0,0 +1,187 @@
+"""
+archives.py
+Сжатые и упакованные входные файлы: .csv.gz, .xlsx.gz, .xlsb.gz, .csv.zst и файлы внутри архивов .zip.
+Файл внутри архива обозначается путём вида 'архив.zip::папка/файл.csv'.
+Данные распаковываются потоком при чтении, без записи на диск.
+Модуль не зависит от pandas
+"""
+import gzip
+import os
+import zipfile
+
+try:
+    import zstandard
+except ImportError:  # zstandard необязателен: без него файлы .zst пропускаются
+    zstandard = None
+
+# Разделитель пути к архиву и имени файла внутри него
+ARCHIVE_MEMBER_SEP = '::'
+
+# Расширения входных файлов с данными
+DATA_SUFFIXES = ('.xlsx', '.xlsb', '.csv')
+
+# Расширения сжатых файлов
+COMPRESSION_SUFFIXES = ('.gz', '.zst')
+
+
+def split_member(path):
+    """
+    Делит путь на путь к файлу на диске и имя файла внутри архива
+    >>> split_member('DATA/май.zip::Симс.csv')
+    ('DATA/май.zip', 'Симс.csv')
+    >>> split_member('DATA/Симс.csv')
+    ('DATA/Симс.csv', None)
+    """
+    if ARCHIVE_MEMBER_SEP in path:
+        archive_path, member = path.split(ARCHIVE_MEMBER_SEP, 1)
+        return archive_path, member
+    return path, None
+
+
+def source_name(path):
+    """
+    Имя файла с данными без пути к архиву и без расширения сжатия.
+    По нему определяются формат и тип файла
+    >>> source_name('DATA/май.zip::2025-05-19 Симс.csv.gz')
+    '2025-05-19 Симс.csv'
+    >>> source_name('DATA/Отчет КУЭМ (20).xlsx')
+    'DATA/Отчет КУЭМ (20).xlsx'
+    """
+    archive_path, member = split_member(path)
+    name = member if member is not None else archive_path
+    for suffix in COMPRESSION_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def is_data_file(path):
+    """
+    Проверяет, что файл содержит данные поддерживаемого типа (с учётом сжатия)
+    >>> is_data_file('Симс.csv.gz'), is_data_file('Симс.txt.gz')
+    (True, False)
+    """
+    if path.endswith('.zst') and zstandard is None:
+        return False
+    return source_name(path).endswith(DATA_SUFFIXES)
+
+
+def is_plain_file(path):
+    """Проверяет, что файл лежит на диске без сжатия и его можно читать напрямую"""
+    return split_member(path)[1] is None and not path.endswith(COMPRESSION_SUFFIXES)
+
+
+def archive_members(archive_path):
+    """
+    Файлы с данными внутри архива .zip
+
+    Возвращает:
+        list: Пути вида 'архив.zip::файл' или пустой список, если архив не читается
+    """
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            names = [info.filename for info in archive.infolist() if not info.is_dir()]
+    except (OSError, zipfile.BadZipFile):
+        return []
+    return [archive_path + ARCHIVE_MEMBER_SEP + name for name in names if is_data_file(name)]
+
+
+def source_exists(path):
+    """Проверяет наличие файла, в том числе файла внутри архива"""
+    archive_path, member = split_member(path)
+    if member is None:
+        return os.path.exists(archive_path)
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            archive.getinfo(member)
+        return True
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return False
+
+
+def source_size(path):
+    """Размер данных на диске в байтах (для файла в архиве - сжатый размер), 0 если файл недоступен"""
+    archive_path, member = split_member(path)
+    try:
+        if member is None:
+            return os.path.getsize(archive_path)
+        with zipfile.ZipFile(archive_path) as archive:
+            return archive.getinfo(member).compress_size
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return 0
+
+
+def source_stat(path):
+    """Размер и время изменения файла на диске (для файла в архиве - самого архива) или None"""
+    try:
+        stat = os.stat(split_member(path)[0])
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class _MemberStream:
+    """Поток файла внутри архива, при закрытии закрывает распаковщик и сам архив"""
+    mode = 'rb'  # По режиму pandas отличает двоичный поток от текстового
+
+    def __init__(self, stream, resources):
+        self.stream = stream
+        self.resources = resources
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def __iter__(self):
+        return iter(self.stream)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for resource in self.resources:
+            resource.close()
+
+
+def _zstd_reader(stream, name):
+    if zstandard is None:
+        raise ValueError(f"Для чтения {name} нужен пакет zstandard")
+    return zstandard.ZstdDecompressor().stream_reader(stream, closefd=True)
+
+
+def open_source(path):
+    """
+    Открывает файл с данными на чтение в двоичном режиме, сжатые данные распаковываются потоком
+
+    Возвращает:
+        Поток байтов распакованных данных, закрывается вызывающим кодом
+    """
+    archive_path, member = split_member(path)
+    if member is None:
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rb')
+        if path.endswith('.zst'):
+            return _zstd_reader(open(path, 'rb'), path)
+        return open(path, 'rb')
+
+    archive = zipfile.ZipFile(archive_path)
+    try:
+        raw = archive.open(member)
+        if member.endswith('.gz'):
+            stream = gzip.GzipFile(fileobj=raw, mode='rb')
+        elif member.endswith('.zst'):
+            stream = _zstd_reader(raw, member)
+        else:
+            stream = raw
+    except Exception:
+        archive.close()
+        raise
+    return _MemberStream(stream, [stream, raw, archive])
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,139 @@
+"""
+backends.py
+Реестр движков чтения книг Excel. Для каждого файла выбирается самый быстрый из установленных
+движков, поддерживающих его тип, по результатам замеров на прошлых данных.
+Таблица результата не зависит от выбранного движка
+"""
+import importlib.util
+import json
+import logging
+import os
+import time
+from functools import lru_cache
+
+from core.config import *
+from core.archives import source_name, source_size
+from core.sniffer import detect_format
+
+# Движки чтения: {имя движка pandas: (модуль, поддерживаемые типы файлов)}
+EXCEL_BACKENDS = {
+    'calamine': ('python_calamine', ('.xlsx', '.xlsb')),
+    'openpyxl': ('openpyxl', ('.xlsx',)),
+    'pyxlsb': ('pyxlsb', ('.xlsb',)),
+}
+
+# Порядок выбора движков, если замеров ещё нет
+DEFAULT_BACKEND_ORDER = ['calamine', 'openpyxl', 'pyxlsb']
+
+
+@lru_cache(maxsize=None)
+def backend_installed(backend):
+    """Проверяет, установлен ли модуль движка, не загружая его"""
+    return importlib.util.find_spec(EXCEL_BACKENDS[backend][0]) is not None
+
+
+def file_suffix(file_path):
+    """
+    Тип файла с данными с учётом сжатия и архивов
+    >>> file_suffix('DATA/май.zip::Отчет КУЭМ.XLSB.gz')
+    '.xlsb'
+    """
+    return os.path.splitext(source_name(file_path))[1].lower()
+
+
+def available_backends(file_path):
+    """Установленные движки, которые умеют читать файл, в порядке выбора по умолчанию"""
+    suffix = file_suffix(file_path)
+    return [backend for backend in DEFAULT_BACKEND_ORDER
+            if suffix in EXCEL_BACKENDS[backend][1] and backend_installed(backend)]
+
+
+def load_benchmarks(path=READER_BENCHMARK_FILE):
+    """
+    Загружает результаты замеров движков: {формат: {движок: секунд на мегабайт}}
+    >>> load_benchmarks('нет такого файла.json')
+    {}
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_benchmarks(benchmarks, path=READER_BENCHMARK_FILE):
+    """Сохраняет результаты замеров движков"""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(benchmarks, f, ensure_ascii=False, indent=2)
+
+
+def select_backend(file_path, format=None, benchmarks=None, backend=EXCEL_BACKEND):
+    """
+    Выбирает движок чтения книги: заданный в config.py, иначе самый быстрый по замерам
+    для формата файла, иначе первый установленный в порядке DEFAULT_BACKEND_ORDER
+
+    Возвращает:
+        str: Имя движка для pd.read_excel
+    """
+    candidates = available_backends(file_path)
+    if backend is not None and backend in candidates:
+        return backend
+    if not candidates:
+        packages = [EXCEL_BACKENDS[name][0].replace('_', '-') for name in DEFAULT_BACKEND_ORDER
+                    if file_suffix(file_path) in EXCEL_BACKENDS[name][1]]
+        raise ValueError(f"Нет установленного движка для чтения {file_path}: установите один из пакетов "
+                         f"{', '.join(packages)} (см. requirements-optional.txt)")
+    if benchmarks is None:
+        benchmarks = load_benchmarks()
+    if format is None:
+        format = detect_format(file_path)
+    measured = {name: speed for name, speed in benchmarks.get(str(format), {}).items() if name in candidates}
+    if measured:
+        return min(measured, key=measured.get)
+    return candidates[0]
+
+
+def benchmark_backends(files, read_file, path=READER_BENCHMARK_FILE):
+    """
+    Замеряет скорость каждого установленного движка на файлах и сохраняет результаты.
+    Замеры одного формата усредняются по всем его файлам
+
+    Параметры:
+        files (list): Список путей к книгам
+        read_file (callable): Функция чтения (путь, формат, движок) -> таблица
+        path (str): Файл результатов замеров
+
+    Возвращает:
+        dict: {формат: {движок: секунд на мегабайт}}
+    """
+    totals = {}
+    for file_path in files:
+        format = detect_format(file_path)
+        size_mb = source_size(file_path) / 2 ** 20
+        if format is None or size_mb <= 0:
+            continue
+        for backend in available_backends(file_path):
+            start = time.perf_counter()
+            try:
+                read_file(file_path, format, backend)
+            except Exception as e:
+                logging.warning(f"Движок {backend} не прочитал файл {file_path}: {e}")
+                continue
+            elapsed, size = totals.setdefault(format, {}).get(backend, (0.0, 0.0))
+            totals[format][backend] = (elapsed + time.perf_counter() - start, size + size_mb)
+
+    benchmarks = load_benchmarks(path)
+    for format, measured in totals.items():
+        benchmarks[format] = {backend: elapsed / size for backend, (elapsed, size) in measured.items()}
+    save_benchmarks(benchmarks, path)
+    logging.info(f"Замеры движков чтения сохранены в {path}")
+    return benchmarks
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,180 @@
+"""
+batch.py
+Пакетная обработка нескольких папок с данными (python main.py --batch DATA/2025-*): папки обрабатываются
+одновременно в пределах общего числа потоков разбора и общего бюджета памяти. Файл, который лежит
+в нескольких папках (одинаковое содержимое), разбирается один раз, результат каждой папки записывается
+в свою папку результата
+"""
+import glob
+import logging
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from core.config import *
+from core.checkpoint import file_content_hash
+from core.sniffer import detect_format
+
+
+def batch_folders(patterns):
+    """
+    Папки с данными по списку путей и шаблонов (glob), без повторов, в порядке перечисления
+
+    Параметры:
+        patterns (list): Пути к папкам или шаблоны, например ['DATA/2025-*']
+    """
+    folders = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for folder in matches:
+            folder = os.path.normpath(folder)
+            if not os.path.isdir(folder):
+                logging.warning(f"Папка с данными не найдена: {folder}")
+            elif folder not in folders:
+                folders.append(folder)
+    return folders
+
+
+def batch_output_folders(folders, output_root='output'):
+    """
+    Папка результата для каждой папки с данными: output_root/<имя папки>.
+    Если имена папок совпадают, имя составляется из всего пути
+    >>> batch_output_folders(['DATA/2025-05', 'DATA/2025-06'])['DATA/2025-06'].replace(os.sep, '/')
+    'output/2025-06'
+    >>> batch_output_folders(['A/05', 'B/05'])['B/05'].replace(os.sep, '/')
+    'output/B_05'
+    """
+    names = Counter(os.path.basename(folder) for folder in folders)
+    result = {}
+    for folder in folders:
+        name = os.path.basename(folder)
+        if names[name] > 1:
+            name = os.path.normpath(folder).strip(os.sep).replace(os.sep, '_').replace(':', '')
+        result[folder] = os.path.join(output_root, name)
+    return result
+
+
+class ParseCache:
+    """
+    Общие для всех папок результаты разбора файлов. Ключ - содержимое файла и формат, поэтому одна
+    выгрузка, скопированная в несколько папок, разбирается один раз. Одновременно разбирается
+    не больше workers файлов из всех папок. Результат хранится, пока его не получили все папки,
+    в которых лежит файл
+    """
+
+    def __init__(self, folder_files, workers=MAX_WORKERS):
+        """
+        Параметры:
+            folder_files (iterable): Списки файлов каждой папки
+            workers (int): Сколько файлов разбирается одновременно во всех папках
+        """
+        self.lock = threading.Lock()
+        self.parsing = threading.Semaphore(workers)
+        self.keys = {}
+        self.entries = {}
+        self.waiting = Counter()
+        self.fetched = set()
+        self.hits = 0
+        for files in folder_files:
+            for name in files:
+                self.waiting[self.key(name)] += 1
+
+    def key(self, file_path):
+        """
+        Ключ файла: хеш содержимого и формат. Хеш запоминается в file_content_hash,
+        контрольные точки и таблица источников папки не читают файл заново
+        """
+        if file_path not in self.keys:
+            self.keys[file_path] = (file_content_hash(file_path), detect_format(file_path))
+        return self.keys[file_path]
+
+    def get(self, file_path, load):
+        """
+        Результат разбора файла: из кеша или load(file_path), если файл с таким содержимым ещё не разбирался.
+        Другие папки с тем же файлом ждут окончания разбора
+
+        Параметры:
+            file_path (str): Путь к файлу
+            load (callable): Разбор файла, возвращает кортеж (результат process_file или None, причина
+                             превышения бюджета или None)
+
+        Возвращает:
+            tuple: (результат process_file с именем file_path или None, причина превышения бюджета или None,
+                    True если результат взят из кеша)
+        """
+        key = self.key(file_path)
+        with self.lock:
+            self.fetched.add(file_path)
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = {'ready': threading.Event(), 'value': (None, None)}
+                owner = True
+            else:
+                owner = False
+                self.hits += 1
+        if owner:
+            try:
+                with self.parsing:
+                    entry['value'] = load(file_path)
+            finally:
+                entry['ready'].set()
+        else:
+            entry['ready'].wait()
+
+        result, over_budget = entry['value']
+        self._done(key)
+        if result is not None:
+            # Имя источника - путь в этой папке, разобранная таблица общая
+            result = (file_path,) + tuple(result[1:])
+        return result, over_budget, not owner
+
+    def release(self, files):
+        """
+        Папка закончила работу: файлы, которые она не запрашивала (например, данные взяты из контрольной точки),
+        больше не ждут её
+        """
+        for name in files:
+            with self.lock:
+                fetched = name in self.fetched
+            if not fetched:
+                self._done(self.key(name))
+
+    def _done(self, key):
+        """Одна из папок получила файл, после последней результат разбора удаляется из кеша"""
+        with self.lock:
+            self.waiting[key] -= 1
+            if self.waiting[key] <= 0:
+                self.entries.pop(key, None)
+
+
+class MemoryBudget:
+    """
+    Общий бюджет памяти папок, обрабатываемых одновременно: папка начинает работу, когда её оценка
+    помещается в свободную часть бюджета. Папка, которая одна больше бюджета, запускается, когда
+    остальные закончили
+    """
+
+    def __init__(self, budget_mb=MEMORY_BUDGET_MB):
+        self.budget_mb = budget_mb
+        self.used_mb = 0.0
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, memory_mb):
+        """Занимает memory_mb из бюджета на время блока with, при нехватке ждёт освобождения"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.used_mb == 0 or self.used_mb + memory_mb <= self.budget_mb)
+            self.used_mb += memory_mb
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.used_mb -= memory_mb
+                self.condition.notify_all()
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
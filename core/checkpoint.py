@@ -0,0 +1,166 @@
+"""
+checkpoint.py
+Контрольные точки конвейера: результат каждого дорогого этапа сохраняется на диск
+под ключом, вычисленным по содержимому входных файлов. Повторный запуск
+с теми же входными данными продолжает работу с последней корректной точки
+"""
+import datetime
+import glob
+import hashlib
+import logging
+import os
+import pickle
+import zipfile
+
+from core.config import *
+from core.archives import open_source, source_stat
+
+# Версия формата контрольных точек. Увеличивается при изменении логики этапов
+CHECKPOINT_VERSION = 5
+
+# Этапы конвейера в порядке выполнения
+STAGES = ['sources', 'dedup', 'best', 'wide', 'long']
+
+# Размер блока при хешировании файлов
+HASH_BLOCK_SIZE = 2 ** 20
+
+# Папка контрольных точек для папки результата по умолчанию
+DEFAULT_CHECKPOINT_FOLDER = os.path.join('output', CHECKPOINT_DIR)
+
+# Хеши содержимого, вычисленные в этом процессе: {путь: (размер и время изменения, хеш)}
+_content_hashes = {}
+
+
+def file_content_hash(file_path):
+    """
+    Хеш содержимого файла, читается блоками без загрузки файла в память целиком.
+    Для сжатого файла и файла в архиве хешируются распакованные данные.
+    Для недоступного файла возвращает хеш его имени.
+    Файл читается один раз: пока его размер и время изменения (см. source_stat) не изменились,
+    хеш берётся из памяти - ключи контрольных точек, кеш разбора и таблица источников не читают файл заново
+    """
+    stat = source_stat(file_path)
+    cached = _content_hashes.get(file_path)
+    if stat is not None and cached is not None and cached[0] == stat:
+        return cached[1]
+    file_hash = _read_content_hash(file_path)
+    if stat is not None:
+        _content_hashes[file_path] = (stat, file_hash)
+    return file_hash
+
+
+def _read_content_hash(file_path):
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open_source(file_path) as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+    except (OSError, KeyError, zipfile.BadZipFile):
+        digest.update(f'missing:{file_path}'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def checkpoint_key(*parts):
+    """
+    Вычисляет ключ контрольной точки по набору составляющих
+    >>> checkpoint_key('a', 1) == checkpoint_key('a', 1)
+    True
+    >>> checkpoint_key('a', 1) == checkpoint_key('a', 2)
+    False
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(repr(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def inputs_key(files):
+    """Ключ этапа загрузки: содержимое входных файлов и настройки разбора, сведений о ПУ и проверки"""
+    settings = (CHECKPOINT_VERSION, NEW_NAMES, SIMS_NEW_NAMES, EMIS_NEW_NAMES, TELESCOP_NEW_NAMES,
+                PYRAMIDA_NEEDED_COLS, TELESCOP_NEEDED_COLS, SIMS_NEEDED_COLS, EMIS_NEEDED_COLS, COLS_KP,
+                SNIFF_FORMATS, EXCEL_BACKEND, METER_ATTRIBUTES, METER_REGISTRY, VALIDATION, VALIDATION_SUM_TOLERANCE)
+    return checkpoint_key(settings, [(name, file_content_hash(name)) for name in files])
+
+
+def stage_keys(files, periods, today=None):
+    """
+    Ключи всех этапов конвейера. Ключ каждого этапа зависит от ключа предыдущего,
+    лучшие показания дополнительно зависят от отчётных периодов. Флаги проверки результата
+    зависят от сегодняшней даты (показания с датой в будущем), поэтому при VALIDATION ключи
+    последних этапов меняются каждый день
+
+    Параметры:
+        today (datetime.date): Сегодняшняя дата, None - текущая
+
+    Возвращает:
+        dict: {этап: ключ}
+    """
+    flags_date = (today or datetime.date.today()) if VALIDATION else None
+    keys = {'sources': inputs_key(files)}
+    keys['dedup'] = checkpoint_key(keys['sources'], 'dedup')
+    keys['best'] = checkpoint_key(keys['dedup'], 'best', periods)
+    keys['wide'] = checkpoint_key(keys['best'], 'wide', flags_date)
+    keys['long'] = checkpoint_key(keys['best'], 'long', flags_date)
+    return keys
+
+
+def checkpoint_path(stage, key, folder=DEFAULT_CHECKPOINT_FOLDER):
+    """Путь к файлу контрольной точки"""
+    return os.path.join(folder, f'{stage}-{key}.pkl')
+
+
+def load_checkpoint(stage, key, folder=DEFAULT_CHECKPOINT_FOLDER):
+    """
+    Загружает контрольную точку этапа
+
+    Возвращает:
+        object: Сохраненный результат этапа или None, если точки нет или она повреждена
+    """
+    path = checkpoint_path(stage, key, folder)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        logging.info(f"Загружена контрольная точка этапа {stage}: {path}")
+        return data
+    except Exception as e:
+        logging.warning(f"Контрольная точка {path} повреждена и будет пересчитана: {e}")
+        return None
+
+
+def save_checkpoint(data, stage, key, folder=DEFAULT_CHECKPOINT_FOLDER):
+    """
+    Сохраняет результат этапа. Запись атомарная: сначала во временный файл, затем переименование.
+    Точки этого этапа с другими ключами удаляются. Ошибки сохранения не прерывают конвейер
+
+    Возвращает:
+        str: Путь к сохраненной точке или None при ошибке
+    """
+    path = checkpoint_path(stage, key, folder)
+    try:
+        payload = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        os.makedirs(folder, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logging.warning(f"Не удалось сохранить контрольную точку этапа {stage}: {e}")
+        return None
+
+    for old_path in glob.glob(os.path.join(folder, f'{stage}-*.pkl')):
+        if old_path != path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+    logging.info(f"Сохранена контрольная точка этапа {stage}: {path}")
+    return path
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -32,16 +32,195 @@ TELESCOP_NEW_NAMES = ['ПО', 'РЭС', 'Населенный пункт', 'ТП
 
 # Столбцы с показаниями
 COLS_KP = ['Дата КП', 'Общий', 'День', 'Ночь', 'Номер ПУ']
+# Статические сведения о ПУ, не меняющиеся от месяца к месяцу
+METER_ATTRIBUTES = ['ПО', 'РЭС', 'Населенный пункт', 'ТП', 'Адрес точки учёта', 'Потребитель', 'Лицевой счет', 'Тип ПУ']
 
-# Настройки логирования
+# Настройки логирования. Логирование настраивается явно вызовом setup_logging() при запуске приложения,
+# импорт модулей не создает файлов и не меняет настройки logging
 import logging
-from colorama import init, Fore, Style
-init(autoreset=True)  # Важно для Windows
-logging.basicConfig(
-    level=logging.INFO,
-    format=Fore.CYAN + "%(asctime)s - %(levelname)s - %(message)s" + Style.RESET_ALL,
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
-)
\ No newline at end of file
+import threading
+LOG_FILE = 'app.log'
+LOG_LEVEL = logging.INFO
+# Формат строк файла лога: простые поля ключ=значение без цветовых кодов
+LOG_FILE_FORMAT = "%(asctime)s level=%(levelname)s process=%(processName)s thread=%(threadName)s msg=%(message)s"
+
+
+# Логирование дочерних процессов: {'handlers': обработчики setup_logging,
+#                                   'queues': {способ запуска процессов: (межпроцессная очередь, фоновый обработчик)}}
+_child_logging = {}
+_child_logging_lock = threading.Lock()
+
+
+def setup_logging(log_file=LOG_FILE, level=LOG_LEVEL):
+    """
+    Настраивает асинхронное логирование: вызывающий код только кладет запись в очередь,
+    запись в файл и вывод в консоль выполняет фоновый поток.
+    Очередь работает внутри процесса и не сериализует записи. Дочерние процессы (spawn и fork)
+    не пишут в неё: они настраивают логирование через init_child_logging с параметрами child_logging
+
+    Возвращает:
+        logging.handlers.QueueListener: Фоновый обработчик, останавливается автоматически при выходе
+    """
+    import atexit
+    import queue
+    from logging.handlers import QueueHandler, QueueListener
+    from colorama import init, Fore, Style
+    init(autoreset=True)  # Важно для Windows
+
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter(LOG_FILE_FORMAT))
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(
+        Fore.CYAN + "%(asctime)s - %(levelname)s - %(message)s" + Style.RESET_ALL))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))  # Оформление строки делают обработчики слушателя
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    logging.basicConfig(level=level, handlers=[queue_handler], force=True)
+    listener.start()
+    with _child_logging_lock:
+        _child_logging.clear()
+        _child_logging['handlers'] = (file_handler, console_handler)
+
+    def stop_listener():
+        children = [child for _, child in _child_logging.get('queues', {}).values()]
+        for running in [listener] + children:
+            try:
+                running.stop()
+            except AttributeError:
+                pass  # Уже остановлен вручную
+
+    atexit.register(stop_listener)
+    return listener
+
+
+def child_logging(context=None):
+    """
+    Параметры логирования дочерних процессов для init_child_logging: межпроцессная очередь и уровень.
+    Очередь создаётся при первом обращении для способа запуска процессов context (по умолчанию - способ
+    multiprocessing по умолчанию), её записи выводит отдельный фоновый поток с обработчиками setup_logging.
+    Без setup_logging очереди нет, дочерние процессы логируют по умолчанию
+
+    Возвращает:
+        tuple: (очередь или None, уровень логирования)
+    """
+    import multiprocessing
+    from logging.handlers import QueueListener
+    context = context or multiprocessing.get_context()
+    level = logging.getLogger().level
+    with _child_logging_lock:
+        handlers = _child_logging.get('handlers')
+        if handlers is None:
+            return None, level
+        queues = _child_logging.setdefault('queues', {})
+        method = context.get_start_method()
+        if method not in queues:
+            log_queue = context.Queue(-1)
+            listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+            listener.start()
+            queues[method] = (log_queue, listener)
+        return queues[method][0], level
+
+
+def init_child_logging(log_queue, level=LOG_LEVEL):
+    """Настраивает логирование дочернего процесса: записи передаются родителю через очередь child_logging"""
+    if log_queue is None:
+        return
+    from logging.handlers import QueueHandler
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))
+    logging.basicConfig(level=level, handlers=[queue_handler], force=True)
+
+# Настройки планировщика загрузки файлов
+MAX_WORKERS = 4  # Количество потоков для загрузки файлов
+BATCH_WORKERS = 2  # Сколько папок обрабатывается одновременно при пакетной обработке (python main.py --batch)
+COST_MODEL_FILE = 'output/cost_model.json'  # Модель стоимости загрузки, уточняется по прошлым запускам
+SMALL_TASK_COST = 0.5  # Файлы с оценкой меньше (сек) объединяются в общие задачи
+BATCH_TARGET_COST = 2.0  # Желаемая оценка (сек) одной объединённой задачи
+
+# Бюджет загрузки одного файла. Если задан хотя бы один лимит, файл загружается в отдельном процессе,
+# который принудительно завершается при превышении
+LOAD_TIMEOUT_SEC = None  # Ограничение времени загрузки (сек), None - без ограничения
+LOAD_MEMORY_LIMIT_MB = None  # Ограничение памяти процесса загрузки (МБ), None - без ограничения
+
+# Контрольные точки этапов конвейера для продолжения прерванного запуска
+CHECKPOINTS_ENABLED = True
+CHECKPOINT_DIR = 'checkpoints'  # Папка контрольных точек внутри папки результата, у каждой папки результата свои точки
+
+# Режим постоянно работающего процесса (python main.py --daemon)
+DAEMON_HOST = '127.0.0.1'  # Сервер доступен только локально
+DAEMON_PORT = 8765
+DAEMON_POLL_SEC = 5  # Период проверки папки с данными на изменения (сек)
+
+# Режим обработки данных, не помещающихся в память
+OUT_OF_CORE = False
+MEMORY_BUDGET_MB = 4096  # Бюджет памяти на обработку одной группы разделов (МБ)
+OUT_OF_CORE_MEMORY_FACTOR = 6  # Во сколько раз пиковая память обработки больше данных раздела
+SPILL_PARTITIONS = 64  # На сколько разделов по хешу номера ПУ делятся источники
+SPILL_DIR = 'output/spill'
+
+# Параллельное удаление дублей и выбор лучших показаний по разделам (по хешу номера ПУ)
+PARALLEL_WORKERS = 1  # Число процессов, 1 - обработка в одном процессе
+PARALLEL_PARTITIONS_PER_WORKER = 4  # Разделов на процесс для равномерной загрузки
+
+# Параллельный разбор одного большого файла (xlsx или CSV) по частям
+INTRA_FILE_WORKERS = 1  # Процессов на один файл, 1 - файл разбирается целиком в одном процессе
+INTRA_FILE_MIN_MB = 20  # Файлы меньше этого размера разбираются целиком
+INTRA_FILE_BLOCK_MB = 8  # Примерный размер блока XML листа для одного процесса
+
+# Потоковое удаление дублей при чтении файла: в памяти остаётся по одной строке на ПУ
+STREAM_REDUCE = False
+STREAM_CHUNK_ROWS = 100000  # Строк в одной порции чтения
+
+# Движок чтения книг Excel: None - самый быстрый из установленных по замерам (python main.py --benchmark-readers),
+# или явно 'calamine', 'openpyxl', 'pyxlsb'. Разбор по частям (INTRA_FILE_WORKERS) всегда использует openpyxl.
+# calamine (python-calamine) и pyxlsb не входят в requirements.txt, они перечислены в requirements-optional.txt:
+# без них выбирается только openpyxl, а книги .xlsb не читаются
+EXCEL_BACKEND = None
+READER_BENCHMARK_FILE = 'output/reader_benchmark.json'
+
+# Определение формата файла по строкам заголовка, при неудаче - по имени файла
+SNIFF_FORMATS = True
+
+# Реестр ПУ: сведения о ПУ хранятся между запусками, конвейер обрабатывает только столбцы с показаниями
+METER_REGISTRY = True
+METER_REGISTRY_FILE = 'meter_registry.pkl'  # Файл реестра внутри папки результата, у каждой папки результата свой реестр
+
+# Даты, на которые выбираются лучшие показания, например ['2025-04-30', '2025-05-31'].
+# None - текущий месяц. Для нескольких дат каждый отчётный период получает свой набор столбцов
+AS_OF_DATES = None
+
+# Режим копирования при записи pandas (copy-on-write): промежуточные таблицы конвейера
+# не копируют данные, пока их не изменяют
+COPY_ON_WRITE = True
+
+# Проверка показаний: флаги лучших показаний в результате и сводка по источникам в логе
+VALIDATION = True
+VALIDATION_SUM_TOLERANCE = 0.05  # Допустимое расхождение День + Ночь и Общий (показания тарифов округляются), а также убывания показаний
+
+# Вид результата: 'wide' - показания всех источников столбцами справа от лучших (пять столбцов на источник),
+# 'long' - таблица лучших показаний и отдельная таблица всех показаний, строка на ПУ и источник
+OUTPUT_LAYOUT = 'wide'
+EXCEL_MAX_ROWS = 1048575  # Строк данных на листе Excel (без заголовка), таблица показаний больше сохраняется в CSV
+EXCEL_WRITE_CHUNK_ROWS = 10000  # Строк в одной порции записи Excel, разреженные столбцы уплотняются по порциям
+
+# Источники в результате: False - имена файлов, True - коды из таблицы источников (файл Sources)
+SOURCE_CODES = False
+
+# Файл изменений относительно прошлого запуска: новые, изменённые и удалённые лучшие показания.
+# Лучшие показания запуска сохраняются в DELTA_STATE_FILE для сравнения при следующем запуске
+DELTA_OUTPUT = False
+DELTA_STATE_FILE = 'last_best.pkl'  # Файл внутри папки результата, у каждой папки результата свой прошлый запуск
+
+# План запуска без загрузки данных (python main.py --dry-run)
+PLAN_SAMPLE_BYTES = 256 * 2 ** 10  # Сколько читать из начала листа или файла CSV для оценки строк и номеров ПУ
+PLAN_COMPRESSION_RATIO = 5  # Во сколько раз данные больше сжатого файла, если размер без сжатия неизвестен
+PLAN_XLSB_BYTES_PER_ROW = 100  # Байт файла xlsb на строку (начало xlsb не читается)
+PLAN_XLSX_BYTES_PER_ROW = 60  # Байт файла xlsx на строку (начало сжатой или лежащей в архиве книги не читается)
+
+# Обработка несколькими машинами через общую папку (python main.py --submit ПАПКА, python main.py --worker ПАПКА)
+LEASE_TIMEOUT_SEC = 300  # Аренда задачи без продления дольше этого срока считается брошенной (сек)
+LEASE_HEARTBEAT_SEC = 30  # Период продления аренды выполняемой задачи (сек)
+QUEUE_POLL_SEC = 2  # Период проверки очереди, когда свободных задач нет (сек)
+TASK_MAX_ATTEMPTS = 3  # Попыток выполнить задачу, после неудачи всех попыток задание прекращается
@@ -0,0 +1,288 @@
+"""
+daemon.py
+Режим постоянно работающего процесса: разобранные и очищенные от дублей источники
+и лучшие показания хранятся в памяти, папка с данными отслеживается на изменения,
+пересборка запускается автоматически или через локальный HTTP-запрос.
+При пересборке заново разбираются и пересчитываются только новые и изменённые данные
+
+Запросы:
+    GET  /status   - состояние процесса в формате JSON
+    POST /rebuild  - запустить пересборку
+"""
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from core.config import *
+from core.archives import source_stat
+from core.processor import (find_all_files, delete_duplicates, prepare_best_columns, add_best_readings,
+                            source_names, source_candidates, best_readings_by_period, add_additional_readings,
+                            long_readings, as_of_periods, period_best_columns)
+from core.output import output_tables, save_output
+from core.validator import validate
+from core.delta import write_delta
+
+
+def folder_snapshot(files):
+    """Снимок состояния файлов: {путь: (размер, время изменения)}, для файла в архиве - состояние архива"""
+    snapshot = {}
+    for name in files:
+        stat = source_stat(name)
+        if stat is not None:
+            snapshot[name] = stat
+    return snapshot
+
+
+class WarmState:
+    """
+    Состояние конвейера, которое сохраняется между пересборками
+
+    Параметры:
+        folder (str): Папка с входными файлами
+        load_sources (callable): Функция загрузки списка файлов в папку результата output_folder,
+                                 возвращающая {имя_файла: [df, формат]} (см. main.load_sources)
+        output_folder (str): Папка для результатов
+        as_of_dates (list): Даты, на которые выбираются лучшие показания, None - сегодня (как в main)
+        layout (str): Вид результата, 'wide' или 'long' (как в main)
+        delta (bool): Записывать ли после каждой пересборки файл изменений лучших показаний (как в main)
+    """
+
+    def __init__(self, folder, load_sources, output_folder='output', as_of_dates=AS_OF_DATES, layout=OUTPUT_LAYOUT,
+                 delta=DELTA_OUTPUT):
+        self.folder = folder
+        self.load_sources = load_sources
+        self.output_folder = output_folder
+        self.as_of_dates = as_of_dates
+        self.layout = layout
+        self.delta = delta
+        self.snapshot = {}
+        self.sources = {}
+        self.main_table = None
+        self.best_table = None
+        self.periods = None
+        self.lock = threading.Lock()
+        self.status = {
+            'state': 'idle',
+            'builds': 0,
+            'last_build': None,
+            'last_duration_sec': None,
+            'last_changed_files': [],
+            'last_result': None,
+            'last_error': None,
+        }
+
+    def has_changes(self):
+        """Проверяет, изменилось ли содержимое папки с данными после последней пересборки"""
+        return folder_snapshot(find_all_files(self.folder)) != self.snapshot
+
+    def rebuild(self):
+        """
+        Пересобирает результат. Разбираются только новые и изменённые файлы,
+        лучшие показания пересчитываются только для ПУ из этих файлов
+
+        Возвращает:
+            str: Путь к сохраненному файлу результата или None, если сохранять нечего
+        """
+        with self.lock:
+            self.status['state'] = 'building'
+            start = time.perf_counter()
+            try:
+                return self._rebuild()
+            except Exception as e:
+                self.status['last_error'] = str(e)
+                logging.error(f"Ошибка пересборки: {e}", exc_info=True)
+                raise
+            finally:
+                self.status['state'] = 'idle'
+                self.status['builds'] += 1
+                self.status['last_build'] = pd.Timestamp.now().isoformat()
+                self.status['last_duration_sec'] = round(time.perf_counter() - start, 3)
+
+    def _rebuild(self):
+        files = find_all_files(self.folder)
+        snapshot = folder_snapshot(files)
+        changed = [name for name in files if snapshot.get(name) != self.snapshot.get(name)]
+        removed = [name for name in self.snapshot if name not in snapshot]
+        self.status['last_changed_files'] = changed + removed
+        logging.info(f"Пересборка: изменено {len(changed)} файлов, удалено {len(removed)}")
+
+        # Разбираем только новые и изменённые файлы, остальные берём из памяти
+        loaded = self.load_sources(changed, output_folder=self.output_folder) if changed else {}
+        # Изменённые и удалённые источники уже учтены в таблицах, их нельзя обновить дозагрузкой
+        stale = [name for name in changed if name in self.sources] + removed
+        for name in stale:
+            self.sources.pop(name, None)
+        self.sources.update(loaded)
+        # Порядок источников совпадает с порядком обнаружения файлов, как при обычном запуске
+        self.sources = {name: self.sources[name] for name in files if name in self.sources}
+        self.snapshot = snapshot
+
+        if not self.sources:
+            logging.info("Нет данных для обработки - все файлы не загрузились")
+            self.main_table = self.best_table = None
+            return None
+
+        # Без дат отчёта период - текущий месяц, при смене месяца лучшие показания пересчитываются полностью
+        periods = as_of_periods(self.as_of_dates)
+        incremental = (self.best_table is not None and not stale and periods == self.periods)
+
+        if incremental and not loaded:
+            if self.status['last_result'] is not None:
+                logging.info("Данные не изменились, пересборка не требуется")
+                return self.status['last_result']
+        elif incremental:
+            new_tables = [df for df, _ in loaded.values()]
+            self.main_table = delete_duplicates(pd.concat([self.main_table] + new_tables, ignore_index=True))
+            self.best_table = update_best_readings(self.best_table, self.main_table, self.sources, loaded, periods)
+        else:
+            all_tables = [df for df, _ in self.sources.values()]
+            self.main_table = delete_duplicates(pd.concat(all_tables, ignore_index=True))
+            self.best_table = add_best_readings(self.main_table, self.sources, self.as_of_dates)
+        self.periods = periods
+
+        # При layout = 'long' показания источников сохраняются отдельной таблицей
+        readings = None
+        if self.layout == 'long':
+            result, readings = self.best_table, long_readings(self.sources, COLS_KP)
+        else:
+            result = add_additional_readings(self.best_table, self.sources, COLS_KP)
+        if VALIDATION:
+            result, _ = validate(result, self.sources, self.as_of_dates)
+        tables = output_tables(result, self.sources, readings)
+        path = save_output(tables, output_folder=self.output_folder)
+        if self.delta:
+            write_delta(tables['Result'], periods, output_folder=self.output_folder)
+        self.status['last_result'] = path
+        self.status['last_error'] = None
+        return path
+
+    def status_report(self):
+        """Состояние процесса для запроса /status"""
+        report = dict(self.status)
+        report['folder'] = self.folder
+        report['sources'] = len(self.sources)
+        report['meters'] = 0 if self.main_table is None else len(self.main_table)
+        return report
+
+
+def update_best_readings(best_table, main_table, date_of_files, new_sources, periods):
+    """
+    Обновляет лучшие показания после добавления новых источников.
+    Для ПУ, которых нет в новых источниках, лучшие показания не меняются и берутся из best_table
+
+    Параметры:
+        best_table (pd.DataFrame): Результат add_best_readings до добавления источников
+        main_table (pd.DataFrame): Основная таблица ПУ после добавления источников
+        date_of_files (dict): Все источники {имя_файла: [df, формат]}
+        new_sources (dict): Добавленные источники {имя_файла: [df, формат]}
+        periods (list): Отчётные периоды (месяц, год), те же, что у best_table (см. as_of_periods)
+
+    Возвращает:
+        pd.DataFrame: Таблица того же вида, что и add_best_readings(main_table, date_of_files, as_of_dates)
+    """
+    result_table, best_columns = prepare_best_columns(main_table, periods)
+
+    previous = best_table.drop_duplicates(subset=['Номер ПУ']).set_index('Номер ПУ')[best_columns]
+    affected = set()
+    for data, _ in new_sources.values():
+        if 'Номер ПУ' in data.columns:
+            affected.update(data['Номер ПУ'])
+    affected.update(set(result_table['Номер ПУ']) - set(previous.index))
+    logging.info(f"Пересчёт лучших показаний для {len(affected)} приборов учета")
+
+    meters = result_table['Номер ПУ']
+    updated = meters[meters.isin(affected)].unique()
+    kept = previous[~previous.index.isin(updated)]
+    best_by_period = best_readings_by_period(updated, source_candidates(date_of_files), periods)
+    for period, columns in zip(periods, period_best_columns(periods)):
+        best = pd.concat([kept[columns], best_by_period[period].set_axis(columns, axis=1)]).reindex(meters)
+        # Список источников изменился, коды источников прежних лучших показаний пересчитываются
+        best[columns[-2]] = pd.Categorical(best[columns[-2]], categories=source_names(date_of_files))
+        for col in columns:
+            result_table[col] = best[col].array
+
+    cols_order = best_columns + [col for col in result_table.columns if col not in best_columns]
+    return result_table[cols_order]
+
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик локальных HTTP-запросов к процессу"""
+    state = None
+    rebuild_event = None
+
+    def _send_json(self, code, data):
+        body = json.dumps(data, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/status':
+            self._send_json(200, self.state.status_report())
+        else:
+            self._send_json(404, {'error': 'unknown path'})
+
+    def do_POST(self):
+        if self.path == '/rebuild':
+            self.rebuild_event.set()
+            self._send_json(202, {'accepted': True})
+        else:
+            self._send_json(404, {'error': 'unknown path'})
+
+    def log_message(self, format, *args):
+        logging.debug("HTTP: " + format, *args)
+
+
+def make_server(state, rebuild_event, host=DAEMON_HOST, port=DAEMON_PORT):
+    """Создаёт HTTP-сервер, привязанный к состоянию процесса"""
+    handler = type('BoundDaemonRequestHandler', (DaemonRequestHandler,),
+                   {'state': state, 'rebuild_event': rebuild_event})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def run_daemon(load_sources, folder=PATH_TO_DATA, host=DAEMON_HOST, port=DAEMON_PORT,
+               poll_interval=DAEMON_POLL_SEC, stop_event=None, as_of_dates=AS_OF_DATES, layout=OUTPUT_LAYOUT,
+               delta=DELTA_OUTPUT):
+    """
+    Запускает постоянно работающий процесс: первая сборка, затем пересборка
+    при изменении папки с данными или по запросу POST /rebuild
+
+    Параметры:
+        load_sources (callable): Функция загрузки списка файлов (main.load_sources)
+        folder (str): Папка с входными файлами
+        host (str), port (int): Адрес локального HTTP-сервера
+        poll_interval (float): Период проверки папки с данными в секундах
+        stop_event (threading.Event): Событие остановки, по умолчанию работа до прерывания
+        as_of_dates (list): Даты, на которые выбираются лучшие показания, None - сегодня
+        layout (str): Вид результата, 'wide' или 'long'
+        delta (bool): Записывать ли файл изменений лучших показаний после каждой пересборки
+    """
+    state = WarmState(folder, load_sources, as_of_dates=as_of_dates, layout=layout, delta=delta)
+    rebuild_event = threading.Event()
+    rebuild_event.set()
+    stop_event = stop_event or threading.Event()
+
+    server = make_server(state, rebuild_event, host, port)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    logging.info(f"Процесс запущен: http://{host}:{server.server_address[1]}/status, папка {folder}")
+
+    try:
+        while not stop_event.is_set():
+            if rebuild_event.wait(poll_interval) or state.has_changes():
+                rebuild_event.clear()
+                try:
+                    state.rebuild()
+                except Exception:
+                    pass  # Ошибка уже записана в состояние, процесс продолжает работу
+    except KeyboardInterrupt:
+        logging.info("Процесс остановлен")
+    finally:
+        server.shutdown()
+        server.server_close()
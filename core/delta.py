@@ -0,0 +1,293 @@
+"""
+delta.py
+Изменения результата относительно прошлого запуска. Лучшие показания каждого запуска сохраняются
+в небольшой файл в папке результата, следующий запуск сравнивает с ним свои лучшие показания
+по номеру ПУ и записывает только новые, изменённые и удалённые ПУ.
+Файл хранит лучшие показания по разделам номеров ПУ (см. meter_partition): при обработке по разделам
+каждый раздел сравнивается с тем же разделом прошлого запуска, вся таблица в памяти не собирается
+"""
+import logging
+import os
+import pickle
+import shutil
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from core.config import *
+from core.processor import period_best_columns, save_to_excel, meter_partition
+from core.outofcore import write_excel_stream
+
+# Состояние ПУ в таблице изменений
+STATUS_NEW = 'Новый'
+STATUS_CHANGED = 'Изменён'
+STATUS_REMOVED = 'Удалён'
+
+# Файл лучших показаний прошлого запуска для папки результата по умолчанию
+DEFAULT_DELTA_STATE_PATH = os.path.join('output', DELTA_STATE_FILE)
+
+
+def best_snapshot(result, periods=None):
+    """
+    Лучшие показания результата для сравнения со следующим запуском: номер ПУ, столбцы лучших показаний
+    и флагов проверки всех периодов. Источники хранятся именами файлов - коды источников
+    в разных запусках не совпадают
+
+    Возвращает:
+        pd.DataFrame: Таблица с индексом по номеру ПУ, по строке на ПУ
+    """
+    columns = []
+    for best_columns in period_best_columns(periods or [None]):
+        flags = best_columns[-1].replace('Примечание', 'Флаги')
+        columns += [col for col in best_columns + [flags] if col in result.columns]
+    snapshot = result.drop_duplicates(subset=['Номер ПУ']).set_index('Номер ПУ')[columns]
+    categorical = [col for col in columns if isinstance(snapshot[col].dtype, pd.CategoricalDtype)]
+    return snapshot.astype({col: object for col in categorical})
+
+
+def split_snapshot(snapshot, n_partitions=SPILL_PARTITIONS):
+    """Лучшие показания по разделам номеров ПУ: список из n_partitions таблиц"""
+    partitions = meter_partition(snapshot.index, n_partitions)
+    return [snapshot[partitions == partition] for partition in range(n_partitions)]
+
+
+def concat_parts(parts):
+    """Склеивает разделы лучших показаний, пустые разделы не влияют на типы столбцов"""
+    return pd.concat([part for part in parts if len(part)] or parts[:1])
+
+
+def iter_snapshot_parts(path, n_partitions=SPILL_PARTITIONS):
+    """
+    Читает разделы лучших показаний прошлого запуска по одному. Файл прошлых версий (вся таблица одним объектом)
+    и файл с другим числом разделов разбиваются на разделы заново
+
+    Возвращает:
+        generator: n_partitions таблиц по порядку разделов
+    """
+    with open(path, 'rb') as f:
+        stored = pickle.load(f)
+        if not isinstance(stored, pd.DataFrame):
+            if stored == n_partitions:
+                for _ in range(n_partitions):
+                    yield pickle.load(f)
+                return
+            stored = concat_parts([pickle.load(f) for _ in range(stored)])
+    yield from split_snapshot(stored, n_partitions)
+
+
+def load_snapshot(path=DEFAULT_DELTA_STATE_PATH):
+    """Лучшие показания прошлого запуска или None, если файла нет или он повреждён"""
+    if not os.path.exists(path):
+        return None
+    try:
+        return concat_parts(list(iter_snapshot_parts(path)))
+    except Exception as e:
+        logging.warning(f"Файл прошлого запуска {path} повреждён, изменения не вычисляются: {e}")
+        return None
+
+
+def save_snapshot(snapshot, path=DEFAULT_DELTA_STATE_PATH):
+    """
+    Сохраняет лучшие показания запуска по разделам номеров ПУ.
+    Запись атомарная: сначала во временный файл, затем переименование
+    """
+    save_snapshot_parts(split_snapshot(snapshot), path)
+
+
+def save_snapshot_parts(parts, path=DEFAULT_DELTA_STATE_PATH, n_partitions=SPILL_PARTITIONS):
+    """
+    Сохраняет лучшие показания запуска, заданные разделами (n_partitions таблиц по порядку разделов):
+    число разделов, затем таблицы разделов. Разделы из генератора записываются по мере получения
+    """
+    try:
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(n_partitions, f, protocol=pickle.HIGHEST_PROTOCOL)
+            for part in parts:
+                pickle.dump(part, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logging.warning(f"Не удалось сохранить лучшие показания запуска: {e}")
+
+
+def changed_rows(current, previous):
+    """
+    Признак изменения строки: хотя бы в одном столбце значения различаются. Пустые значения равны друг другу
+
+    Параметры:
+        current, previous (pd.DataFrame): Таблицы с одинаковыми индексом и столбцами
+    """
+    changed = np.zeros(len(current), dtype=bool)
+    for col in current.columns:
+        new, old = current[col], previous[col]
+        if new.dtype != old.dtype and not (pd.api.types.is_numeric_dtype(new) and pd.api.types.is_numeric_dtype(old)):
+            new, old = new.astype(object), old.astype(object)
+        both_empty = (new.isna() & old.isna()).to_numpy()
+        changed |= ~(new.eq(old).to_numpy() | both_empty)
+    return changed
+
+
+def diff_best(current, previous):
+    """
+    Новые, изменённые и удалённые ПУ по сравнению с прошлым запуском.
+    Столбцы, которых нет в одной из таблиц (например, после смены отчётных периодов), не сравниваются
+
+    Параметры:
+        current (pd.DataFrame): Результат best_snapshot этого запуска
+        previous (pd.DataFrame): Результат best_snapshot прошлого запуска
+
+    Возвращает:
+        pd.DataFrame: Столбцы 'Статус', 'Номер ПУ' и столбцы лучших показаний. Для удалённых ПУ - прошлые показания
+    """
+    common_columns = [col for col in current.columns if col in previous.columns]
+    # Одно сопоставление номеров ПУ: позиция строки прошлого запуска для каждой строки этого, -1 - ПУ новый
+    positions = previous.index.get_indexer(current.index)
+    known = np.flatnonzero(positions >= 0)
+    changed = known[changed_rows(current[common_columns].iloc[known],
+                                 previous[common_columns].iloc[positions[known]].set_axis(current.index[known]))]
+
+    status = np.full(len(current), STATUS_NEW, dtype=object)
+    status[changed] = STATUS_CHANGED
+    keep = positions < 0
+    keep[changed] = True
+    delta = current[keep].assign(**{'Статус': status[keep]})
+    gone = np.ones(len(previous), dtype=bool)
+    gone[positions[known]] = False
+    removed = previous[gone].assign(**{'Статус': STATUS_REMOVED})
+
+    delta = pd.concat([table for table in (delta, removed) if len(table)] or [delta])
+    delta = delta.rename_axis('Номер ПУ').reset_index()
+    columns = ['Статус', 'Номер ПУ'] + [col for col in delta.columns if col not in ('Статус', 'Номер ПУ')]
+    return delta[columns]
+
+
+def write_delta(result, periods=None, output_folder='output', state_path=None):
+    """
+    Сравнивает лучшие показания результата с прошлым запуском, записывает таблицу изменений
+    и сохраняет лучшие показания для следующего запуска. При первом запуске таблица изменений не пишется.
+    Прошлый запуск хранится в state_path, по умолчанию - в файле DELTA_STATE_FILE папки результата
+
+    Возвращает:
+        str: Путь к файлу изменений или None, если прошлого запуска нет или изменений нет
+    """
+    return write_snapshot_delta(best_snapshot(result, periods), output_folder, state_path)
+
+
+def write_snapshot_delta(current, output_folder='output', state_path=None):
+    """
+    То же, что write_delta, для готовых лучших показаний (результат best_snapshot).
+    При обработке по разделам лучшие показания частей сравниваются по разделам (см. SnapshotSpill)
+
+    Возвращает:
+        str: Путь к файлу изменений или None, если прошлого запуска нет или изменений нет
+    """
+    state_path = state_path or os.path.join(output_folder, DELTA_STATE_FILE)
+    previous = load_snapshot(state_path)
+    path = None
+    if previous is None:
+        logging.info("Прошлого запуска нет, изменения будут вычислены при следующем запуске")
+    else:
+        delta = diff_best(current, previous)
+        counts = delta['Статус'].value_counts()
+        logging.info(f"Изменения относительно прошлого запуска: новых {counts.get(STATUS_NEW, 0)}, "
+                     f"изменённых {counts.get(STATUS_CHANGED, 0)}, удалённых {counts.get(STATUS_REMOVED, 0)}")
+        if len(delta):
+            path = save_to_excel(delta, 'Delta', output_folder=output_folder)
+    save_snapshot(current, state_path)
+    return path
+
+
+class SnapshotSpill:
+    """
+    Лучшие показания частей результата при обработке по разделам (см. best_snapshot), сброшенные на диск
+    по разделам номеров ПУ. Файл изменений вычисляется по разделу за раз: в памяти одновременно
+    один раздел этого и прошлого запуска
+
+    Параметры:
+        folder (str): Папка для разделов, очищается при создании
+        n_partitions (int): Число разделов, как в файле прошлого запуска
+    """
+
+    def __init__(self, folder, n_partitions=SPILL_PARTITIONS):
+        self.folder = folder
+        self.n_partitions = n_partitions
+        self.columns = None
+        self.pieces = 0
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder, exist_ok=True)
+
+    def _partition_path(self, partition):
+        return os.path.join(self.folder, f'best-{partition:04d}.pkl')
+
+    def add(self, snapshot):
+        """Раскладывает лучшие показания части результата по разделам, части раздела дописываются в его файл"""
+        if self.columns is None:
+            self.columns = snapshot.columns
+        partitions = meter_partition(snapshot.index, self.n_partitions)
+        for partition, piece in snapshot.groupby(partitions, sort=False):
+            with open(self._partition_path(int(partition)), 'ab') as f:
+                pickle.dump(piece, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.pieces += 1
+
+    def partition(self, partition):
+        """Лучшие показания раздела этого запуска"""
+        pieces = []
+        path = self._partition_path(partition)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                while True:
+                    try:
+                        pieces.append(pickle.load(f))
+                    except EOFError:
+                        break
+        if not pieces:
+            return pd.DataFrame(columns=self.columns, index=pd.Index([], name='Номер ПУ'))
+        return concat_parts(pieces)
+
+    def write_delta(self, output_folder='output', state_path=None):
+        """
+        То же, что write_snapshot_delta, для лучших показаний всех частей. Таблица изменений
+        дописывается в файл по разделам, затем сохраняются лучшие показания запуска
+
+        Возвращает:
+            str: Путь к файлу изменений или None, если прошлого запуска нет или изменений нет
+        """
+        if not self.pieces:
+            return None
+        state_path = state_path or os.path.join(output_folder, DELTA_STATE_FILE)
+        counts = Counter()
+
+        def deltas():
+            previous = iter_snapshot_parts(state_path, self.n_partitions)
+            for partition in range(self.n_partitions):
+                try:
+                    old = next(previous)
+                except Exception as e:
+                    logging.warning(f"Файл прошлого запуска {state_path} повреждён, изменения не вычисляются: {e}")
+                    return
+                current = self.partition(partition)
+                delta = diff_best(current, old)
+                counts.update(delta['Статус'])
+                if len(delta):
+                    # Столбцы одинаковы во всех разделах, в том числе без удалённых ПУ
+                    yield delta.reindex(columns=['Статус', 'Номер ПУ'] + list(current.columns)
+                                        + [col for col in old.columns if col not in current.columns])
+
+        path = None
+        if not os.path.exists(state_path):
+            logging.info("Прошлого запуска нет, изменения будут вычислены при следующем запуске")
+        else:
+            path = write_excel_stream(deltas(), 'Delta', output_folder=output_folder)
+            logging.info(f"Изменения относительно прошлого запуска: новых {counts[STATUS_NEW]}, "
+                         f"изменённых {counts[STATUS_CHANGED]}, удалённых {counts[STATUS_REMOVED]}")
+        save_snapshot_parts((self.partition(partition) for partition in range(self.n_partitions)), state_path,
+                            self.n_partitions)
+        return path
+
+    def cleanup(self):
+        """Удаляет разделы с диска"""
+        shutil.rmtree(self.folder, ignore_errors=True)
@@ -0,0 +1,400 @@
+"""
+distributed.py
+Распределённая обработка несколькими процессами или машинами через общую папку, без брокера сообщений.
+Задание (python main.py --submit ОЧЕРЕДЬ) делится на задачи: разбор каждого файла, обработка каждого
+раздела номеров ПУ (по хешу, как в режиме OUT_OF_CORE) и сборка результата. Обработчики
+(python main.py --worker ОЧЕРЕДЬ) на любом числе машин забирают задачи, создавая файл аренды
+с флагом O_EXCL - файл создаёт только один из них. Аренда продлевается обновлением времени изменения файла,
+аренду без продления дольше LEASE_TIMEOUT_SEC забирает другой обработчик. Разобранные источники
+и части результата записываются в папку очереди, последний этап собирает результат в файл Excel
+
+Папка очереди:
+    job.json        - задание: файлы, даты лучших показаний, вид результата, файл изменений,
+                      число разделов, папка результата
+    leases/         - файлы аренды задач
+    done/           - отметки о выполненных задачах
+    failed/         - неудачные попытки задач
+    sources/        - сведения о разобранных источниках
+    parts/          - разобранные источники по разделам (SpillStore)
+    results/        - части результата по разделам
+    readings/       - части таблицы показаний при сборке результата (layout='long')
+"""
+import json
+import logging
+import os
+import pickle
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+
+from core.config import *
+from core.delta import best_snapshot, SnapshotSpill
+from core.formats import find_all_files
+from core.loader import process_file
+from core.outofcore import SpillStore, process_unit, write_tables_stream
+from core.output import source_table
+from core.processor import as_of_periods
+from core.validator import combine_summaries, log_summary
+
+# Задача сборки результата, выполняется после обработки всех разделов
+REDUCE_TASK = 'reduce'
+
+
+def worker_name():
+    """Имя обработчика: машина и номер процесса"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _queue_path(queue_dir, *parts):
+    return os.path.join(queue_dir, *parts)
+
+
+def _write_atomic(path, data, binary=True):
+    """Записывает файл целиком: сначала во временный файл, затем переименование"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{worker_name()}.tmp"
+    with open(tmp_path, 'wb' if binary else 'w', **({} if binary else {'encoding': 'utf-8'})) as f:
+        if binary:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def submit_job(queue_dir, data_folder=PATH_TO_DATA, as_of_dates=None, output_folder='output',
+               n_partitions=SPILL_PARTITIONS, layout=OUTPUT_LAYOUT, delta=DELTA_OUTPUT):
+    """
+    Создаёт задание в папке очереди. Пути записываются абсолютными: на всех машинах
+    общая папка должна быть подключена по одному и тому же пути.
+    Вид результата layout и файл изменений delta - как в main
+
+    Возвращает:
+        dict: Задание или None, если в папке очереди уже есть задание
+    """
+    path = _queue_path(queue_dir, 'job.json')
+    if os.path.exists(path):
+        logging.warning(f"В папке {queue_dir} уже есть задание")
+        return None
+    job = {
+        'files': [os.path.abspath(name) for name in find_all_files(data_folder)],
+        'as_of_dates': list(as_of_dates) if as_of_dates else None,
+        'layout': layout,
+        'delta': bool(delta),
+        'partitions': n_partitions,
+        'output_folder': os.path.abspath(output_folder),
+    }
+    for folder in ('leases', 'done', 'failed', 'sources', 'parts', 'results'):
+        os.makedirs(_queue_path(queue_dir, folder), exist_ok=True)
+    _write_atomic(path, job, binary=False)
+    logging.info(f"Задание создано: файлов {len(job['files'])}, разделов {n_partitions}, очередь {queue_dir}")
+    return job
+
+
+def load_job(queue_dir):
+    """Задание из папки очереди"""
+    with open(_queue_path(queue_dir, 'job.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def job_phases(job):
+    """
+    Задачи задания по этапам: задачи этапа начинаются, когда выполнены все задачи предыдущего
+
+    Возвращает:
+        list: [[задачи разбора файлов], [задачи обработки разделов], [сборка результата]]
+    """
+    return [[f'parse-{index:05d}' for index in range(len(job['files']))],
+            [f'part-{partition:04d}' for partition in range(job['partitions'])],
+            [REDUCE_TASK]]
+
+
+def is_done(queue_dir, task):
+    return os.path.exists(_queue_path(queue_dir, 'done', task))
+
+
+def failed_attempts(queue_dir, task):
+    """Число неудачных попыток задачи"""
+    try:
+        with open(_queue_path(queue_dir, 'failed', task), encoding='utf-8') as f:
+            return sum(1 for _ in f)
+    except OSError:
+        return 0
+
+
+def read_lease(queue_dir, task):
+    """Метка владельца аренды задачи или None, если аренды нет"""
+    try:
+        with open(_queue_path(queue_dir, 'leases', task + '.lease'), encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def try_lease(queue_dir, task, worker, timeout=LEASE_TIMEOUT_SEC):
+    """
+    Пытается взять задачу в аренду. Файл аренды создаётся с флагом O_EXCL, поэтому из нескольких
+    обработчиков задачу получает один; в файл записывается уникальная метка аренды.
+    Аренду, которая не продлевалась дольше timeout, можно забрать: файл переименовывается
+    в файл этого обработчика, и если после переименования он оказался свежим (его уже забрал
+    и создал заново другой обработчик), файл возвращается на место
+
+    Возвращает:
+        str: Метка аренды или None, если задача не взята
+    """
+    path = _queue_path(queue_dir, 'leases', task + '.lease')
+    token = f"{worker}:{uuid.uuid4().hex}"
+    for attempt in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                expired = time.time() - os.path.getmtime(path) > timeout
+            except OSError:
+                # Аренду только что освободили
+                continue
+            if not expired or attempt:
+                return None
+            stale_path = f"{path}.{token}.stale"
+            try:
+                os.rename(path, stale_path)
+            except OSError:
+                return None
+            # Переименование сохраняет время изменения: проверяется тот файл, который переименован
+            if time.time() - os.path.getmtime(stale_path) <= timeout:
+                _restore_lease(stale_path, path)
+                return None
+            logging.warning(f"Аренда задачи {task} просрочена, задача передана обработчику {worker}")
+            os.remove(stale_path)
+            continue
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(token)
+        return token
+    return None
+
+
+def _restore_lease(stale_path, path):
+    """Возвращает на место чужую действующую аренду, не заменяя аренду, созданную за это время"""
+    try:
+        os.link(stale_path, path)
+    except FileExistsError:
+        pass
+    except OSError:
+        # Файловая система без жёстких ссылок
+        if not os.path.exists(path):
+            os.rename(stale_path, path)
+            return
+    os.remove(stale_path)
+
+
+def release_lease(queue_dir, task, token):
+    """Освобождает аренду, если она принадлежит этой метке: аренду, забранную другим обработчиком, не трогает"""
+    if read_lease(queue_dir, task) != token:
+        return
+    try:
+        os.remove(_queue_path(queue_dir, 'leases', task + '.lease'))
+    except OSError:
+        pass
+
+
+@contextmanager
+def heartbeat(queue_dir, task, token, interval=LEASE_HEARTBEAT_SEC):
+    """
+    Продлевает аренду задачи каждые interval секунд, пока выполняется блок with
+
+    Возвращает:
+        threading.Event: Устанавливается, если аренда потеряна (забрана другим обработчиком)
+    """
+    path = _queue_path(queue_dir, 'leases', task + '.lease')
+    stop = threading.Event()
+    lost = threading.Event()
+
+    def beat():
+        while not stop.wait(interval):
+            try:
+                if read_lease(queue_dir, task) != token:
+                    raise OSError("аренда принадлежит другому обработчику")
+                os.utime(path)
+            except OSError as e:
+                logging.warning(f"Аренда задачи {task} потеряна: {e}")
+                lost.set()
+                return
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield lost
+    finally:
+        stop.set()
+        thread.join()
+
+
+def claim_next(queue_dir, job, worker):
+    """
+    Берёт в аренду следующую невыполненную задачу первого незавершённого этапа
+
+    Возвращает:
+        tuple: (имя задачи, метка аренды) или (None, None), если свободных задач сейчас нет
+    """
+    for tasks in job_phases(job):
+        pending = [task for task in tasks if not is_done(queue_dir, task)]
+        if not pending:
+            continue
+        for task in pending:
+            if failed_attempts(queue_dir, task) >= TASK_MAX_ATTEMPTS:
+                continue
+            token = try_lease(queue_dir, task, worker)
+            if token:
+                if is_done(queue_dir, task):
+                    # Задачу выполнили, пока брали аренду
+                    release_lease(queue_dir, task, token)
+                    continue
+                return task, token
+        return None, None
+    return None, None
+
+
+def job_failed(queue_dir, job):
+    """Задачи, исчерпавшие попытки: задание не может быть завершено"""
+    return [task for tasks in job_phases(job) for task in tasks
+            if not is_done(queue_dir, task) and failed_attempts(queue_dir, task) >= TASK_MAX_ATTEMPTS]
+
+
+def shared_store(queue_dir, job):
+    """Разделы источников в папке очереди, общие для всех обработчиков"""
+    return SpillStore(_queue_path(queue_dir, 'parts'), job['partitions'], clean=False)
+
+
+def run_parse(queue_dir, job, index):
+    """Разбирает файл и записывает его по разделам. Сведения об источнике - в sources/"""
+    name = job['files'][index]
+    result = process_file(name)
+    store = shared_store(queue_dir, job)
+    if result is None:
+        source = (name, None, [], {})
+    else:
+        _, df, format = result
+        store.add(index, name, df, format)
+        source = store.sources[index] + (store.attrs[index],)
+    _write_atomic(_queue_path(queue_dir, 'sources', f'src-{index:05d}.pkl'), source)
+
+
+def open_store(queue_dir, job):
+    """
+    Разделы источников со сведениями о разобранных источниках: загрузившиеся источники,
+    их столбцы и атрибуты (время загрузки для таблицы источников)
+    """
+    store = shared_store(queue_dir, job)
+    for index in range(len(job['files'])):
+        with open(_queue_path(queue_dir, 'sources', f'src-{index:05d}.pkl'), 'rb') as f:
+            name, format, columns, attrs = pickle.load(f)
+        if format is not None:
+            store.sources[index] = (name, format, columns)
+            store.attrs[index] = attrs
+    return store
+
+
+def run_partition(queue_dir, job, partition):
+    """
+    Обрабатывает раздел: удаление дублей, лучшие показания, показания всех источников и флаги проверки.
+    Части итоговых таблиц записываются вместе со сводкой проверки раздела
+    """
+    summaries = []
+    tables = process_unit(open_store(queue_dir, job).load_unit([partition]), job['as_of_dates'], job['layout'],
+                          summaries)
+    if tables is not None:
+        _write_atomic(_queue_path(queue_dir, 'results', f'part-{partition:04d}.pkl'), (tables, summaries))
+
+
+def run_reduce(queue_dir, job):
+    """
+    Собирает части результата в файл Excel в порядке разделов, таблица источников - отдельным файлом.
+    Сводка проверки выводится одна на все разделы, при delta записывается файл изменений, как в main
+
+    Возвращает:
+        str: Путь к файлу результата или None, если данных нет
+    """
+    summaries = []
+    # Лучшие показания частей для файла изменений сбрасываются на диск по разделам номеров ПУ
+    snapshots = SnapshotSpill(_queue_path(queue_dir, 'delta')) if job['delta'] else None
+
+    def units():
+        for partition in range(job['partitions']):
+            path = _queue_path(queue_dir, 'results', f'part-{partition:04d}.pkl')
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    tables, part_summaries = pickle.load(f)
+                summaries.extend(part_summaries)
+                if snapshots is not None:
+                    snapshots.add(best_snapshot(tables['Result'], as_of_periods(job['as_of_dates'])))
+                yield tables
+
+    store = open_store(queue_dir, job)
+    paths = write_tables_stream(units(), output_folder=job['output_folder'],
+                                spill_folder=_queue_path(queue_dir, 'readings'),
+                                sources=source_table(store.load_unit([])))
+    if VALIDATION:
+        log_summary(combine_summaries(summaries))
+    if snapshots is not None:
+        snapshots.write_delta(output_folder=job['output_folder'])
+        snapshots.cleanup()
+    return paths['Result']
+
+
+def run_task(queue_dir, job, task):
+    """Выполняет задачу, возвращает значение для отметки о выполнении"""
+    kind, _, number = task.partition('-')
+    if kind == 'parse':
+        run_parse(queue_dir, job, int(number))
+    elif kind == 'part':
+        run_partition(queue_dir, job, int(number))
+    else:
+        return run_reduce(queue_dir, job)
+    return None
+
+
+def run_worker(queue_dir, worker=None, poll_sec=QUEUE_POLL_SEC):
+    """
+    Обработчик очереди: забирает и выполняет задачи, пока задание не будет собрано.
+    Неудачная попытка записывается в failed/, задача возвращается в очередь; если попытки задачи
+    исчерпаны (TASK_MAX_ATTEMPTS), обработчик завершает работу
+
+    Возвращает:
+        int: Число выполненных этим обработчиком задач
+    """
+    worker = worker or worker_name()
+    job = load_job(queue_dir)
+    completed = 0
+    logging.info(f"Обработчик {worker} подключился к очереди {queue_dir}")
+    while not is_done(queue_dir, REDUCE_TASK):
+        task, token = claim_next(queue_dir, job, worker)
+        if task is None:
+            failed = job_failed(queue_dir, job)
+            if failed:
+                logging.error(f"Задание не может быть завершено, исчерпаны попытки задач: {', '.join(failed)}")
+                break
+            time.sleep(poll_sec)
+            continue
+        start = time.perf_counter()
+        try:
+            with heartbeat(queue_dir, task, token) as lost:
+                value = run_task(queue_dir, job, task)
+            if lost.is_set() or read_lease(queue_dir, task) != token:
+                # Задачу забрал другой обработчик, результат отмечает он
+                logging.warning(f"Обработчик {worker}: аренда задачи {task} потеряна, результат не отмечается")
+                continue
+            _write_atomic(_queue_path(queue_dir, 'done', task),
+                          {'worker': worker, 'seconds': time.perf_counter() - start, 'result': value}, binary=False)
+            completed += 1
+            logging.info(f"Обработчик {worker}: задача {task} выполнена за {time.perf_counter() - start:.1f} сек")
+        except Exception as e:
+            logging.error(f"Обработчик {worker}: ошибка задачи {task}: {e}", exc_info=True)
+            with open(_queue_path(queue_dir, 'failed', task), 'a', encoding='utf-8') as f:
+                f.write(f"{worker}\t{e!r}\n")
+        finally:
+            release_lease(queue_dir, task, token)
+    logging.info(f"Обработчик {worker} завершил работу, выполнено задач: {completed}")
+    return completed
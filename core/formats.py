@@ -0,0 +1,73 @@
+"""
+formats.py
+Поиск входных файлов и определение их формата. Модуль не зависит от pandas,
+поэтому быстрые команды (например, проверка форматов) запускаются без его загрузки
+"""
+import os
+
+from core.config import *
+from core.archives import archive_members, is_data_file, source_name
+
+
+def find_all_files(folder_path=PATH_TO_DATA):
+    """
+    Ищет и возврашает список всех файлов в указанной дериктории. По умолчанию ищет по пути указаному в config.py.
+    Сжатые файлы (.gz, .zst) возвращаются как есть, из архивов .zip возвращаются файлы с данными
+    в виде 'архив.zip::файл'
+    >>> 'TEST_DATA/2025-06-18 Отчет КУЭМ (21).xlsx' in find_all_files('TEST_DATA')
+    True
+    >>> 'TEST_DATA/2025-05-19 Симс.csv' in find_all_files('TEST_DATA')
+    True
+    >>> 'TEST_DATA/2025-06-18 для ткста поиска файлов.xlsx' in find_all_files('TEST_DATA')
+    True
+    >>> 'TEST_DATA/2025-06-18 Ведомость опроса для выгрузки в КУЭМ по ЭМИС.xlsx' in find_all_files('TEST_DATA')
+    True
+    >>> 'TEST_DATA/2025-06-18 Ведомость опроса для выгрузки в КУЭМ (с типом ПУ без AD) (тчк).xlsx' in find_all_files('TEST_DATA')
+    True
+    """
+    name_all_files = []
+    for f in os.listdir(folder_path):
+        path = os.path.join(folder_path, f)
+        if f.endswith('.zip'):
+            name_all_files.extend(archive_members(path))
+        elif is_data_file(f):
+            name_all_files.append(path)
+    return name_all_files
+
+
+def identific_format_file(name_file):
+    """
+    Определяет формат содержащихся данных по имени файла (для файла в архиве - по имени внутри архива)
+    name_file: Имя файла с данными
+    return: Формат данных
+    >>> identific_format_file('2025-06-18 Ведомость опроса для выгрузки в КУЭМ по ЭМИС.xlsx')
+    'EMIS'
+    >>> identific_format_file('2025-06-18 Ведомость опроса для выгрузки в КУЭМ (с типом ПУ без AD) (тчк).xlsx')
+    'TELESCOP'
+    >>> identific_format_file('2025-06-18 Отчет КУЭМ (20).xlsx')
+    'PYRAMIDA'
+    >>> identific_format_file('2025-05-19 Симс.csv')
+    'SIMS'
+    >>> identific_format_file('2025-05-19.txt') is None
+    True
+    >>> identific_format_file('Отчет КУЭМ (май).zip::2025-05-19 Симс.csv.gz')
+    'SIMS'
+    """
+    name_file = source_name(name_file)
+    if NAME_FILES_PYRAMIDA in name_file:
+        format_file = 'PYRAMIDA'
+    elif NAME_FILES_TELESCOP in name_file:
+        format_file = 'TELESCOP'
+    elif NAME_FILES_SIMS in name_file:
+        format_file = 'SIMS'
+    elif NAME_FILES_EMIS in name_file:
+        format_file = 'EMIS'
+    else:
+        format_file = None
+    return format_file
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,443 @@
+"""
+intrafile.py
+Параллельный разбор одного большого файла.
+Лист xlsx читается потоком из архива и режется на блоки по границам строк <row>,
+CSV режется на диапазоны байтов по границам строк. Блоки разбираются одновременно
+в пуле процессов и склеиваются в исходном порядке.
+Результат совпадает с pd.read_excel / pd.read_csv для всего файла.
+Блоки листа разбираются закрытым API openpyxl (версия закреплена в requirements.txt),
+без него книга читается целиком через pd.read_excel
+"""
+import io
+import logging
+import mmap
+import multiprocessing
+import os
+import re
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+import openpyxl
+from openpyxl import load_workbook
+from pandas.io.parsers import TextParser
+
+try:
+    from openpyxl.worksheet._reader import WorkSheetParser
+except ImportError:  # Закрытый API openpyxl изменился: книги читаются целиком
+    WorkSheetParser = None
+
+from core.config import *
+from core.archives import is_plain_file
+
+# Размер порции при потоковом чтении листа из архива
+READ_BLOCK_SIZE = 2 ** 20
+
+# Параметры разбора листа в процессе пула, задаются один раз при запуске процесса
+_sheet_context = {}
+
+# Процессы пула запускаются через spawn: файлы загружаются в пуле потоков, и процесс, созданный fork,
+# может унаследовать блокировку, захваченную другим потоком (логирование, импорт), и зависнуть
+POOL_CONTEXT = multiprocessing.get_context('spawn')
+
+
+def use_intra_file(file_path, workers=INTRA_FILE_WORKERS, min_mb=INTRA_FILE_MIN_MB):
+    """
+    Проверяет, нужно ли разбирать файл по частям: файл лежит на диске без сжатия и достаточно большой,
+    задано больше одного процесса, и текущий процесс может запускать дочерние
+    (процесс под контролем watchdog - не может)
+    """
+    if workers <= 1 or multiprocessing.current_process().daemon or not is_plain_file(file_path):
+        return False
+    try:
+        return os.path.getsize(file_path) >= min_mb * 2 ** 20
+    except OSError:
+        return False
+
+
+def _init_sheet_worker(shared_strings, epoch, date_formats, timedelta_formats):
+    _sheet_context.update(shared_strings=shared_strings, epoch=epoch,
+                          date_formats=date_formats, timedelta_formats=timedelta_formats)
+
+
+def _init_pool_worker(log_args, sheet_args=None):
+    """Запуск процесса пула: логирование через очередь родителя (см. child_logging) и параметры разбора листа"""
+    init_child_logging(*log_args)
+    if sheet_args is not None:
+        _init_sheet_worker(*sheet_args)
+
+
+def _convert_cell(cell):
+    """Значение ячейки в том виде, в котором его возвращает читатель openpyxl в pandas"""
+    value = cell['value']
+    if value is None:
+        return ''
+    if cell['data_type'] == 'e':
+        return np.nan
+    if cell['data_type'] == 'n':
+        number = int(value)
+        return number if number == value else float(value)
+    return value
+
+
+def _parse_sheet_block(xml):
+    """
+    Разбирает блок строк листа (выполняется в отдельном процессе)
+
+    Возвращает:
+        list: Список кортежей (номер строки, значения ячеек)
+    """
+    parser = WorkSheetParser(io.BytesIO(xml), _sheet_context['shared_strings'], data_only=True,
+                             epoch=_sheet_context['epoch'],
+                             date_formats=_sheet_context['date_formats'],
+                             timedelta_formats=_sheet_context['timedelta_formats'])
+    rows = []
+    for row_number, cells in parser.parse():
+        values = [''] * (cells[-1]['column'] if cells else 0)
+        for cell in cells:
+            values[cell['column'] - 1] = _convert_cell(cell)
+        rows.append((row_number, values))
+    return rows
+
+
+def iter_sheet_blocks(stream, block_bytes):
+    """
+    Читает XML листа потоком и режет содержимое <sheetData> на блоки целых строк.
+    Каждый блок дополняется началом и концом документа и разбирается независимо
+
+    Параметры:
+        stream: Открытый на чтение поток XML листа
+        block_bytes (int): Примерный размер блока в байтах
+
+    Возвращает:
+        generator: Блоки - самостоятельные XML-документы
+    """
+    buffer = b''
+    head = None
+    while head is None:
+        block = stream.read(READ_BLOCK_SIZE)
+        buffer += block
+        match = re.search(rb'<((?:[\w.-]+:)?)sheetData\s*(/?)>', buffer)
+        if match:
+            if match.group(2):  # <sheetData/> - лист без строк
+                return
+            head, buffer = buffer[:match.end()], buffer[match.end():]
+        elif not block:
+            return
+    prefix = match.group(1)
+    root = re.search(rb'<([\w.:-]+)[\s>]', re.sub(rb'<\?.*?\?>', b'', head)).group(1)
+    row_tag, end_tag = b'<' + prefix + b'row', b'</' + prefix + b'sheetData>'
+    tail = end_tag + b'</' + root + b'>'
+
+    # Без номеров строк (атрибут r) блоки нельзя разобрать независимо, лист разбирается целиком
+    row_pattern = re.escape(row_tag) + rb'[\s>][^>]*>'
+    while re.search(row_pattern, buffer) is None and end_tag not in buffer:
+        block = stream.read(READ_BLOCK_SIZE)
+        if not block:
+            break
+        buffer += block
+    first_row = re.search(row_pattern, buffer)
+    if first_row is not None and not re.search(rb'\sr="', first_row.group(0)):
+        block_bytes = float('inf')
+
+    finished = False
+    while not finished:
+        while len(buffer) < block_bytes and end_tag not in buffer:
+            block = stream.read(READ_BLOCK_SIZE)
+            if not block:
+                break
+            buffer += block
+        end = buffer.find(end_tag)
+        if end >= 0:
+            rows, buffer, finished = buffer[:end], b'', True
+        else:
+            cut = max(buffer.rfind(row_tag + b' '), buffer.rfind(row_tag + b'>'))
+            if cut <= 0:
+                # В буфере одна незаконченная строка - читаем дальше
+                block = stream.read(READ_BLOCK_SIZE)
+                if not block:
+                    raise ValueError("Лист xlsx повреждён: не найден конец <sheetData>")
+                buffer += block
+                continue
+            rows, buffer = buffer[:cut], buffer[cut:]
+        if rows.strip():
+            yield head + rows + tail
+
+
+def sheet_parameters(file_path):
+    """
+    Параметры разбора первого листа книги
+
+    Возвращает:
+        tuple: (путь к листу в архиве, параметры разбора для _init_sheet_worker)
+               или None, если закрытый API openpyxl недоступен
+    """
+    if WorkSheetParser is None:
+        return None
+    workbook = load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        # Закрытые атрибуты openpyxl: путь к листу в архиве, общие строки и форматы ячеек с датами
+        return sheet._worksheet_path, (list(sheet._shared_strings), workbook.epoch,
+                                       workbook._date_formats, workbook._timedelta_formats)
+    except AttributeError as e:
+        logging.warning(f"Закрытый API openpyxl {openpyxl.__version__} изменился, книга читается целиком: {e}")
+        return None
+    finally:
+        workbook.close()
+
+
+def _require_sheet_parameters(file_path):
+    parameters = sheet_parameters(file_path)
+    if parameters is None:
+        raise ValueError(f"Лист книги {file_path} нельзя разобрать по блокам: закрытый API openpyxl недоступен")
+    return parameters
+
+
+def iter_sheet_rows(file_path, block_mb=INTRA_FILE_BLOCK_MB, parameters=None):
+    """
+    Потоково читает значения первого листа книги в текущем процессе, не загружая лист в память целиком.
+    Строки идут подряд с первой: пропущенные в файле строки возвращаются пустыми,
+    пустые ячейки в конце строк отброшены
+
+    Параметры:
+        parameters (tuple): Результат sheet_parameters, None - вычисляется по файлу
+
+    Возвращает:
+        generator: Значения строк листа, каждая строка - список значений
+    """
+    sheet_path, initargs = parameters or _require_sheet_parameters(file_path)
+    _init_sheet_worker(*initargs)
+    position = 0
+    with zipfile.ZipFile(file_path) as archive, archive.open(sheet_path) as stream:
+        for xml in iter_sheet_blocks(stream, block_mb * 2 ** 20):
+            for row_number, values in _parse_sheet_block(xml):
+                for _ in range(position, row_number - 1):
+                    yield []
+                while values and values[-1] == '':
+                    values.pop()
+                position = row_number
+                yield values
+
+
+def iter_excel_chunks(file_path, chunk_rows, header=0, usecols=None, names=None, **kwargs):
+    """
+    Потоково читает первый лист книги порциями строк данных, не загружая лист целиком.
+    Порции разбираются так же, как pd.read_excel: пустые строки в середине листа дают строки
+    из пропусков, пустые строки в конце листа отбрасываются. Типы столбцов определяются по каждой порции.
+    Без закрытого API openpyxl лист читается целиком одной порцией
+
+    Параметры:
+        file_path (str): Путь к файлу xlsx
+        chunk_rows (int): Строк в одной порции
+        header (int): Номер строки заголовка, строки до него и сам заголовок пропускаются
+        usecols (list): Номера нужных столбцов
+        names (list): Названия столбцов
+        **kwargs: Прочие параметры разбора как у pd.read_excel (decimal, ...)
+
+    Возвращает:
+        generator: Таблицы с метками строк, продолжающимися от порции к порции
+    """
+    parameters = sheet_parameters(file_path)
+    if parameters is None:
+        yield pd.read_excel(file_path, header=header, usecols=usecols, names=names, **kwargs)
+        return
+    rows, blank_rows, start = [], 0, 0
+    for position, values in enumerate(iter_sheet_rows(file_path, parameters=parameters)):
+        if position <= header:
+            continue
+        if usecols is None:
+            usecols = range(len(names) if names is not None else len(values))
+        if not values:
+            # Пустая строка остаётся, только если за ней есть данные
+            blank_rows += 1
+            continue
+        rows.extend([''] * len(usecols) for _ in range(blank_rows))
+        blank_rows = 0
+        rows.append([values[i] if i < len(values) else '' for i in usecols])
+        if len(rows) >= chunk_rows:
+            yield _rows_to_frame(rows, start, names, kwargs)
+            start, rows = start + len(rows), []
+    if rows:
+        yield _rows_to_frame(rows, start, names, kwargs)
+
+
+def _rows_to_frame(rows, start, names, kwargs):
+    frame = TextParser(rows, header=None, names=names, skip_blank_lines=False, **kwargs).read()
+    return frame.set_axis(pd.RangeIndex(start, start + len(frame)))
+
+
+def read_sheet_data(file_path, workers=INTRA_FILE_WORKERS, block_mb=INTRA_FILE_BLOCK_MB, parameters=None):
+    """
+    Читает значения первого листа книги параллельно по блокам строк.
+    Результат совпадает с тем, что читатель openpyxl передаёт в pandas: пропущенные строки пустые,
+    пустые ячейки в конце строк и пустые строки в конце листа отброшены, строки дополнены до одной ширины
+
+    Параметры:
+        parameters (tuple): Результат sheet_parameters, None - вычисляется по файлу
+
+    Возвращает:
+        list: Список строк листа, каждая строка - список значений
+    """
+    sheet_path, initargs = parameters or _require_sheet_parameters(file_path)
+    with zipfile.ZipFile(file_path) as archive, archive.open(sheet_path) as stream, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT, initializer=_init_pool_worker,
+                                initargs=(child_logging(POOL_CONTEXT), initargs)) as executor:
+        # В работе не больше двух блоков на процесс, чтобы весь лист не оказался в памяти сразу
+        pending, n_blocks = deque(), 0
+        data, last_row_with_data = [], -1
+        blocks = iter_sheet_blocks(stream, block_mb * 2 ** 20)
+        while True:
+            for xml in islice(blocks, 2 * workers - len(pending)):
+                pending.append(executor.submit(_parse_sheet_block, xml))
+                n_blocks += 1
+            if not pending:
+                break
+            for row_number, values in pending.popleft().result():
+                # Строки, которых нет в файле, считаются пустыми
+                data.extend([] for _ in range(len(data), row_number - 1))
+                while values and values[-1] == '':
+                    values.pop()
+                if values:
+                    last_row_with_data = len(data)
+                data.append(values)
+
+    data = data[:last_row_with_data + 1]
+    if data:
+        max_width = max(len(values) for values in data)
+        data = [values + [''] * (max_width - len(values)) for values in data]
+    logging.info(f"Лист {sheet_path} файла {file_path} разобран в {workers} процессах по {n_blocks} блокам")
+    return data
+
+
+def read_excel_parallel(file_path, workers=INTRA_FILE_WORKERS, block_mb=INTRA_FILE_BLOCK_MB, **kwargs):
+    """
+    Параллельный аналог pd.read_excel для первого листа книги
+
+    Параметры:
+        file_path (str): Путь к файлу xlsx
+        workers (int): Число процессов
+        block_mb (float): Примерный размер блока XML листа в мегабайтах
+        **kwargs: Параметры разбора как у pd.read_excel (header, usecols, names, decimal, ...)
+
+    Возвращает:
+        pd.DataFrame: Та же таблица, что и pd.read_excel(file_path, **kwargs)
+    """
+    parameters = sheet_parameters(file_path)
+    if parameters is None:
+        return pd.read_excel(file_path, **kwargs)
+    data = read_sheet_data(file_path, workers, block_mb, parameters)
+    if not data:
+        return pd.DataFrame()
+    # Те же параметры разбора, с которыми pandas передаёт данные листа в TextParser
+    return TextParser(data, skip_blank_lines=False, **kwargs).read()
+
+
+def split_csv_ranges(file_path, n_ranges, skip_lines=0):
+    """
+    Делит файл на диапазоны байтов примерно равного размера по границам строк
+
+    Параметры:
+        file_path (str): Путь к файлу
+        n_ranges (int): Желаемое число диапазонов
+        skip_lines (int): Число строк в начале файла, которые входят в первый диапазон целиком
+
+    Возвращает:
+        list: Список пар (начало, конец) или None, если файл нельзя делить
+              (в нём есть кавычки, внутри которых может быть перевод строки)
+    """
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return [(0, 0)]
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data.find(b'"') >= 0:
+            return None
+        start_of_data = 0
+        for _ in range(skip_lines):
+            start_of_data = data.find(b'\n', start_of_data) + 1 or size
+        bounds = [0]
+        for i in range(1, n_ranges):
+            position = max(start_of_data, size * i // n_ranges, bounds[-1])
+            end_of_line = data.find(b'\n', position)
+            if end_of_line < 0:
+                break
+            if end_of_line + 1 > bounds[-1]:
+                bounds.append(end_of_line + 1)
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _read_csv_range(file_path, start, end, first, str_columns, kwargs):
+    """
+    Разбирает диапазон байтов CSV (выполняется в отдельном процессе).
+    Первый диапазон разбирается с заголовком, остальные - только со строками данных
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        chunk = f.read(end - start)
+    if not first:
+        kwargs = dict(kwargs, header=None, skiprows=None)
+    if str_columns:
+        kwargs = dict(kwargs, dtype={col: str for col in str_columns})
+    try:
+        return pd.read_csv(io.BytesIO(chunk), **kwargs)
+    except pd.errors.EmptyDataError:
+        return None
+
+
+def _mixed_columns(parts):
+    """
+    Столбцы, типы которых в частях не согласуются: в одних частях текст, в других числа.
+    При разборе всего файла такие столбцы остаются текстовыми целиком
+    """
+    mixed = []
+    for col in parts[0].columns:
+        kinds = {part[col].dtype.kind for part in parts if part[col].notna().any()}
+        if len(kinds) > 1 and not kinds <= {'i', 'u', 'f'}:
+            mixed.append(col)
+    return mixed
+
+
+def read_csv_parallel(file_path, workers=INTRA_FILE_WORKERS, **kwargs):
+    """
+    Параллельный аналог pd.read_csv для файла без кавычек.
+    Поддерживаются целочисленный header и список столбцов names
+
+    Параметры:
+        file_path (str): Путь к файлу
+        workers (int): Число процессов
+        **kwargs: Параметры разбора как у pd.read_csv
+
+    Возвращает:
+        pd.DataFrame: Та же таблица, что и pd.read_csv(file_path, **kwargs)
+    """
+    header = kwargs.get('header', 'infer')
+    if header == 'infer':
+        header = None if kwargs.get('names') is not None else 0
+    skip_lines = 0 if header is None else header + 1
+    ranges = split_csv_ranges(file_path, workers, skip_lines)
+    if ranges is None or len(ranges) < 2 or kwargs.get('names') is None:
+        return pd.read_csv(file_path, **kwargs)
+
+    firsts = [True] + [False] * (len(ranges) - 1)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT, initializer=_init_pool_worker,
+                             initargs=(child_logging(POOL_CONTEXT),)) as executor:
+        parts = list(executor.map(_read_csv_range, [file_path] * len(ranges), *zip(*ranges), firsts,
+                                  [None] * len(ranges), [kwargs] * len(ranges)))
+        indexes = [i for i, part in enumerate(parts) if part is not None]
+        parts = [parts[i] for i in indexes]
+        # Столбцы со смешанными типами перечитываются как текст там, где они разобрались как числа
+        mixed = _mixed_columns(parts)
+        if mixed:
+            retry = [i for i, part in zip(indexes, parts)
+                     if any(part[col].dtype.kind != 'O' and part[col].notna().any() for col in mixed)]
+            reread = executor.map(_read_csv_range, [file_path] * len(retry),
+                                  *zip(*[ranges[i] for i in retry]), [firsts[i] for i in retry],
+                                  [mixed] * len(retry), [kwargs] * len(retry))
+            for i, part in zip(retry, reread):
+                parts[indexes.index(i)] = part
+    logging.info(f"Файл {file_path} разобран в {workers} процессах по {len(ranges)} частям")
+    return pd.concat(parts, ignore_index=True)
@@ -1,75 +1,93 @@
 # Загрузчики данных
 import pandas as pd
 from functools import lru_cache
-import hashlib
+import io
 
 from core.processor import *
+from core.archives import source_exists, source_stat, open_source, is_plain_file
+from core.intrafile import use_intra_file, read_excel_parallel, read_csv_parallel, iter_excel_chunks
+from core.backends import select_backend, file_suffix
+from core.sniffer import detect_format
+from core.checkpoint import file_content_hash
+
+# Параметры чтения книг Excel: строка заголовка (пропускаем метастроки), нужные столбцы и их новые названия
+EXCEL_READ_PARAMS = {
+    'PYRAMIDA': dict(header=4, usecols=PYRAMIDA_NEEDED_COLS, names=NEW_NAMES),
+    'TELESCOP': dict(header=2, usecols=TELESCOP_NEEDED_COLS, names=TELESCOP_NEW_NAMES, decimal=','),
+    'EMIS': dict(header=2, usecols=EMIS_NEEDED_COLS, names=EMIS_NEW_NAMES),
+}
+
+# Параметры чтения CSV SIMS: разделитель ";", первая строка пропускается
+SIMS_READ_PARAMS = dict(sep=';', encoding='windows-1251', header=1, usecols=SIMS_NEEDED_COLS,
+                        names=SIMS_NEW_NAMES, on_bad_lines='warn', decimal=',')
+
+# Столбцы, которые хранятся как категории
+CATEGORY_COLUMNS = ['ПО', 'РЭС', 'Тип ПУ']
 
 
-@lru_cache(maxsize=32)
 def cached_load_file(file_path, format):
-    """Кэшированная версия функции load_file"""
-    if not os.path.exists(file_path):
+    """
+    Кэшированная версия функции load_file. Ключ кэша - путь, формат, размер и время изменения файла
+    (см. source_stat): изменённый файл загружается заново без чтения содержимого для хеша
+    """
+    if not source_exists(file_path):
         logging.info(f"Файл не найден: {file_path}")
         return None
-    try:
-        # Генерируем хеш содержимого файла для инвалидации кэша
-        with open(file_path, 'rb') as f:
-            file_hash = hashlib.md5(f.read()).hexdigest()
+    return _cached_load_file(file_path, format, source_stat(file_path))
 
-        # Ключ кэша = путь + хеш + формат
-        cache_key = f"{file_path}_{file_hash}_{format}"
+
+@lru_cache(maxsize=32)
+def _cached_load_file(file_path, format, stat):
+    try:
         return load_file(file_path, format)
     except Exception as e:
         logging.info(f"Ошибка при кэшированной загрузке файла {file_path}: {str(e)}")
         return None
 
-def get_file_hash(file_path):
-    """Генерирует хеш файла для инвалидации кэша при изменениях"""
-    with open(file_path, 'rb') as f:
-        return hashlib.md5(f.read()).hexdigest()
+
+def extend_sims(df):
+    """
+    Очищает данные SIMS и добавляет недостающие столбцы, заполняя их "Не указано"
+    """
+    # Очистка данных
+    df = df.dropna(how='all')
+    pu_column = 'Номер ПУ'
+
+    if pu_column not in df.columns:
+        raise ValueError(f"Столбец с номером ПУ не найден. Доступные столбцы: {df.columns.tolist()}")
+
+    # Создаем недостающие столбцы и заполняем их номером ПУ
+    additional_columns = {
+        'ПО': "СИМС",
+        'Населенный пункт': "Не указано",
+        'ТП': "Не указано",
+        'Потребитель': "Не указано",
+        'Лицевой счет': "Не указано"
+    }
+
+    for col_name, values in additional_columns.items():
+        if col_name not in df.columns:
+            df[col_name] = values
+
+    return df
 
 
 def load_and_extend_sims(file_path):
     """
     Загружает файл SIMS и добавляет недостающие столбцы, заполняя их"Не указано"
     """
-    if not os.path.exists(file_path):
+    if not source_exists(file_path):
         logging.info(f"Файл не найден: {file_path}")
         return None
     try:
-        # Загрузка CSV с разделителем ";"
-        df = pd.read_csv(
-            file_path,
-            sep=';',
-            encoding='windows-1251',
-            header=1,  # Пропускаем первую строку
-            usecols=SIMS_NEEDED_COLS,
-            names=SIMS_NEW_NAMES,
-            on_bad_lines='warn',
-            decimal=','
-        )
-        # Очистка данных
-        df = df.dropna(how='all')
-        pu_column = 'Номер ПУ'
-
-        if pu_column not in df.columns:
-            raise ValueError(f"Столбец с номером ПУ не найден. Доступные столбцы: {df.columns.tolist()}")
-
-        # Создаем недостающие столбцы и заполняем их номером ПУ
-        additional_columns = {
-            'ПО': "СИМС",
-            'Населенный пункт': "Не указано",
-            'ТП': "Не указано",
-            'Потребитель': "Не указано",
-            'Лицевой счет': "Не указано"
-        }
-
-        for col_name, values in additional_columns.items():
-            if col_name not in df.columns:
-                df[col_name] = values
-
-        return df
+        # Загрузка CSV с разделителем ";", большой файл разбирается по частям в нескольких процессах
+        if use_intra_file(file_path):
+            df = read_csv_parallel(file_path, **SIMS_READ_PARAMS)
+        else:
+            # Сжатый файл распаковывается потоком при чтении
+            with open_source(file_path) as source:
+                df = pd.read_csv(source, **SIMS_READ_PARAMS)
+        return extend_sims(df)
 
     except Exception as e:
         logging.info(f"Ошибка обработки файла {file_path}: {str(e)}")
@@ -97,8 +115,7 @@ def optimize_dataframe(df):
             df[col] = df[col].astype(str).str.replace(',', '.').astype(float, errors='ignore')
 
     # Категориальные данные
-    cat_cols = ['ПО', 'РЭС', 'Тип ПУ']
-    for col in cat_cols:
+    for col in CATEGORY_COLUMNS:
         if col in df.columns:
             df[col] = df[col].astype('category')
 
@@ -109,6 +126,53 @@ def optimize_dataframe(df):
     return df
 
 
+def excel_source(file_path):
+    """
+    Книга Excel для чтения: путь к файлу на диске или распакованное в память содержимое
+    сжатого файла (читателям xlsx нужен произвольный доступ к архиву книги)
+    """
+    if is_plain_file(file_path):
+        return file_path
+    with open_source(file_path) as source:
+        return io.BytesIO(source.read())
+
+
+def excel_serial_dates(values):
+    """
+    Переводит даты, записанные числами Excel (дни от 30.12.1899), в даты. Движок pyxlsb не знает
+    форматов ячеек и возвращает даты числами, остальные движки - датами
+    >>> excel_serial_dates(pd.Series([45826, '18.06.2025'])).tolist()
+    [Timestamp('2025-06-18 00:00:00'), '18.06.2025']
+    """
+    numeric = values.map(lambda value: isinstance(value, (int, float)) and not isinstance(value, bool)
+                         and value == value)
+    if not numeric.any():
+        return values
+    values = values.astype(object)
+    values[numeric] = list(pd.to_datetime(values[numeric].astype(float), unit='D', origin='1899-12-30'))
+    return values
+
+
+def read_excel(file_path, format=None, engine=None, **kwargs):
+    """
+    Читает первый лист книги движком из реестра core.backends (по умолчанию самым быстрым).
+    Большой файл .xlsx разбирается по блокам строк в нескольких процессах
+    """
+    if file_suffix(file_path) == '.xlsx' and use_intra_file(file_path):
+        return read_excel_parallel(file_path, **kwargs)
+    if engine is None:
+        engine = select_backend(file_path, format)
+    df = pd.read_excel(excel_source(file_path), engine=engine, **kwargs)
+    if engine == 'pyxlsb' and 'Дата КП' in df.columns:
+        df['Дата КП'] = excel_serial_dates(df['Дата КП'])
+    return df
+
+
+def read_excel_source(file_path, format, engine=None):
+    """Читает книгу с параметрами чтения её формата заданным движком"""
+    return read_excel(file_path, format, engine, **EXCEL_READ_PARAMS[format])
+
+
 def load_file(file_path, format):
     """
     Загружает файл с автоматической фильтрацией столбцов и переименованием заголовков
@@ -125,37 +189,14 @@ def load_file(file_path, format):
         >>> print(df.shape)
         (100, 13)
     """
-    if not os.path.exists(file_path):
+    if not source_exists(file_path):
         logging.info(f"Файл не найден: {file_path}")
         return None
     try:
         # Читаем файл в зависимости от формата
-        if format == 'PYRAMIDA':
-            # Определяем строку с заголовком
-            header_row = 4
-            # Загружаем данные Пирамиды, пропуская метастроки
-            df = pd.read_excel(file_path,
-                               header=header_row,
-                               usecols=PYRAMIDA_NEEDED_COLS,
-                               names=NEW_NAMES
-                               )
-        elif format == 'TELESCOP':
-            header_row = 2
-            # Загружаем данные Телескоп, пропуская метастроки
-            df = pd.read_excel(file_path,
-                               header=header_row,
-                               usecols=TELESCOP_NEEDED_COLS,
-                               names=TELESCOP_NEW_NAMES,
-                               decimal=','
-                               )
-        elif format == 'EMIS':
-            header_row = 2
-            # Загружаем данные Эмис, пропуская метастроки
-            df = pd.read_excel(file_path,
-                               header=header_row,
-                               usecols=EMIS_NEEDED_COLS,
-                               names=EMIS_NEW_NAMES
-                               )
+        if format in EXCEL_READ_PARAMS:
+            # Загружаем данные Пирамиды, Телескопа или Эмиса, пропуская метастроки
+            df = read_excel_source(file_path, format)
         elif format == 'SIMS':
             # Загружаем файл SIMS и добавляем недостающие столбцы, заполняя их значением "Не указано"
             df = load_and_extend_sims(file_path)
@@ -177,17 +218,94 @@ def load_file(file_path, format):
         return None
 
 
-def process_file(name):
-    """Обработка одного файла с возвратом имени файла и результата"""
-    format = identific_format_file(name)
+def iter_file_chunks(file_path, format, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Читает файл порциями строк. Каждая порция обработана так же, как результат load_file,
+    метки строк продолжаются от порции к порции
+    """
+    if format in EXCEL_READ_PARAMS and file_suffix(file_path) != '.xlsx':
+        # Потоково читаются только книги .xlsx, остальные читаются целиком одной порцией
+        chunks = [read_excel_source(file_path, format)]
+    elif format in EXCEL_READ_PARAMS:
+        chunks = iter_excel_chunks(excel_source(file_path), chunk_rows, **EXCEL_READ_PARAMS[format])
+    elif format == 'SIMS':
+        chunks = iter_csv_chunks(file_path, chunk_rows)
+    else:
+        raise ValueError(f'Неизвестный формат файла: {format}')
+
+    for chunk in chunks:
+        labels = chunk.index
+        # optimize_dataframe обращается к строке с меткой 0, поэтому на время оптимизации строки нумеруются с нуля
+        chunk = optimize_dataframe(chunk.reset_index(drop=True)).reindex(columns=NEW_NAMES)
+        chunk.index = labels
+        yield chunk
+
+
+def iter_csv_chunks(file_path, chunk_rows):
+    """Читает файл SIMS порциями строк, сжатый файл распаковывается потоком"""
+    with open_source(file_path) as source:
+        for chunk in pd.read_csv(source, chunksize=chunk_rows, **SIMS_READ_PARAMS):
+            yield extend_sims(chunk)
+
+
+def load_file_reduced(file_path, format, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Потоковая загрузка файла с удалением дублей по мере чтения: в памяти остаётся по одной
+    самой свежей строке на ПУ, а не все строки файла.
+    Результат совпадает с delete_duplicates(load_file(file_path, format))
+
+    Возвращает:
+        pd.DataFrame: Таблица без дубликатов или None при ошибке
+    """
+    if not source_exists(file_path):
+        logging.info(f"Файл не найден: {file_path}")
+        return None
+    categories = {}
+
+    def chunks():
+        for chunk in iter_file_chunks(file_path, format, chunk_rows):
+            for col in CATEGORY_COLUMNS:
+                if isinstance(chunk[col].dtype, pd.CategoricalDtype):
+                    values = chunk[col].cat.categories
+                    categories[col] = categories[col].union(values) if col in categories else values
+            yield chunk
+
+    try:
+        df = reduce_latest_readings(chunks())
+        if df is None:
+            return delete_duplicates(pd.DataFrame(columns=NEW_NAMES))
+        # Порции с разными наборами категорий объединяются в object, восстанавливаем категории всего файла
+        for col, values in categories.items():
+            df[col] = df[col].astype(pd.CategoricalDtype(values))
+        logging.info(f"Успешно загружен файл {file_path}. Формат файла {format}.")
+        return df
+    except Exception as e:
+        logging.info(f"Ошибка загрузки файла: {e}")
+        return None
+
+
+def process_file(name, content_hash=None):
+    """
+    Обработка одного файла с возвратом имени файла и результата.
+    content_hash - хеш содержимого, уже вычисленный вызывающим процессом (None - вычисляется здесь)
+    """
+    format = detect_format(name)
     if not format:
         logging.info(f'В папке с данными лежит файл неизвестного формата. {name} Он не будет обработан')
         return None
 
     try:
-        df = cached_load_file(name, format)
+        if STREAM_REDUCE:
+            # Дубли удаляются по мере чтения, все строки файла в памяти не собираются
+            df = load_file_reduced(name, format)
+        else:
+            df = cached_load_file(name, format)
+            if df is not None:
+                df = delete_duplicates(df)
         if df is not None:
-            df = delete_duplicates(df)
+            # Время загрузки и хеш содержимого источника - для таблицы источников результата
+            df.attrs['Загружен'] = pd.Timestamp.now()
+            df.attrs['Хеш'] = content_hash or file_content_hash(name)
             return (name, df, format)
         else:
             logging.info(f"Не удалось загрузить файл {name}")
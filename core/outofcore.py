@@ -0,0 +1,244 @@
+"""
+outofcore.py
+Режим обработки данных, не помещающихся в память.
+Каждый загруженный источник сразу сбрасывается на диск по разделам (по хешу номера ПУ),
+затем удаление дублей, выбор лучших показаний и добавление показаний всех источников
+выполняются по группам разделов, укладывающимся в бюджет памяти,
+а результат построчно дописывается в выходной файл
+"""
+import logging
+import os
+import pickle
+import shutil
+import uuid
+from datetime import datetime
+
+import pandas as pd
+
+from core.config import *
+from core.processor import (meter_partition, delete_duplicates, add_best_readings, add_additional_readings,
+                            long_readings, as_of_periods, write_excel, save_to_excel)
+from core.output import encode_sources
+from core.validator import SourceFlags, add_validation_flags, combine_summaries, log_summary
+
+
+class SpillStore:
+    """
+    Хранилище источников, разбитых по разделам на диске
+
+    Параметры:
+        folder (str): Папка для разделов, очищается при создании
+        n_partitions (int): Число разделов
+        clean (bool): Очищать папку при создании. Без очистки хранилище открывает разделы,
+                      которые записывают другие процессы (см. distributed.py)
+    """
+
+    def __init__(self, folder=SPILL_DIR, n_partitions=SPILL_PARTITIONS, clean=True):
+        self.folder = folder
+        self.n_partitions = n_partitions
+        self.sources = {}  # {порядковый номер: (имя_файла, формат, столбцы)}
+        self.attrs = {}  # {порядковый номер: атрибуты таблицы источника (время загрузки)}
+        self.partition_bytes = [0] * n_partitions
+        if clean:
+            shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder, exist_ok=True)
+
+    def _piece_path(self, partition, index):
+        return os.path.join(self.folder, f'part-{partition:04d}', f'src-{index:05d}.pkl')
+
+    def add(self, index, name, df, format):
+        """
+        Сбрасывает источник на диск по разделам
+
+        Параметры:
+            index (int): Порядковый номер источника (определяет нумерацию столбцов результата)
+            name (str): Имя файла источника
+            df (pd.DataFrame): Загруженные данные
+            format (str): Формат источника
+        """
+        self.sources[index] = (name, format, list(df.columns))
+        self.attrs[index] = dict(df.attrs)
+        if 'Номер ПУ' not in df.columns or df.empty:
+            return
+        partitions = meter_partition(df['Номер ПУ'], self.n_partitions)
+        for partition, piece in df.groupby(partitions, sort=False):
+            path = self._piece_path(int(partition), index)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Запись через временный файл: другие процессы (distributed.py) не прочитают часть недописанной
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(piece, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self.partition_bytes[int(partition)] += int(piece.memory_usage(deep=True).sum())
+
+    def plan_units(self, memory_budget_mb=MEMORY_BUDGET_MB, memory_factor=OUT_OF_CORE_MEMORY_FACTOR):
+        """
+        Группирует соседние разделы в задачи, пиковая память которых укладывается в бюджет
+
+        Возвращает:
+            list: Список задач, каждая задача - список номеров разделов
+        """
+        budget = memory_budget_mb * 2 ** 20
+        units, unit, unit_bytes = [], [], 0
+        for partition, size in enumerate(self.partition_bytes):
+            estimate = size * memory_factor
+            if estimate > budget:
+                logging.warning(f"Раздел {partition} (~{estimate / 2 ** 20:.0f} МБ) больше бюджета памяти, "
+                                f"увеличьте SPILL_PARTITIONS")
+            if unit and (unit_bytes + estimate) > budget:
+                units.append(unit)
+                unit, unit_bytes = [], 0
+            unit.append(partition)
+            unit_bytes += estimate
+        if unit:
+            units.append(unit)
+        return units
+
+    def load_unit(self, partitions):
+        """
+        Загружает с диска данные всех источников для группы разделов. Без разделов (partitions=[])
+        возвращает пустые таблицы источников - например, для таблицы источников (см. source_table)
+
+        Возвращает:
+            dict: {имя_файла: [df, формат]} в порядке номеров источников
+        """
+        date_of_files = {}
+        for index in sorted(self.sources):
+            name, format, columns = self.sources[index]
+            pieces = []
+            for partition in partitions:
+                path = self._piece_path(partition, index)
+                if os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        pieces.append(pickle.load(f))
+            df = pd.concat(pieces, ignore_index=True) if pieces else pd.DataFrame(columns=columns)
+            df.attrs.update(self.attrs.get(index, {}))
+            date_of_files[name] = [df, format]
+        return date_of_files
+
+    def cleanup(self):
+        """Удаляет разделы с диска"""
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+def process_units(store, memory_budget_mb=MEMORY_BUDGET_MB, as_of_dates=None, layout=OUTPUT_LAYOUT):
+    """
+    Последовательно обрабатывает группы разделов, в памяти одновременно находится только одна группа.
+    Лучшие показания выбираются на каждую из дат as_of_dates, как в main
+
+    Возвращает:
+        generator: Части итоговых таблиц (см. process_unit), по одной на группу разделов
+    """
+    units = store.plan_units(memory_budget_mb)
+    logging.info(f"Обработка {store.n_partitions} разделов в {len(units)} группах, "
+                 f"бюджет памяти {memory_budget_mb} МБ")
+    summaries = []
+    for i, partitions in enumerate(units, 1):
+        tables = process_unit(store.load_unit(partitions), as_of_dates, layout, summaries)
+        if tables is None:
+            continue
+        logging.info(f"Группа разделов {i}/{len(units)} обработана")
+        yield tables
+    if VALIDATION:
+        log_summary(combine_summaries(summaries))
+
+
+def process_unit(date_of_files, as_of_dates=None, layout=OUTPUT_LAYOUT, summaries=None):
+    """
+    Удаление дублей и лучшие показания для данных группы разделов. При layout='wide' к лучшим показаниям
+    добавляются показания всех источников, при layout='long' они собираются в отдельную таблицу.
+    При VALIDATION к результату добавляются флаги проверки: флаги относятся к отдельным ПУ,
+    поэтому проверка по разделам совпадает с проверкой всех данных. Сводка проверки раздела
+    добавляется в список summaries, общая сводка выводится один раз (см. combine_summaries)
+
+    Возвращает:
+        dict: Части итоговых таблиц {'Result': ..., 'Readings': ... (при layout='long')}
+              или None, если в разделах нет данных
+    """
+    all_tables = [df for df, _ in date_of_files.values() if not df.empty]
+    if not all_tables:
+        return None
+    main_table = delete_duplicates(pd.concat(all_tables, ignore_index=True))
+    best = add_best_readings(main_table, date_of_files, as_of_dates)
+    del main_table, all_tables
+    if layout == 'long':
+        tables = {'Result': best, 'Readings': long_readings(date_of_files, COLS_KP)}
+    else:
+        tables = {'Result': add_additional_readings(best, date_of_files, COLS_KP)}
+    if VALIDATION:
+        flags = SourceFlags(date_of_files, meters=tables['Result']['Номер ПУ'])
+        tables['Result'] = add_validation_flags(tables['Result'], flags, as_of_periods(as_of_dates))
+        if summaries is not None:
+            summaries.append(flags.summary())
+    return tables
+
+
+def write_tables_stream(units, output_folder='output', spill_folder=SPILL_DIR, sources=None, codes=SOURCE_CODES):
+    """
+    Записывает части итоговых таблиц, не собирая таблицы в памяти: части результата сразу дописываются
+    в файл Excel, части таблицы показаний сбрасываются на диск и записываются во второй файл после результата.
+    Источники записываются, как в save_output: именами файлов или кодами (codes=True), таблица источников -
+    отдельным файлом
+
+    Параметры:
+        units (iterable): Части итоговых таблиц (см. process_unit)
+        output_folder (str): Папка для сохранения
+        spill_folder (str): Папка для частей таблицы показаний
+        sources (pd.DataFrame): Таблица источников (см. source_table), None - не записывается
+        codes (bool): Записывать коды источников вместо имён файлов
+
+    Возвращает:
+        dict: {'Result': путь к файлу результата, 'Readings': путь к файлу показаний (если есть)}
+    """
+    os.makedirs(spill_folder, exist_ok=True)
+    readings_paths = []
+
+    def results():
+        for tables in units:
+            if codes:
+                tables = {name: encode_sources(table) for name, table in tables.items()}
+            if 'Readings' in tables:
+                path = os.path.join(spill_folder, f'readings-{len(readings_paths):05d}.pkl')
+                with open(path, 'wb') as f:
+                    pickle.dump(tables['Readings'], f, protocol=pickle.HIGHEST_PROTOCOL)
+                readings_paths.append(path)
+            yield tables['Result']
+
+    def readings():
+        for path in readings_paths:
+            with open(path, 'rb') as f:
+                yield pickle.load(f)
+            os.remove(path)
+
+    paths = {'Result': write_excel_stream(results(), 'Result', output_folder=output_folder)}
+    if readings_paths:
+        paths['Readings'] = write_excel_stream(readings(), 'Readings', output_folder=output_folder)
+    if paths['Result'] and sources is not None and not sources.empty:
+        save_to_excel(sources, 'Sources', output_folder=output_folder)
+    return paths
+
+
+def write_excel_stream(frames, file_name, output_folder='output', file_prefix='cleaned'):
+    """
+    Построчно записывает части таблицы в один файл Excel, не собирая таблицу в памяти.
+    Столбцы берутся из первой части, при превышении лимита строк Excel создаётся новый лист
+
+    Параметры:
+        frames (iterable): Части таблицы с одинаковыми столбцами
+        file_name (str): Имя для генерации имени файла, как в save_to_excel
+        output_folder (str): Папка для сохранения
+        file_prefix (str): Префикс имени файла
+
+    Возвращает:
+        str: Путь к сохраненному файлу или None, если записывать нечего
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filepath = os.path.join(output_folder, f"{timestamp}_{file_prefix}_{file_name.replace('/', '_')}.xlsx")
+
+    total_rows = write_excel(frames, filepath, max_rows=EXCEL_MAX_ROWS)
+    if not total_rows:
+        logging.info("Нет строк для сохранения")
+        return None
+    logging.info(f"Файл успешно сохранен: {filepath} ({total_rows} строк)")
+    return filepath
@@ -0,0 +1,98 @@
+"""
+output.py
+Итоговые таблицы и их запись. Источники в таблицах результата хранятся кодами (категория pandas,
+см. source_codes), сведения о каждом источнике - один раз в таблице источников.
+При записи коды заменяются именами файлов или остаются кодами, если задано SOURCE_CODES
+"""
+import os
+
+import pandas as pd
+
+from core.config import *
+from core.checkpoint import file_content_hash
+from core.processor import source_names, save_to_excel, save_readings
+from core.registry import load_registry, attach_attributes
+
+# Столбцы таблицы источников
+SOURCE_TABLE_COLUMNS = ['Код', 'Файл', 'Формат', 'Хеш', 'Загружен']
+
+
+def source_table(date_of_files):
+    """
+    Таблица источников: код (номер n в столбцах '..._n'), путь к файлу, формат,
+    хеш содержимого и время загрузки. Хеш вычисляется при загрузке (см. process_file),
+    файл хешируется заново, только если хеша в атрибутах источника нет
+
+    Параметры:
+        date_of_files (dict): Источники {имя_файла: [df, формат]}
+
+    Возвращает:
+        pd.DataFrame: Строка на источник, столбцы SOURCE_TABLE_COLUMNS
+    """
+    rows = []
+    for code, name in enumerate(source_names(date_of_files), start=1):
+        data, format = date_of_files[name]
+        file_hash = data.attrs.get('Хеш') or file_content_hash(name)
+        rows.append([code, name, format, file_hash, data.attrs.get('Загружен', pd.NaT)])
+    return pd.DataFrame(rows, columns=SOURCE_TABLE_COLUMNS)
+
+
+def is_source_column(table, col):
+    """Столбец с кодами источников: 'Источник' лучших показаний (и его варианты по периодам) или 'Файл_n'"""
+    return (str(col).startswith(('Источник', 'Файл_'))
+            and isinstance(table[col].dtype, pd.CategoricalDtype))
+
+
+def encode_sources(table):
+    """
+    Заменяет в таблице имена источников их кодами из таблицы источников (1, 2, ...), пустые значения остаются пустыми
+
+    Возвращает:
+        pd.DataFrame: Таблица с целочисленными кодами источников
+    """
+    codes = {col: (table[col].cat.codes + 1).astype('Int32').where(table[col].notna())
+             for col in table.columns if is_source_column(table, col)}
+    return table.assign(**codes) if codes else table
+
+
+def output_tables(result, date_of_files, readings=None):
+    """
+    Итоговые таблицы для записи
+
+    Возвращает:
+        dict: {'Result': результат, 'Readings': таблица показаний (если есть), 'Sources': таблица источников}
+    """
+    tables = {'Result': result}
+    if readings is not None:
+        tables['Readings'] = readings
+    tables['Sources'] = source_table(date_of_files)
+    return tables
+
+
+def save_output(tables, output_folder='output', codes=SOURCE_CODES):
+    """
+    Записывает итоговые таблицы: к результату добавляются сведения о ПУ из реестра папки результата,
+    источники записываются именами файлов или кодами (codes=True), таблица источников - отдельным файлом
+
+    Параметры:
+        tables (dict): Результат output_tables
+        output_folder (str): Папка для сохранения
+        codes (bool): Записывать коды источников вместо имён файлов
+
+    Возвращает:
+        str: Путь к файлу результата
+    """
+    result, readings = tables['Result'], tables.get('Readings')
+    # Сведения о ПУ добавляются один раз к готовому результату
+    if METER_REGISTRY:
+        result = attach_attributes(result, load_registry(os.path.join(output_folder, METER_REGISTRY_FILE)))
+    if codes:
+        result = encode_sources(result)
+        readings = encode_sources(readings) if readings is not None else None
+
+    path = save_to_excel(result, 'Result', output_folder=output_folder)
+    if readings is not None:
+        save_readings(readings, 'Readings', output_folder=output_folder)
+    if not tables['Sources'].empty:
+        save_to_excel(tables['Sources'], 'Sources', output_folder=output_folder)
+    return path
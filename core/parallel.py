@@ -0,0 +1,130 @@
+"""
+parallel.py
+Параллельное удаление дублей и выбор лучших показаний.
+Показания всех источников делятся на разделы по хешу номера ПУ, разделы обрабатываются
+независимо в пуле процессов, результат собирается в порядке номеров ПУ.
+Результат совпадает с обработкой в одном процессе
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from core.config import *
+from core.processor import (meter_partition, delete_duplicates, prepare_best_columns, add_best_readings,
+                            as_of_periods)
+
+
+def split_table(table, n_partitions):
+    """
+    Делит таблицу на разделы по хешу номера ПУ. Порядок строк внутри раздела сохраняется,
+    пустые разделы сохраняют типы столбцов исходной таблицы
+
+    Возвращает:
+        list: Список из n_partitions таблиц
+    """
+    if 'Номер ПУ' not in table.columns or table.empty:
+        return [table.iloc[:0]] * n_partitions
+    parts = [table.iloc[:0]] * n_partitions
+    for partition, piece in table.groupby(meter_partition(table['Номер ПУ'], n_partitions), sort=False):
+        parts[int(partition)] = piece
+    return parts
+
+
+def split_sources(date_of_files, n_partitions, offset_index=False):
+    """
+    Делит все источники на разделы
+
+    Параметры:
+        date_of_files (dict): Словарь {имя_файла: [df, формат]}
+        n_partitions (int): Число разделов
+        offset_index (bool): Пронумеровать строки так же, как pd.concat(..., ignore_index=True)
+                             по всем источникам
+
+    Возвращает:
+        list: Для каждого раздела словарь {имя_файла: [df раздела, формат]}
+    """
+    partitions = [dict() for _ in range(n_partitions)]
+    offset = 0
+    for name, (df, format) in date_of_files.items():
+        if offset_index:
+            df = df.set_axis(pd.RangeIndex(offset, offset + len(df)))
+            offset += len(df)
+        for partition, piece in enumerate(split_table(df, n_partitions)):
+            partitions[partition][name] = [piece, format]
+    return partitions
+
+
+def _combine_partition(date_of_files):
+    """Удаление дублей в одном разделе (выполняется в отдельном процессе)"""
+    all_tables = [df for df, _ in date_of_files.values()]
+    # Пустые части источников не участвуют в определении типов, как и при обработке в одном процессе
+    return delete_duplicates(pd.concat([df for df in all_tables if not df.empty] or all_tables))
+
+
+def _best_partition(args):
+    """Выбор лучших показаний в одном разделе (выполняется в отдельном процессе)"""
+    main_table, date_of_files, as_of_dates = args
+    return add_best_readings(main_table, date_of_files, as_of_dates)
+
+
+def _n_partitions(workers):
+    return max(1, workers * PARALLEL_PARTITIONS_PER_WORKER)
+
+
+def parallel_combine_sources(date_of_files, workers=PARALLEL_WORKERS):
+    """
+    Объединяет источники и удаляет дубли параллельно по разделам.
+    Результат совпадает с delete_duplicates(pd.concat(таблицы, ignore_index=True))
+
+    Параметры:
+        date_of_files (dict): Словарь {имя_файла: [df, формат]}
+        workers (int): Число процессов
+
+    Возвращает:
+        pd.DataFrame: Таблица без дубликатов, отсортированная по номеру ПУ
+    """
+    n_partitions = _n_partitions(workers)
+    total_rows = sum(len(df) for df, _ in date_of_files.values())
+    logging.info(f'Объединено {len(date_of_files)} файлов. До удаления дублей {total_rows} строк, '
+                 f'обработка в {workers} процессах по {n_partitions} разделам')
+    partitions = split_sources(date_of_files, n_partitions, offset_index=True)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_child_logging,
+                             initargs=child_logging()) as executor:
+        parts = list(executor.map(_combine_partition, partitions))
+    # Номера ПУ после удаления дублей уникальны, поэтому порядок сборки однозначен
+    return pd.concat(parts).sort_values(by='Номер ПУ', kind='mergesort')
+
+
+def parallel_best_readings(main_table, date_of_files, workers=PARALLEL_WORKERS, as_of_dates=None):
+    """
+    Параллельный вариант add_best_readings: лучшие показания для ПУ каждого раздела
+    выбираются независимо. Строки результата идут в том же порядке и с теми же индексами,
+    что и в main_table
+
+    Параметры:
+        main_table (pd.DataFrame): Основная таблица с данными ПУ
+        date_of_files (dict): Словарь {имя_файла: [df, формат]}
+        workers (int): Число процессов
+        as_of_dates (list): Даты, на которые выбираются лучшие показания, None - сегодня
+
+    Возвращает:
+        pd.DataFrame: Таблица с лучшими показаниями в первых столбцах
+    """
+    # Периоды определяются один раз, чтобы все процессы считали на одну дату
+    periods = as_of_periods(as_of_dates)
+    as_of_dates = [pd.Timestamp(year=year, month=month, day=1) for month, year in periods]
+    n_partitions = _n_partitions(workers)
+    main_parts = split_table(main_table, n_partitions)
+    source_parts = split_sources(date_of_files, n_partitions)
+    tasks = [(main_part, sources, as_of_dates) for main_part, sources in zip(main_parts, source_parts) if not main_part.empty]
+    logging.info(f"Выбор лучших показаний в {workers} процессах по {len(tasks)} разделам")
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_child_logging,
+                             initargs=child_logging()) as executor:
+        parts = list(executor.map(_best_partition, tasks))
+    if not parts:
+        return add_best_readings(main_table, date_of_files, as_of_dates)
+    result = pd.concat(parts).loc[main_table.index]
+    # Разделы без показаний дают столбцы типа object, приводим типы так же, как в одном процессе
+    _, best_columns = prepare_best_columns(main_table.iloc[:0], periods)
+    return result.astype({col: result[col].infer_objects().dtype for col in best_columns})
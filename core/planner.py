@@ -0,0 +1,208 @@
+"""
+planner.py
+План запуска без загрузки данных (python main.py --dry-run): по размерам файлов, размерам листов
+и первым строкам каждого источника оцениваются число строк, пересечение ПУ между источниками,
+ширина результата, пиковая память и время этапов. Модуль не зависит от pandas и openpyxl
+"""
+import logging
+import struct
+import zipfile
+
+from core.config import *
+from core.archives import open_source, is_plain_file, source_name, source_size, split_member
+from core.formats import find_all_files
+from core.scheduler import load_cost_model, estimate_cost, stage_model
+from core.sniffer import detect_format, xlsx_sample
+
+# Номер первой строки данных (с 1) и номер столбца с номером ПУ (с 0) для каждого формата,
+# как их читает loader.py (EXCEL_READ_PARAMS и SIMS_READ_PARAMS)
+DATA_START_ROW = {'PYRAMIDA': 6, 'TELESCOP': 4, 'EMIS': 4, 'SIMS': 3}
+METER_COLUMN = {
+    'PYRAMIDA': PYRAMIDA_NEEDED_COLS[NEW_NAMES.index('Номер ПУ')],
+    'TELESCOP': TELESCOP_NEEDED_COLS[TELESCOP_NEW_NAMES.index('Номер ПУ')],
+    'EMIS': EMIS_NEEDED_COLS[EMIS_NEW_NAMES.index('Номер ПУ')],
+    'SIMS': SIMS_NEEDED_COLS[SIMS_NEW_NAMES.index('Номер ПУ')],
+}
+
+# Столбцов лучших показаний на период (BEST_COLUMNS в processor.py) и столбцов показаний на источник
+BEST_COLUMNS_COUNT = 6
+SOURCE_COLUMNS_COUNT = 5
+
+
+def data_size(file_path):
+    """
+    Размер данных без сжатия в байтах. Для сжатых gzip файлов - из последних байт файла,
+    для сжатых внутри архива zstd и gzip - оценка по PLAN_COMPRESSION_RATIO
+    """
+    archive_path, member = split_member(file_path)
+    try:
+        if member is None:
+            if file_path.endswith('.gz'):
+                # Размер без сжатия по модулю 2^32 записан в последних четырёх байтах
+                with open(file_path, 'rb') as f:
+                    f.seek(-4, 2)
+                    return struct.unpack('<I', f.read(4))[0]
+            if not file_path.endswith('.zst'):
+                return source_size(file_path)
+        elif not member.endswith(('.gz', '.zst')):
+            with zipfile.ZipFile(archive_path) as archive:
+                return archive.getinfo(member).file_size
+    except (OSError, KeyError, zipfile.BadZipFile, struct.error):
+        return 0
+    return source_size(file_path) * PLAN_COMPRESSION_RATIO
+
+
+def sample_xlsx(file_path, format):
+    """Оценка числа строк листа и номера ПУ первых строк книги, лежащей на диске без сжатия"""
+    sample = xlsx_sample(file_path, PLAN_SAMPLE_BYTES)
+    start, column = DATA_START_ROW[format], METER_COLUMN[format]
+    data_rows = [cells for number, cells in sample['rows'] if number >= start]
+    if sample['last_row'] is not None:
+        rows = max(sample['last_row'] - start + 1, 0)
+    elif sample['rows'] and sample['sample_bytes']:
+        # Нет размеров листа: число строк по среднему размеру прочитанных строк
+        rows = max(round(sample['sheet_bytes'] * len(sample['rows']) / sample['sample_bytes']) - start + 1, 0)
+    else:
+        rows = 0
+    return rows, [cells[column] for cells in data_rows if column in cells]
+
+
+def sample_csv(file_path, format):
+    """Оценка числа строк файла CSV по среднему размеру первых строк и номера ПУ этих строк"""
+    with open_source(file_path) as f:
+        head = f.read(PLAN_SAMPLE_BYTES)
+    lines = head.split(b'\n')
+    if len(head) == PLAN_SAMPLE_BYTES:
+        # Последняя строка прочитана не полностью
+        lines = lines[:-1]
+    lines = [line for line in lines if line.strip()]
+    if not lines:
+        return 0, []
+    line_bytes = sum(len(line) + 1 for line in lines) / len(lines)
+    start, column = DATA_START_ROW[format], METER_COLUMN[format]
+    rows = max(round(data_size(file_path) / line_bytes) - start + 1, 0)
+    meters = []
+    for line in lines[start - 1:]:
+        values = line.decode('windows-1251', errors='replace').split(';')
+        if column < len(values):
+            meters.append(values[column])
+    return rows, meters
+
+
+def sample_file(file_path, format):
+    """
+    Оценка числа строк данных и номера ПУ первых строк файла
+
+    Возвращает:
+        tuple: (число строк, список номеров ПУ первых строк), (0, []) если файл не читается
+    """
+    try:
+        if format == 'SIMS':
+            return sample_csv(file_path, format)
+        xlsx = source_name(file_path).lower().endswith('.xlsx')
+        if xlsx and is_plain_file(file_path):
+            return sample_xlsx(file_path, format)
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+        logging.debug("Не удалось прочитать начало файла %s: %s", file_path, e)
+        return 0, []
+    # Для xlsb строки оцениваются по размеру файла. Сжатую или лежащую в архиве книгу xlsx
+    # пришлось бы распаковать целиком, поэтому её строки тоже оцениваются по размеру
+    bytes_per_row = PLAN_XLSX_BYTES_PER_ROW if xlsx else PLAN_XLSB_BYTES_PER_ROW
+    return round(data_size(file_path) / bytes_per_row), []
+
+
+def estimate_meters(rows, samples):
+    """
+    Оценка числа разных ПУ по первым строкам источников: доля разных номеров среди всех прочитанных
+    номеров переносится на все строки. Источники одного района обычно перечисляют ПУ в одном порядке,
+    если порядок разный, пересечение занижается и число ПУ оценивается сверху
+    >>> estimate_meters(300, [['1', '2', '3'], ['1', '2', '3'], ['1', '2', '4']])
+    133
+    """
+    sampled = sum(len(meters) for meters in samples)
+    if not sampled:
+        return rows
+    distinct = len(set().union(*samples))
+    return round(rows * distinct / sampled)
+
+
+def plan_run(files, layout=OUTPUT_LAYOUT, n_periods=1, model=None):
+    """
+    Оценивает запуск без загрузки данных
+
+    Параметры:
+        files (list): Список путей к файлам
+        layout (str): Вид результата, 'wide' или 'long'
+        n_periods (int): Число отчётных периодов (дат лучших показаний)
+        model (dict): Модель стоимости, по умолчанию - уточнённая по прошлым запускам
+
+    Возвращает:
+        dict: План запуска: 'files' - список (путь, формат, строк, оценка загрузки в сек), 'rows', 'meters',
+              'overlap' - доля повторных номеров ПУ, 'result_rows', 'result_columns', 'readings_rows',
+              'memory_mb', 'fits_memory', 'stages' - оценка времени этапов в сек
+    """
+    model = model if model is not None else load_cost_model()
+    stages = stage_model(model)
+    planned, samples = [], []
+    for name in files:
+        format = detect_format(name)
+        if format is None:
+            continue
+        rows, meters = sample_file(name, format)
+        planned.append((name, format, rows, estimate_cost(name, model, format)))
+        samples.append(meters)
+
+    rows = sum(item[2] for item in planned)
+    meters = estimate_meters(rows, samples)
+    best_columns = n_periods * (BEST_COLUMNS_COUNT + (1 if VALIDATION else 0))
+    result_columns = 1 + best_columns + len(METER_ATTRIBUTES)
+    # Заполненные ячейки: лучшие показания и сведения о ПУ на каждый ПУ, показания источников на каждую строку
+    cells = meters * result_columns + rows * SOURCE_COLUMNS_COUNT
+    if layout == 'long':
+        readings_rows = rows
+        cells += rows
+    else:
+        readings_rows = 0
+        result_columns += SOURCE_COLUMNS_COUNT * len(planned)
+
+    load_costs = [item[3] for item in planned]
+    load_sec = max(max(load_costs, default=0.0), sum(load_costs) / MAX_WORKERS)
+    memory_mb = rows * stages['bytes_per_row'] * OUT_OF_CORE_MEMORY_FACTOR / 2 ** 20
+    return {
+        'files': planned,
+        'rows': rows,
+        'meters': meters,
+        'overlap': 1 - meters / rows if rows else 0.0,
+        'result_rows': meters,
+        'result_columns': result_columns,
+        'readings_rows': readings_rows,
+        'memory_mb': memory_mb,
+        'fits_memory': memory_mb <= MEMORY_BUDGET_MB,
+        'stages': {'load': load_sec,
+                   'process': rows * stages['process_sec_per_mrow'] / 1e6,
+                   'write': cells * stages['write_sec_per_mcell'] / 1e6},
+    }
+
+
+def format_plan(plan):
+    """Текст плана запуска для вывода в консоль"""
+    lines = [f"{format}\t{rows} строк\t~{cost:.1f} сек\t{name}" for name, format, rows, cost in plan['files']]
+    lines += [
+        f"Файлов: {len(plan['files'])}, строк: {plan['rows']}, ПУ: ~{plan['meters']} "
+        f"(повторных номеров {plan['overlap']:.0%})",
+        f"Результат: {plan['result_rows']} строк x {plan['result_columns']} столбцов"
+        + (f", таблица показаний: {plan['readings_rows']} строк" if plan['readings_rows'] else ''),
+        f"Пиковая память: ~{plan['memory_mb']:.0f} МБ из {MEMORY_BUDGET_MB} МБ",
+        "Время: " + ', '.join(f"{stage} ~{sec:.1f} сек" for stage, sec in plan['stages'].items())
+        + f", всего ~{sum(plan['stages'].values()):.1f} сек",
+    ]
+    if not plan['fits_memory']:
+        lines.append("Данные не помещаются в память: задайте OUT_OF_CORE = True в config.py")
+    return '\n'.join(lines)
+
+
+def dry_run(folder=PATH_TO_DATA, layout=OUTPUT_LAYOUT, n_periods=1):
+    """Выводит план запуска по файлам папки с данными без загрузки данных"""
+    plan = plan_run(find_all_files(folder), layout, n_periods)
+    print(format_plan(plan))
+    return plan
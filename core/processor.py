@@ -2,59 +2,17 @@
 """
 Модуль с функциями для сбора КП из нескольких файлов разных форматов в один файл
 """
+import numpy as np
 import pandas as pd
 import os
+from collections import Counter
 from datetime import datetime
+from openpyxl import Workbook
 from core.config import *
+from core.formats import find_all_files, identific_format_file
 
-
-
-def find_all_files(folder_path=PATH_TO_DATA):
-    """
-    Ищет и возврашает список всех файлов в указанной дериктории. По умолчанию ищет по пути указаному в config.py
-    >>> 'TEST_DATA/2025-06-18 Отчет КУЭМ (21).xlsx' in find_all_files('TEST_DATA')
-    True
-    >>> 'TEST_DATA/2025-05-19 Симс.csv' in find_all_files('TEST_DATA')
-    True
-    >>> 'TEST_DATA/2025-06-18 для ткста поиска файлов.xlsx' in find_all_files('TEST_DATA')
-    True
-    >>> 'TEST_DATA/2025-06-18 Ведомость опроса для выгрузки в КУЭМ по ЭМИС.xlsx' in find_all_files('TEST_DATA')
-    True
-    >>> 'TEST_DATA/2025-06-18 Ведомость опроса для выгрузки в КУЭМ (с типом ПУ без AD) (тчк).xlsx' in find_all_files('TEST_DATA')
-    True
-    """
-    name_all_files = [os.path.join(folder_path, f) for f in os.listdir(folder_path)
-                      if f.endswith((".xlsx", ".csv"))]
-    return name_all_files
-
-
-def identific_format_file(name_file):
-    """
-    Определяет формат содержащихся данных по имени файла
-    name_file: Имя файла с данными
-    return: Формат данных
-    >>> identific_format_file('2025-06-18 Ведомость опроса для выгрузки в КУЭМ по ЭМИС.xlsx')
-    'EMIS'
-    >>> identific_format_file('2025-06-18 Ведомость опроса для выгрузки в КУЭМ (с типом ПУ без AD) (тчк).xlsx')
-    'TELESCOP'
-    >>> identific_format_file('2025-06-18 Отчет КУЭМ (20).xlsx')
-    'PYRAMIDA'
-    >>> identific_format_file('2025-05-19 Симс.csv')
-    'SIMS'
-    >>> identific_format_file('2025-05-19.txt') is None
-    True
-    """
-    if NAME_FILES_PYRAMIDA in name_file:
-        format_file = 'PYRAMIDA'
-    elif NAME_FILES_TELESCOP in name_file:
-        format_file = 'TELESCOP'
-    elif NAME_FILES_SIMS in name_file:
-        format_file = 'SIMS'
-    elif NAME_FILES_EMIS in name_file:
-        format_file = 'EMIS'
-    else:
-        format_file = None
-    return format_file
+# Столбцы с лучшими показаниями, которые добавляются в начало таблицы
+BEST_COLUMNS = ['Дата КП', 'Общий', 'День', 'Ночь', 'Источник', 'Примечание']
 
 
 def normalize_meter_number(meter_num):
@@ -63,8 +21,81 @@ def normalize_meter_number(meter_num):
         return meter_num
     # Преобразуем в строку и удаляем ведущие нули
     return str(meter_num).lstrip('0') or '0'  # Если осталась пустая строка, возвращаем '0'
+
+
+def meter_partition(meter_numbers, n_partitions):
+    """
+    Номер раздела для каждого номера ПУ по хешу номера. Хеш не зависит от процесса и запуска,
+    поэтому все показания одного ПУ из любых источников попадают в один раздел
+    >>> parts = meter_partition(pd.Series(['1102003', '1102007', '1102003']), 8)
+    >>> int(parts[0]) == int(parts[2]) and all(0 <= p < 8 for p in parts)
+    True
+    """
+    values = pd.Series(meter_numbers).astype(str).to_numpy(dtype=object)
+    return pd.util.hash_array(values) % n_partitions
     
 
+def normalize_readings(table, date_column='Дата КП', id_column='Номер ПУ'):
+    """Приводит номера ПУ и даты к виду, в котором сравниваются показания (таблица изменяется на месте)"""
+    # Нормализуем номера счетчиков (удаляем ведущие нули)
+    table['Номер ПУ'] = table[id_column].apply(normalize_meter_number)
+
+    # Преобразуем даты, если они еще не в datetime
+    if not pd.api.types.is_datetime64_any_dtype(table[date_column]):
+        table[date_column] = pd.to_datetime(table[date_column], format='mixed', errors='coerce')
+
+    # Убедимся, что номер ПУ - строка
+    table[id_column] = table[id_column].astype(str)
+    return table
+
+
+def latest_positions(table, date_column='Дата КП', id_column='Номер ПУ'):
+    """
+    Позиции строк с самой свежей записью каждого ПУ в порядке убывания даты.
+    Сортируются только два столбца, а не вся таблица
+    """
+    order = table[date_column].reset_index(drop=True).sort_values(ascending=False, kind='mergesort').index
+    positions = order.to_numpy()
+    return positions[~pd.Series(table[id_column].to_numpy()[positions]).duplicated().to_numpy()]
+
+
+def keep_latest(table, date_column='Дата КП', id_column='Номер ПУ'):
+    """
+    Оставляет для каждого ПУ самую свежую запись.
+    Сортировка по дате устойчивая: при равных датах остается запись, встретившаяся раньше,
+    и результат не зависит от разбиения таблицы.
+    Строки выбираются одним take, без промежуточной отсортированной копии таблицы
+    """
+    return table.take(latest_positions(table, date_column, id_column))
+
+
+def reduce_latest_readings(chunks, date_column='Дата КП', id_column='Номер ПУ'):
+    """
+    Потоковое удаление дублей: в каждой порции строк сразу остаются только самые свежие показания ПУ,
+    и они объединяются с лучшими на данный момент. В памяти одновременно находятся одна порция
+    и по одной строке на ПУ. Результат совпадает с delete_duplicates для всех порций вместе
+
+    Параметры:
+        chunks (iterable): Порции строк одного источника в порядке следования в файле
+        date_column (str): Название столбца с датами
+        id_column (str): Название столбца с идентификаторами ПУ
+
+    Возвращает:
+        pd.DataFrame: Таблица без дубликатов, отсортированная по номеру ПУ, или None, если порций нет
+    """
+    best, total_rows = None, 0
+    for chunk in chunks:
+        total_rows += len(chunk)
+        chunk = keep_latest(normalize_readings(chunk, date_column, id_column), date_column, id_column)
+        # Лучшие на данный момент строки встретились в файле раньше порции, поэтому идут первыми
+        best = chunk if best is None else keep_latest(pd.concat([best, chunk]), date_column, id_column)
+    if best is None:
+        return None
+    best = best.sort_values(by=id_column)
+    logging.info(f"Удалено дубликатов: {total_rows - len(best)}")
+    return best
+
+
 def delete_duplicates(table, date_column='Дата КП', id_column='Номер ПУ'):
     """
     Удаляет дубликаты строк, оставляя только самые свежие показания для каждого прибора учета
@@ -89,27 +120,14 @@ def delete_duplicates(table, date_column='Дата КП', id_column='Номер
             raise ValueError(f"Столбец с датами '{date_column}' не найден")
         if id_column not in table.columns:
             raise ValueError(f"Столбец с номерами ПУ '{id_column}' не найден")
-        # Создаем копию таблицы для работы
-        table = table.copy()
-
-        # Нормализуем номера счетчиков (удаляем ведущие нули)
-        table['Номер ПУ'] = table[id_column].apply(normalize_meter_number)
-        
-        # Преобразуем даты, если они еще не в datetime
-        if not pd.api.types.is_datetime64_any_dtype(table[date_column]):
-            table[date_column] = pd.to_datetime(table[date_column], format='mixed', errors='coerce')
-
-        # Убедимся, что номер ПУ - строка
-        table[id_column] = table[id_column].astype(str)
-        
-        # Сортируем по дате (сначала самые свежие)
-        table = table.sort_values(by=date_column, ascending=False)
+        # Поверхностная копия: столбцы заменяются, а не изменяются, исходная таблица не меняется
+        table = normalize_readings(table.copy(deep=False), date_column, id_column)
 
-        # Удаляем дубликаты, оставляя первую (самую свежую) запись
-        cleaned_table = table.drop_duplicates(subset=[id_column], keep='first')
-
-        # Сортируем по номеру ПУ для удобства
-        cleaned_table = cleaned_table.sort_values(by=id_column)
+        # Удаляем дубликаты, оставляя самую свежую запись, и сортируем по номеру ПУ для удобства.
+        # Строки выбираются из таблицы один раз
+        positions = latest_positions(table, date_column, id_column)
+        positions = positions[table[id_column].to_numpy()[positions].argsort(kind='stable')]
+        cleaned_table = table.take(positions)
 
         logging.info(f"Удалено дубликатов: {len(table) - len(cleaned_table)}")
         return cleaned_table
@@ -202,8 +220,8 @@ def save_to_excel(table, file_name, output_folder='output', file_prefix='cleaned
         filename = f"{timestamp}_{file_prefix}_{new_name}.xlsx"
         filepath = os.path.join(output_folder, filename)
 
-        # Сохранение в двоичном формате Excel
-        table.to_excel(filepath, index=False, engine="openpyxl")
+        # Потоковая запись: пустые ячейки не записываются, разреженные столбцы уплотняются по порциям строк
+        write_excel([table], filepath, sheet_prefix='Sheet')
 
         logging.info(f"Файл успешно сохранен: {filepath}")
         return filepath
@@ -213,14 +231,89 @@ def save_to_excel(table, file_name, output_folder='output', file_prefix='cleaned
         raise
 
 
+def excel_values(column):
+    """Значения столбца для записи в Excel: пустые значения заменяются на None, такие ячейки не записываются"""
+    if isinstance(column.dtype, pd.SparseDtype):
+        column = column.sparse.to_dense()
+    values = column.astype(object).to_numpy(copy=True)
+    values[pd.isna(values)] = None
+    return values
+
+
+def write_excel(frames, filepath, sheet_prefix='Result_', max_rows=EXCEL_MAX_ROWS, chunk_rows=EXCEL_WRITE_CHUNK_ROWS):
+    """
+    Записывает части таблицы в один файл Excel в потоковом режиме openpyxl: в памяти остаётся одна порция
+    строк, пустые ячейки в файл не попадают. Столбцы берутся из первой части,
+    при превышении лимита строк создаётся новый лист
+
+    Параметры:
+        frames (iterable): Части таблицы с одинаковыми столбцами
+        filepath (str): Путь к файлу
+        sheet_prefix (str): Начало имени листа, к нему добавляется номер листа
+        max_rows (int): Строк данных на листе
+        chunk_rows (int): Строк в одной порции записи
+
+    Возвращает:
+        int: Число записанных строк, 0 - файл не создан
+    """
+    workbook = Workbook(write_only=True)
+    sheet, columns, sheet_rows, total_rows = None, None, 0, 0
+    for frame in frames:
+        if columns is None:
+            columns = list(frame.columns)
+        frame = frame.reindex(columns=columns)
+        for start in range(0, len(frame), chunk_rows):
+            chunk = frame.iloc[start:start + chunk_rows]
+            for row in zip(*(excel_values(chunk[col]) for col in chunk.columns)):
+                if sheet is None or sheet_rows >= max_rows:
+                    sheet = workbook.create_sheet(f'{sheet_prefix}{len(workbook.worksheets) + 1}')
+                    sheet.append(columns)
+                    sheet_rows = 0
+                sheet.append(row)
+                sheet_rows += 1
+                total_rows += 1
+    if sheet is None:
+        return 0
+    workbook.save(filepath)
+    return total_rows
+
+
+def save_readings(table, file_name, output_folder='output', file_prefix='cleaned'):
+    """
+    Сохраняет таблицу показаний в длинном формате. Если строк больше, чем помещается на лист Excel,
+    таблица сохраняется в CSV (разделитель ';', кодировка utf-8-sig)
+
+    Возвращает:
+        str: Полный путь к сохраненному файлу
+    """
+    if len(table) <= EXCEL_MAX_ROWS:
+        return save_to_excel(table, file_name, output_folder, file_prefix)
+    try:
+        os.makedirs(output_folder, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filepath = os.path.join(output_folder, f"{timestamp}_{file_prefix}_{file_name.replace('/', '_')}.csv")
+        logging.warning(f"Показаний {len(table)} - больше, чем помещается на лист Excel, сохранение в CSV")
+        table.to_csv(filepath, sep=';', index=False, encoding='utf-8-sig')
+        logging.info(f"Файл успешно сохранен: {filepath}")
+        return filepath
+    except Exception as e:
+        print(f"Критическая ошибка сохранения: {str(e)}")
+        raise
+
+
 def get_best_readings(pu, kp_data_list, current_month_year):
-    """Выбирает лучшие показания для одного ПУ по заданным правилам"""
-    logging.debug(f"Поиск лучших показаний для ПУ {pu}")
+    """
+    Выбирает лучшие показания для одного ПУ по заданным правилам.
+    Прежняя реализация правил, используется как эталон в reference.py. add_best_readings выбирает
+    показания всех ПУ сразу через best_readings_by_period, результат совпадает с этой функцией,
+    если у кандидатов есть общее значение и дата. Здесь пустые общее значение и дата несравнимы
+    с остальными, и выбор зависит от порядка источников; add_best_readings ставит показания
+    без общего значения после показаний с ним, а без даты - после показаний с датой
+    """
     pu_data = []
 
     for name, kp_data in kp_data_list:
         if 'Номер ПУ' not in kp_data.columns:
-            logging.debug(f"В файле {name} отсутствует столбец 'Номер ПУ'")
             continue
 
         pu_kp = kp_data[kp_data['Номер ПУ'] == pu]
@@ -277,47 +370,299 @@ def get_best_readings(pu, kp_data_list, current_month_year):
     }
 
 
+def as_of_periods(as_of_dates=None):
+    """
+    Отчётные периоды (месяц, год) для дат, на которые выбираются лучшие показания.
+    Повторяющиеся периоды отбрасываются, None - текущий месяц
+    >>> as_of_periods(['2025-05-31', '2025-04-01', '2025-05-01'])
+    [(5, 2025), (4, 2025)]
+    """
+    if as_of_dates is None:
+        as_of_dates = [pd.to_datetime('today')]
+    periods = []
+    for date in as_of_dates:
+        date = pd.Timestamp(date)
+        if (date.month, date.year) not in periods:
+            periods.append((date.month, date.year))
+    return periods
+
+
+def period_best_columns(periods):
+    """
+    Названия столбцов лучших показаний для каждого периода.
+    Для одного периода столбцы называются как BEST_COLUMNS, для нескольких - с суффиксом периода
+    >>> period_best_columns([(5, 2025), (4, 2025)])[1][:2]
+    ['Дата КП 04.2025', 'Общий 04.2025']
+    """
+    if len(periods) == 1:
+        return [list(BEST_COLUMNS)]
+    return [[f"{col} {month:02d}.{year}" for col in BEST_COLUMNS] for month, year in periods]
+
+
+def source_names(date_of_files):
+    """
+    Источники с номерами ПУ в порядке date_of_files. Код источника - номер в этом списке, начиная с 1,
+    он же номер n в столбцах показаний источника '..._n'
+    """
+    return [name for name, (data, _) in date_of_files.items() if 'Номер ПУ' in data.columns]
+
+
+def source_codes(names, codes):
+    """
+    Столбец источников: категория со всеми источниками, в строках хранятся только коды (-1 - нет источника).
+    Полное имя файла хранится один раз, а не в каждой строке
+    """
+    return pd.Categorical.from_codes(codes, categories=pd.Index(names, dtype=object))
+
+
+def source_candidates(date_of_files):
+    """
+    Кандидаты на лучшие показания: самая свежая строка каждого ПУ из каждого источника,
+    источники идут в порядке date_of_files
+
+    Возвращает:
+        pd.DataFrame: Столбцы 'Номер ПУ', 'Дата КП', 'Общий', 'День', 'Ночь', 'Источник' (категория, см. source_codes)
+    """
+    columns = ['Номер ПУ', 'Дата КП', 'Общий', 'День', 'Ночь']
+    names = source_names(date_of_files)
+    frames, codes = [], []
+    for code, name in enumerate(names):
+        data = date_of_files[name][0]
+        if data.empty:
+            continue
+        frames.append(keep_latest(data.reindex(columns=columns)))
+        codes.append(np.full(len(frames[-1]), code))
+    candidates = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+    candidates['Источник'] = source_codes(names, np.concatenate(codes) if codes else np.array([], dtype=int))
+    if not pd.api.types.is_datetime64_any_dtype(candidates['Дата КП']):
+        candidates['Дата КП'] = pd.to_datetime(candidates['Дата КП'], format='mixed', errors='coerce')
+    return candidates
+
+
+def best_positions_by_period(meters, candidates, periods):
+    """
+    Лучшие показания ПУ для каждого периода за один проход по кандидатам. Правила те же,
+    что в get_best_readings: сначала показания отчётного месяца, затем большее общее значение,
+    затем более ранняя дата, затем порядок источников. Показания без общего значения или без даты
+    уступают остальным при прочих равных (в get_best_readings их место зависит от порядка источников).
+    Кандидаты ранжируются один раз, для каждого периода меняется только первое правило.
+    Выбираются только номера строк, таблица кандидатов не копируется
+
+    Параметры:
+        meters (iterable): Номера ПУ
+        candidates (pd.DataFrame): Результат source_candidates
+        periods (list): Отчётные периоды [(месяц, год)]
+
+    Возвращает:
+        dict: {период: (позиции строк кандидатов для каждого ПУ из meters, -1 - показаний нет;
+                        примечания)}
+    """
+    meters = np.asarray(meters, dtype=object)
+    unique = pd.Index(pd.unique(meters))
+    codes = unique.get_indexer(candidates['Номер ПУ'])
+    total = pd.to_numeric(candidates['Общий'], errors='coerce').to_numpy(dtype=float)
+    dates = candidates['Дата КП']
+    no_date = dates.isna().to_numpy()
+    ranking = np.lexsort((np.arange(len(candidates)), dates.to_numpy(dtype='datetime64[ns]').view('i8'), no_date,
+                          -np.nan_to_num(total), np.isnan(total)))
+    ranking = ranking[codes[ranking] >= 0]
+    month, year = dates.dt.month.to_numpy()[ranking], dates.dt.year.to_numpy()[ranking]
+    # Для ПУ без показаний позиция -1 указывает на добавленный в конец признак "нет даты"
+    no_date = np.append(no_date, True)
+
+    def first_per_meter(positions):
+        chosen = np.full(len(unique), -1)
+        found, first = np.unique(codes[positions], return_index=True)
+        chosen[found] = positions[first]
+        return chosen
+
+    fallback = first_per_meter(ranking)
+    meter_index = unique.get_indexer(meters)
+    result = {}
+    for period_month, period_year in periods:
+        current = first_per_meter(ranking[(month == period_month) & (year == period_year)])
+        chosen = np.where(current >= 0, current, fallback)
+        notes = np.select([chosen < 0, no_date[chosen], current >= 0],
+                          ["Нет данных", "Нет даты", "Актуальные данные"], "Из предыдущих месяцев")
+        result[(period_month, period_year)] = (chosen[meter_index], notes[meter_index].astype(object))
+    return result
+
+
+def take_best(candidates, column, positions):
+    """Значения столбца кандидатов по позициям, для позиции -1 - пустое значение"""
+    return candidates[column].array.take(positions, allow_fill=True)
+
+
+def best_readings_by_period(meters, candidates, periods):
+    """
+    Лучшие показания ПУ для каждого периода (см. best_positions_by_period)
+
+    Возвращает:
+        dict: {период: pd.DataFrame с индексом по номеру ПУ и столбцами BEST_COLUMNS}
+    """
+    result = {}
+    for period, (positions, notes) in best_positions_by_period(meters, candidates, periods).items():
+        best = {col: take_best(candidates, col, positions) for col in BEST_COLUMNS[:-1]}
+        best['Примечание'] = notes
+        result[period] = pd.DataFrame(best, index=pd.Index(meters, name='Номер ПУ'))
+    return result
+
+
+def sparse_column(values, positions, dates=False):
+    """
+    Столбец источника по позициям строк результата: значения values в строках с positions >= 0,
+    остальные строки пустые. Числовые показания хранятся в разреженном виде - только заполненные значения,
+    плотный массив создаётся на время преобразования одного столбца.
+    Даты остаются плотными datetime64 (разреженные даты в pandas нельзя уплотнить при наличии пропусков),
+    нечисловые значения - плотными object. Пустой столбец получает тип по назначению: даты или показания
+    """
+    if values.isna().all():
+        values = pd.to_datetime(values) if dates else values.astype(float)
+    if pd.api.types.is_datetime64_any_dtype(values) or not pd.api.types.is_numeric_dtype(values):
+        return pd.api.extensions.take(values.to_numpy(), positions, allow_fill=True)
+    dense = pd.api.extensions.take(values.to_numpy(dtype=float), positions, allow_fill=True)
+    return pd.arrays.SparseArray(dense, fill_value=np.nan)
+
+
+def merge_positions(left_meters, right_meters):
+    """
+    Позиции строк левого соединения по номеру ПУ: для каждой строки результата - строка левой
+    и правой таблицы (-1, если в правой таблице ПУ нет). Порядок строк как у pd.merge(how='left')
+    """
+    right_index = pd.Index(right_meters)
+    if right_index.is_unique:
+        return np.arange(len(left_meters)), right_index.get_indexer(left_meters)
+    positions = pd.merge(pd.DataFrame({'Номер ПУ': left_meters, 'left': np.arange(len(left_meters))}),
+                         pd.DataFrame({'Номер ПУ': right_meters, 'right': np.arange(len(right_meters))}),
+                         on='Номер ПУ', how='left')
+    return positions['left'].to_numpy(), positions['right'].fillna(-1).to_numpy(dtype=np.int64)
+
+
 def add_additional_readings(result_table, date_of_files, cols_KP):
-    """Добавляет все показания справа с нумерацией"""
+    """
+    Добавляет все показания справа с нумерацией.
+    Каждый источник покрывает только часть ПУ, поэтому столбцы показаний источников хранятся
+    в разреженном виде (pd.SparseDtype), а столбец 'Файл_n' - кодом источника (см. source_codes)
+    """
     logging.info(f"Добавление дополнительных показаний из {len(date_of_files)} файлов")
     
+    names = source_names(date_of_files)
     counter = 1
     for name, (kp_data, _) in date_of_files.items():
         if 'Номер ПУ' not in kp_data.columns:
             logging.warning(f"В файле {name} отсутствует столбец 'Номер ПУ' - пропуск")
             continue
 
-        logging.debug(f"Обработка файла {name} (источник #{counter})")
-        kp_subset = kp_data[cols_KP].copy()
-        kp_subset[f'Файл_{counter}'] = name
-
-        cols_to_rename = [col for col in cols_KP if col != 'Номер ПУ']
-        kp_subset = kp_subset.rename(columns={col: f"{col}_{counter}" for col in cols_to_rename})
-
-        result_table = pd.merge(
-            result_table,
-            kp_subset,
-            on='Номер ПУ',
-            how='left'
-        )
+        logging.debug("Обработка файла %s (источник #%d)", name, counter)
+        left, right = merge_positions(result_table['Номер ПУ'].to_numpy(), kp_data['Номер ПУ'].to_numpy())
+        # Строки результата размножаются только при повторах номера ПУ в источнике
+        if len(left) != len(result_table):
+            result_table = result_table.take(left).reset_index(drop=True)
+        block = {f"{col}_{counter}": sparse_column(kp_data[col], right, dates=(col == 'Дата КП'))
+                 for col in cols_KP if col != 'Номер ПУ'}
+        block[f'Файл_{counter}'] = source_codes(names, np.where(right >= 0, counter - 1, -1))
+        result_table = result_table.assign(**block)
         counter += 1
     logging.info(f"Добавлено {counter-1} источников дополнительных показаний")    
     return result_table
 
 
-def prepare_best_columns(main_table):
-    """Подготавливает столбцы для лучших показаний"""
-    result_table = main_table.copy()
-    best_columns = ['Дата КП', 'Общий', 'День', 'Ночь', 'Источник', 'Примечание']
+def long_readings(date_of_files, cols_KP):
+    """
+    Все показания всех источников в длинном формате: строка на каждое показание ПУ в источнике,
+    вместо пяти столбцов на источник в add_additional_readings. Источник хранится кодом (см. source_codes),
+    строки упорядочены по номеру ПУ, показания одного ПУ - в порядке источников
 
-    for col in best_columns:
-        if col in result_table.columns:
-            result_table.drop(col, axis=1, inplace=True)
+    Параметры:
+        date_of_files (dict): Источники {имя_файла: [df, формат]}
+        cols_KP (list): Столбцы с показаниями
 
+    Возвращает:
+        pd.DataFrame: Столбцы 'Номер ПУ', 'Источник' и остальные столбцы cols_KP
+    """
+    columns = ['Номер ПУ', 'Источник'] + [col for col in cols_KP if col != 'Номер ПУ']
+    names = source_names(date_of_files)
+    for name in date_of_files:
+        if name not in names:
+            logging.warning(f"В файле {name} отсутствует столбец 'Номер ПУ' - пропуск")
+    tables = [date_of_files[name][0].reindex(columns=cols_KP) for name in names]
+    lengths = [len(data) for data in tables]
+    if not sum(lengths):
+        return pd.DataFrame(columns=columns)
+
+    table = pd.concat([data for data in tables if len(data)], ignore_index=True)
+    table['Источник'] = source_codes(names, np.repeat(np.arange(len(tables)), lengths))
+    # Сортировка по кодам номеров ПУ устойчивая, поэтому внутри ПУ сохраняется порядок источников.
+    # Строки без номера ПУ - в конце
+    codes, meters = pd.factorize(table['Номер ПУ'], sort=True)
+    codes[codes < 0] = len(meters)
+    table = table.take(np.argsort(codes, kind='stable'))[columns].reset_index(drop=True)
+    logging.info(f"Показания в длинном формате: {len(table)} строк из {sum(map(bool, lengths))} источников")
+    return table
+
+
+def prepare_best_columns(main_table, periods=None):
+    """
+    Подготавливает столбцы для лучших показаний одного или нескольких периодов.
+    Данные main_table не копируются: в результат только добавляются новые столбцы
+    """
+    best_columns = [col for columns in period_best_columns(periods or [None]) for col in columns]
+    result_table = main_table.drop(columns=[col for col in best_columns if col in main_table.columns])
     return result_table, best_columns
 
 
-def extern_table(main_table, date_of_files, cols_KP=COLS_KP):
+def add_best_readings(main_table, date_of_files, as_of_dates=None):
+    """
+    Добавляет в начало основной таблицы столбцы с лучшими показаниями для каждого ПУ.
+    Для нескольких дат отчёта лучшие показания выбираются за один проход по данным,
+    каждый период получает свой набор столбцов (см. period_best_columns)
+
+    Параметры:
+        main_table (pd.DataFrame): Основная таблица с данными ПУ
+        date_of_files (dict): Словарь с загруженными данными в формате {имя_файла: (df, формат)}
+        as_of_dates (list): Даты, на которые выбираются лучшие показания, None - сегодня
+
+    Возвращает:
+        pd.DataFrame: Таблица с лучшими показаниями в первых столбцах
+    """
+    # Подготовка
+    periods = as_of_periods(as_of_dates)
+    logging.info("Отчётные периоды для сравнения: %s", ', '.join(f"{m:02d}.{y}" for m, y in periods))
+
+    result_table, best_columns = prepare_best_columns(main_table, periods)
+    logging.info(f"Подготовлены столбцы для лучших показаний: {best_columns}")
+
+    # Собираем данные для обработки
+    logging.info(f"Получено {len(date_of_files)} источников данных для обработки")
+    for name, (data, _) in date_of_files.items():
+        if 'Номер ПУ' not in data.columns:
+            logging.warning(f"В файле {name} отсутствует столбец 'Номер ПУ' - источник не участвует в выборе")
+    candidates = source_candidates(date_of_files)
+
+    # Получаем лучшие показания для каждого ПУ и каждого периода
+    meters = result_table['Номер ПУ']
+    logging.info(f"Начало обработки {meters.nunique()} приборов учета")
+    best_positions = best_positions_by_period(meters, candidates, periods)
+
+    for period, columns in zip(periods, period_best_columns(periods)):
+        positions, notes = best_positions[period]
+        # Вместо сообщений по каждому ПУ - сводные счетчики
+        logging.info("Все приборы учета обработаны за %02d.%d: %s", period[0], period[1],
+                     ', '.join(f"{note} - {count}" for note, count in Counter(notes).most_common()))
+
+        # Добавляем лучшие показания в таблицу
+        for col, name in zip(BEST_COLUMNS[:-1], columns[:-1]):
+            result_table[name] = take_best(candidates, col, positions)
+        result_table[columns[-1]] = notes
+
+    # Переносим лучшие столбцы в начало
+    cols_order = best_columns + [col for col in result_table.columns if col not in best_columns]
+    result_table = result_table[cols_order]
+    logging.info("Лучшие показания добавлены в таблицу")
+    return result_table
+
+
+def extern_table(main_table, date_of_files, cols_KP=COLS_KP, as_of_dates=None):
     """
     Объединяет основную таблицу с показаниями из нескольких источников,
     добавляя лучшие показания и все доступные показания для каждого ПУ
@@ -326,6 +671,7 @@ def extern_table(main_table, date_of_files, cols_KP=COLS_KP):
         main_table (pd.DataFrame): Основная таблица с данными ПУ
         date_of_files (dict): Словарь с загруженными данными в формате {имя_файла: (df, формат)}
         cols_KP (list): Список столбцов с показаниями для сохранения
+        as_of_dates (list): Даты, на которые выбираются лучшие показания, None - сегодня
 
     Возвращает:
         pd.DataFrame: Объединенная таблица с лучшими и всеми доступными показаниями
@@ -340,39 +686,8 @@ def extern_table(main_table, date_of_files, cols_KP=COLS_KP):
     logging.info("Начало обработки extern_table")
 
     try:
-        # Подготовка
-        current_date = pd.to_datetime('today')
-        current_month_year = (current_date.month, current_date.year)
-        logging.info(f"Текущая дата для сравнения: {current_date}")
-        
-        result_table, best_columns = prepare_best_columns(main_table)
-        logging.info(f"Подготовлены столбцы для лучших показаний: {best_columns}")
-
-        # Собираем данные для обработки
-        kp_data_list = [(name, data) for name, (data, _) in date_of_files.items()]
-        logging.info(f"Получено {len(kp_data_list)} источников данных для обработки")
-
-        # Получаем лучшие показания для каждого ПУ
-        best_readings = {}
-        pu_count = len(result_table['Номер ПУ'].unique())
-        logging.info(f"Начало обработки {pu_count} приборов учета")
-        
-        for i, pu in enumerate(result_table['Номер ПУ'].unique(), 1):
-            if i % 1000 == 0 or i == pu_count:  # Логируем каждые 1000 ПУ и последний
-                logging.info(f"Обработано {i}/{pu_count} приборов учета ({i/pu_count:.1%})")
-            
-            best_readings[pu] = get_best_readings(pu, kp_data_list, current_month_year)
-        
-        logging.info("Все приборы учета обработаны, добавление лучших показаний в таблицу")
-
-        # Добавляем лучшие показания в таблицу
-        for col in best_columns:
-            result_table[col] = [best_readings[pu][col] for pu in result_table['Номер ПУ']]
-
-        # Переносим лучшие столбцы в начало
-        cols_order = best_columns + [col for col in result_table.columns if col not in best_columns]
-        result_table = result_table[cols_order]
-        logging.info("Лучшие показания добавлены в таблицу")
+        # Лучшие показания для каждого ПУ
+        result_table = add_best_readings(main_table, date_of_files, as_of_dates)
 
         # Добавляем все остальные показания
         logging.info("Начало добавления дополнительных показаний из всех источников")
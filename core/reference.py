@@ -0,0 +1,228 @@
+"""
+reference.py
+Эталонные реализации этапов обработки и их сравнение с рабочими реализациями на случайных данных.
+Эталоны - прежний прямолинейный код: удаление дублей сортировкой и drop_duplicates, выбор лучших показаний
+функцией get_best_readings для каждого ПУ, слияние pd.merge по каждому источнику. Ускоренные реализации
+processor.py должны повторять их результат в точности.
+Случайные источники содержат пустые даты и показания, одинаковые даты и показания, номера ПУ с ведущими нулями,
+источники без номеров ПУ и без показаний тарифов, пустые источники. В get_best_readings порядок показаний
+без общего значения или без даты не определён (такие значения несравнимы с остальными при сортировке),
+поэтому выбор лучших показаний сравнивается на строках с датой и общим значением; правила add_best_readings
+для пустых значений проверяются отдельно (tests/unit/test_processor.py)
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from core.config import *
+from core.processor import (BEST_COLUMNS, normalize_meter_number, as_of_periods, period_best_columns,
+                            source_names, get_best_readings, delete_duplicates, add_best_readings,
+                            add_additional_readings, extern_table)
+
+# Столбцы таблицы расхождений
+MISMATCH_COLUMNS = ['Проверка', 'Случай', 'Строка', 'Номер ПУ', 'Столбец', 'Ожидается', 'Получено']
+
+
+def reference_delete_duplicates(table, date_column='Дата КП', id_column='Номер ПУ'):
+    """
+    Эталон delete_duplicates - прежняя реализация: сортировка по дате (сначала самые свежие, пустые даты в конце),
+    первая строка каждого ПУ, сортировка по номеру ПУ. Сортировка устойчивая: из строк с одинаковой датой
+    остаётся первая
+    """
+    table = table.copy()
+    table[id_column] = table[id_column].apply(normalize_meter_number)
+    if not pd.api.types.is_datetime64_any_dtype(table[date_column]):
+        table[date_column] = pd.to_datetime(table[date_column], format='mixed', errors='coerce')
+    table[id_column] = table[id_column].astype(str)
+    table = table.sort_values(by=date_column, ascending=False, kind='stable')
+    cleaned_table = table.drop_duplicates(subset=[id_column], keep='first')
+    return cleaned_table.sort_values(by=id_column, kind='stable')
+
+
+def reference_best_readings(main_table, date_of_files, as_of_dates=None):
+    """Эталон add_best_readings: лучшие показания каждого ПУ выбираются функцией get_best_readings"""
+    periods = as_of_periods(as_of_dates)
+    all_columns = period_best_columns(periods)
+    best_columns = [col for columns in all_columns for col in columns]
+    result = main_table.drop(columns=[col for col in best_columns if col in main_table.columns])
+    kp_data_list = [(name, data) for name, (data, _) in date_of_files.items()]
+    for period, columns in zip(periods, all_columns):
+        rows = [get_best_readings(meter, kp_data_list, period) for meter in result['Номер ПУ']]
+        for col, name in zip(BEST_COLUMNS, columns):
+            result[name] = pd.Series([row[col] for row in rows], index=result.index, dtype=object)
+    return result[best_columns + [col for col in result.columns if col not in best_columns]]
+
+
+def reference_additional_readings(result_table, date_of_files, cols_KP):
+    """Эталон add_additional_readings: левое соединение с каждым источником по номеру ПУ"""
+    for counter, name in enumerate(source_names(date_of_files), start=1):
+        data = date_of_files[name][0][cols_KP]
+        data = data.rename(columns={col: f"{col}_{counter}" for col in cols_KP if col != 'Номер ПУ'})
+        data[f'Файл_{counter}'] = name
+        result_table = result_table.merge(data, on='Номер ПУ', how='left')
+    return result_table
+
+
+def reference_extern_table(main_table, date_of_files, cols_KP=COLS_KP, as_of_dates=None):
+    """Эталон extern_table"""
+    return reference_additional_readings(reference_best_readings(main_table, date_of_files, as_of_dates),
+                                         date_of_files, cols_KP)
+
+
+# Проверки: {название: (эталон, рабочая реализация, сравнивать ли индекс строк,
+#                       только строки с датой и общим значением (см. complete_rows))}
+CHECKS = {
+    'delete_duplicates': (reference_delete_duplicates, delete_duplicates, True, False),
+    'add_best_readings': (reference_best_readings, add_best_readings, True, True),
+    'add_additional_readings': (reference_additional_readings, add_additional_readings, False, False),
+    'extern_table': (reference_extern_table, extern_table, False, True),
+}
+
+
+def random_sources(rng, n_sources=6, n_meters=30, max_rows=40):
+    """
+    Случайные загруженные источники {имя_файла: [df, формат]}. Даты и показания берутся из небольших наборов,
+    чтобы часто совпадать; часть дат и показаний пустые, часть номеров ПУ записана с ведущими нулями
+
+    Параметры:
+        rng (np.random.Generator): Генератор случайных чисел
+        n_sources (int): Число источников
+        n_meters (int): Число разных ПУ
+        max_rows (int): Наибольшее число строк источника
+    """
+    meters = np.array([str(number) for number in rng.choice(10 ** 6, n_meters, replace=False)], dtype=object)
+    dates = pd.to_datetime(['2025-04-10', '2025-04-30', '2025-05-01', '2025-05-15', '2025-06-01'])
+    sources = {}
+    for i in range(n_sources):
+        n_rows = int(rng.integers(0, max_rows + 1)) if rng.random() < 0.9 else 0
+        numbers = rng.choice(meters, n_rows).astype(object)
+        # Ведущие нули: после удаления дублей номер ПУ совпадает с номером без нулей
+        padded = rng.random(n_rows) < 0.1
+        numbers[padded] = ['00' + number for number in numbers[padded]]
+        data = pd.DataFrame({
+            'Тип ПУ': rng.choice(['СЕ-101', 'Меркурий', None], n_rows),
+            'Номер ПУ': numbers,
+            'Дата КП': pd.Series(rng.choice(dates, n_rows)).where(rng.random(n_rows) >= 0.15),
+            'Общий': pd.Series(rng.choice([10.0, 50.0, 100.0, 100.5], n_rows)).where(rng.random(n_rows) >= 0.1),
+        })
+        if rng.random() < 0.7:
+            data['День'] = rng.choice([5.0, 30.0], n_rows)
+            data['Ночь'] = rng.choice([5.0, 20.0], n_rows)
+        else:
+            # Источник без показаний тарифов
+            data['День'], data['Ночь'] = np.nan, np.nan
+        if rng.random() < 0.1:
+            # Источник без номеров ПУ не участвует в выборе показаний
+            data = data.drop(columns=['Номер ПУ'])
+        sources[f'{i:02d} Симс.csv'] = [data, 'SIMS']
+    return sources
+
+
+def complete_rows(sources):
+    """Источники без строк с пустой датой или пустым общим значением: на них правила get_best_readings определены"""
+    result = {}
+    for name, (data, format) in sources.items():
+        if 'Номер ПУ' in data.columns:
+            data = data[data['Дата КП'].notna() & data['Общий'].notna()]
+        result[name] = [data, format]
+    return result
+
+
+def case_arguments(check, sources, as_of_dates):
+    """Аргументы проверки для одного случая: источники объединяются и очищаются от дублей, как в main"""
+    if CHECKS[check][3]:
+        sources = complete_rows(sources)
+    table = pd.concat([data for data, _ in sources.values()] or [pd.DataFrame(columns=COLS_KP)],
+                      ignore_index=True)
+    if check == 'delete_duplicates':
+        return (table,)
+    main_table = reference_delete_duplicates(table)
+    if check == 'add_best_readings':
+        return main_table, sources, as_of_dates
+    if check == 'add_additional_readings':
+        return main_table, sources, COLS_KP
+    return main_table, sources, COLS_KP, as_of_dates
+
+
+def _copy_arguments(arguments):
+    """Копии аргументов: реализация не должна влиять на вызов эталона через общие таблицы"""
+    return tuple(argument.copy() if isinstance(argument, pd.DataFrame)
+                 else {name: [data.copy(), format] for name, (data, format) in argument.items()}
+                 if isinstance(argument, dict) else argument
+                 for argument in arguments)
+
+
+def compare_tables(expected, actual, check_index=True):
+    """
+    Расхождения двух таблиц по строкам и столбцам. Значения сравниваются без учёта типа столбца
+    (разреженный, категория, object), пустые значения равны друг другу
+
+    Возвращает:
+        list: Список кортежей (позиция строки, номер ПУ, столбец, ожидается, получено);
+              для расхождений в составе столбцов и числе строк позиция строки None
+    """
+    mismatches = []
+    for col in expected.columns.difference(actual.columns, sort=False):
+        mismatches.append((None, None, col, 'столбец', 'нет столбца'))
+    for col in actual.columns.difference(expected.columns, sort=False):
+        mismatches.append((None, None, col, 'нет столбца', 'столбец'))
+    common = [col for col in expected.columns if col in actual.columns]
+    if mismatches == [] and common != [col for col in actual.columns if col in expected.columns]:
+        mismatches.append((None, None, 'порядок столбцов', list(expected.columns), list(actual.columns)))
+    if len(expected) != len(actual):
+        return mismatches + [(None, None, 'число строк', len(expected), len(actual))]
+
+    meters = expected['Номер ПУ'].to_numpy(dtype=object) if 'Номер ПУ' in expected.columns \
+        else np.full(len(expected), None)
+    columns = [('индекс', expected.index.to_numpy(dtype=object), actual.index.to_numpy(dtype=object))] \
+        if check_index else []
+    columns += [(col, expected[col].to_numpy(dtype=object), actual[col].to_numpy(dtype=object)) for col in common]
+    for col, left, right in columns:
+        same = pd.isna(left) & pd.isna(right)
+        same |= np.array([bool(a == b) if not (pd.isna(a) or pd.isna(b)) else False for a, b in zip(left, right)],
+                         dtype=bool)
+        for row in np.flatnonzero(~same):
+            mismatches.append((int(row), meters[row], col, left[row], right[row]))
+    return mismatches
+
+
+def run_checks(engines=None, n_cases=10, seed=0, as_of_dates=('2025-05-31',)):
+    """
+    Сравнивает рабочие реализации с эталонами на n_cases случайных наборах источников
+
+    Параметры:
+        engines (dict): {название проверки из CHECKS: реализация с той же сигнатурой}, по умолчанию -
+                        реализации processor.py. Проверяются только указанные
+        n_cases (int): Число случайных наборов источников
+        seed (int): Начальное значение генератора, случай i использует seed + i
+        as_of_dates (tuple): Даты лучших показаний, для нескольких дат проверяются несколько периодов
+
+    Возвращает:
+        pd.DataFrame: Расхождения, столбцы MISMATCH_COLUMNS. Пустая таблица - реализации совпадают с эталонами
+    """
+    engines = engines or {check: engine for check, (_, engine, _, _) in CHECKS.items()}
+    rows = []
+    for case in range(seed, seed + n_cases):
+        rng = np.random.default_rng(case)
+        sources = random_sources(rng, n_sources=int(rng.integers(1, 9)), n_meters=int(rng.integers(1, 40)))
+        for check, engine in engines.items():
+            reference, _, check_index, _ = CHECKS[check]
+            arguments = case_arguments(check, sources, list(as_of_dates))
+            expected = reference(*_copy_arguments(arguments))
+            try:
+                actual = engine(*_copy_arguments(arguments))
+            except Exception as e:
+                rows.append([check, case, None, None, None, None, f"ошибка: {e!r}"])
+                continue
+            rows += [[check, case, *mismatch] for mismatch in compare_tables(expected, actual, check_index)]
+    report = pd.DataFrame(rows, columns=MISMATCH_COLUMNS).astype({'Строка': 'Int64'})
+    if len(report):
+        logging.warning(f"Расхождения с эталонами: {len(report)} в {report['Случай'].nunique()} случаях")
+    return report
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    report = run_checks(as_of_dates=('2025-05-31', '2025-04-30'))
+    print(report.to_string() if len(report) else "Расхождений с эталонами нет")
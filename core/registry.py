@@ -0,0 +1,119 @@
+"""
+registry.py
+Постоянный реестр ПУ: статические сведения о приборе учёта (адрес, потребитель, лицевой счёт и т.д.)
+хранятся один раз по нормализованному номеру ПУ и дополняются при каждом запуске.
+Конвейер обрабатывает только столбцы с показаниями, сведения о ПУ добавляются к результату в конце
+"""
+import logging
+import os
+import pickle
+
+import pandas as pd
+
+from core.config import *
+from core.processor import keep_latest
+
+# Столбцы реестра: сведения о ПУ и дата показаний, из строки с которыми они взяты
+REGISTRY_COLUMNS = METER_ATTRIBUTES + ['Дата КП']
+
+# Файл реестра для папки результата по умолчанию
+DEFAULT_REGISTRY_PATH = os.path.join('output', METER_REGISTRY_FILE)
+
+
+def empty_registry():
+    """Пустой реестр ПУ"""
+    registry = pd.DataFrame(columns=REGISTRY_COLUMNS, dtype=object, index=pd.Index([], name='Номер ПУ'))
+    registry['Дата КП'] = pd.to_datetime(registry['Дата КП'])
+    return registry
+
+
+def load_registry(path=DEFAULT_REGISTRY_PATH):
+    """
+    Загружает реестр ПУ
+
+    Возвращает:
+        pd.DataFrame: Реестр с индексом по номеру ПУ, пустой, если файла нет или он повреждён
+    """
+    if not os.path.exists(path):
+        return empty_registry()
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        logging.warning(f"Реестр ПУ {path} повреждён и будет собран заново: {e}")
+        return empty_registry()
+
+
+def save_registry(registry, path=DEFAULT_REGISTRY_PATH):
+    """Сохраняет реестр ПУ. Запись атомарная: сначала во временный файл, затем переименование"""
+    try:
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(registry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        logging.info(f"Реестр ПУ сохранён: {path}, приборов учёта {len(registry)}")
+    except Exception as e:
+        logging.warning(f"Не удалось сохранить реестр ПУ: {e}")
+
+
+def update_registry(registry, table):
+    """
+    Дополняет реестр сведениями о ПУ из таблицы источника. Сведения ПУ заменяются, только если
+    показания в таблице строго свежее тех, из которых они взяты. Поэтому при обновлении источниками
+    по порядку в реестре оказываются сведения из той же строки, что оставляет delete_duplicates
+    для всех источников вместе
+
+    Параметры:
+        registry (pd.DataFrame): Реестр ПУ
+        table (pd.DataFrame): Таблица источника с нормализованными номерами ПУ
+
+    Возвращает:
+        pd.DataFrame: Обновлённый реестр
+    """
+    if 'Номер ПУ' not in table.columns or table.empty:
+        return registry
+    new = keep_latest(table).set_index('Номер ПУ').reindex(columns=REGISTRY_COLUMNS)
+    if registry.empty:
+        return new
+    known = new.index.isin(registry.index)
+    old_date = registry['Дата КП'].reindex(new.index)
+    # Сравнение с пустой датой ложно: показания без даты не заменяют сведения, а с датой заменяют сведения без даты
+    newer = known & new['Дата КП'].notna().to_numpy() & ~(new['Дата КП'] <= old_date).to_numpy()
+    if not newer.any() and known.all():
+        return registry
+    return pd.concat([registry[~registry.index.isin(new.index[newer])], new[newer | ~known]])
+
+
+def reading_columns(table):
+    """Оставляет в таблице источника только столбцы с показаниями"""
+    return table[[col for col in COLS_KP if col in table.columns]]
+
+
+def attach_attributes(table, registry):
+    """
+    Добавляет к таблице результата сведения о ПУ из реестра перед столбцом 'Номер ПУ'.
+    Столбцы, которые уже есть в таблице, не меняются
+
+    Возвращает:
+        pd.DataFrame: Таблица со сведениями о ПУ
+    """
+    missing = [col for col in METER_ATTRIBUTES if col not in table.columns]
+    if not missing or 'Номер ПУ' not in table.columns:
+        return table
+    unknown = int((~table['Номер ПУ'].isin(registry.index)).sum())
+    if unknown:
+        logging.warning(f"Нет в реестре ПУ: {unknown} приборов учёта, их сведения не заполнены")
+    attributes = registry[missing].reindex(table['Номер ПУ']).set_axis(table.index)
+    columns = list(table.columns)
+    position = columns.index('Номер ПУ')
+    order = columns[:position] + missing + columns[position:]
+    return pd.concat([table, attributes], axis=1)[order]
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
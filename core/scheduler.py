@@ -0,0 +1,184 @@
+"""
+scheduler.py
+Планирование загрузки файлов: оценка стоимости по размеру и формату,
+крупные файлы отправляются первыми, мелкие объединяются в общие задачи
+"""
+import json
+import logging
+import os
+
+from core.config import *
+from core.archives import source_size
+from core.formats import identific_format_file
+
+# Начальная модель стоимости: накладные расходы (сек) и секунды на мегабайт для каждого формата
+DEFAULT_COST_MODEL = {
+    'PYRAMIDA': {'overhead': 0.05, 'sec_per_mb': 2.0},
+    'TELESCOP': {'overhead': 0.05, 'sec_per_mb': 2.0},
+    'EMIS': {'overhead': 0.05, 'sec_per_mb': 2.0},
+    'SIMS': {'overhead': 0.02, 'sec_per_mb': 0.3},
+    None: {'overhead': 0.01, 'sec_per_mb': 0.0},
+}
+
+# Начальная модель этапов после загрузки: секунды обработки в памяти на миллион строк источников,
+# секунды записи на миллион заполненных ячеек результата и байт памяти на строку загруженного источника
+DEFAULT_STAGE_MODEL = {'process_sec_per_mrow': 5.0, 'write_sec_per_mcell': 20.0, 'bytes_per_row': 100.0}
+
+# Вес нового наблюдения при уточнении модели
+LEARNING_RATE = 0.3
+
+# Запуски с меньшим числом строк не уточняют модель этапов: их время определяется накладными расходами
+MIN_STAGE_MODEL_ROWS = 100000
+
+# Файлы меньшего размера (МБ) не уточняют модель стоимости: время их загрузки - почти одни накладные расходы
+MIN_COST_MODEL_MB = 1.0
+
+
+def load_cost_model(path=COST_MODEL_FILE):
+    """
+    Загружает модель стоимости из файла прошлых запусков, недостающие форматы берутся из DEFAULT_COST_MODEL
+    >>> load_cost_model('нет такого файла.json')['SIMS']['sec_per_mb']
+    0.3
+    """
+    model = {key: dict(value) for key, value in DEFAULT_COST_MODEL.items()}
+    try:
+        with open(path, encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return model
+    for key, value in saved.items():
+        model[None if key == 'null' else key] = value
+    return model
+
+
+def save_cost_model(model, path=COST_MODEL_FILE):
+    """Сохраняет модель стоимости для следующих запусков"""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'null' if key is None else key: value for key, value in model.items()},
+                  f, ensure_ascii=False, indent=2)
+
+
+def file_size_mb(file_path):
+    """Размер файла на диске в мегабайтах (для файла в архиве - сжатый размер), 0 если файл недоступен"""
+    return source_size(file_path) / 2 ** 20
+
+
+def estimate_cost(file_path, model, format=None):
+    """
+    Оценивает время загрузки файла (сек) по его размеру и формату
+    >>> estimate_cost('нет такого файла Симс.csv', DEFAULT_COST_MODEL)
+    0.02
+    """
+    if format is None:
+        format = identific_format_file(file_path)
+    params = model.get(format, model[None])
+    return params['overhead'] + params['sec_per_mb'] * file_size_mb(file_path)
+
+
+def plan_batches(files, model, small_cost=SMALL_TASK_COST, target_cost=BATCH_TARGET_COST):
+    """
+    Разбивает файлы на задачи: самые дорогие файлы идут первыми отдельными задачами,
+    мелкие файлы объединяются в задачи с суммарной оценкой около target_cost
+
+    Параметры:
+        files (list): Список путей к файлам
+        model (dict): Модель стоимости
+        small_cost (float): Порог оценки, ниже которого файл считается мелким
+        target_cost (float): Желаемая оценка одной объединённой задачи
+
+    Возвращает:
+        list: Список задач, каждая задача - список путей к файлам
+
+    >>> model = {None: {'overhead': 1.0, 'sec_per_mb': 0.0}}
+    >>> plan_batches(['a', 'b', 'c'], model, small_cost=2.0, target_cost=2.0)
+    [['a', 'b'], ['c']]
+    """
+    costs = sorted(((estimate_cost(name, model), name) for name in files),
+                   key=lambda item: item[0], reverse=True)
+
+    batches = [[name] for cost, name in costs if cost >= small_cost]
+
+    batch, batch_cost = [], 0.0
+    for cost, name in costs:
+        if cost >= small_cost:
+            continue
+        batch.append(name)
+        batch_cost += cost
+        if batch_cost >= target_cost:
+            batches.append(batch)
+            batch, batch_cost = [], 0.0
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def update_cost_model(model, timings, learning_rate=LEARNING_RATE):
+    """
+    Уточняет модель стоимости по фактическому времени загрузки файлов не меньше MIN_COST_MODEL_MB
+
+    Параметры:
+        model (dict): Модель стоимости (изменяется на месте)
+        timings (list): Список кортежей (путь к файлу, формат, время загрузки в секундах)
+
+    Возвращает:
+        bool: True, если модель была изменена
+    """
+    used = 0
+    for file_path, format, elapsed in timings:
+        size_mb = file_size_mb(file_path)
+        if format is None or size_mb < MIN_COST_MODEL_MB:
+            continue
+        params = model.setdefault(format, dict(model[None]))
+        observed = max(elapsed - params['overhead'], 0.0) / size_mb
+        params['sec_per_mb'] += learning_rate * (observed - params['sec_per_mb'])
+        used += 1
+    if used:
+        logging.info(f"Модель стоимости загрузки уточнена по {used} файлам")
+    return used > 0
+
+
+def stage_model(model):
+    """
+    Модель этапов после загрузки из модели стоимости, недостающие значения берутся из DEFAULT_STAGE_MODEL
+    >>> stage_model({'stages': {'bytes_per_row': 80.0}})['bytes_per_row']
+    80.0
+    """
+    return {**DEFAULT_STAGE_MODEL, **model.get('stages', {})}
+
+
+def update_stage_model(model, rows, input_bytes, process_sec, cells, write_sec, learning_rate=LEARNING_RATE):
+    """
+    Уточняет модель этапов по фактическому запуску
+
+    Параметры:
+        model (dict): Модель стоимости (изменяется на месте, модель этапов хранится под ключом 'stages')
+        rows (int): Строк во всех загруженных источниках
+        input_bytes (int): Память загруженных источников (байт)
+        process_sec (float): Время обработки в памяти или None, если этапы взяты из контрольных точек
+        cells (int): Заполненных ячеек в записанных таблицах
+        write_sec (float): Время записи результата
+
+    Возвращает:
+        bool: True, если модель была изменена
+    """
+    if rows < MIN_STAGE_MODEL_ROWS:
+        return False
+    params = stage_model(model)
+    observed = {'bytes_per_row': input_bytes / rows if rows else None,
+                'process_sec_per_mrow': process_sec * 1e6 / rows if rows and process_sec is not None else None,
+                'write_sec_per_mcell': write_sec * 1e6 / cells if cells else None}
+    for key, value in observed.items():
+        if value is not None:
+            params[key] += learning_rate * (value - params[key])
+    model['stages'] = params
+    logging.info(f"Модель этапов уточнена по запуску: {rows} строк, {cells} ячеек результата")
+    return True
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
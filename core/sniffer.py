@@ -0,0 +1,261 @@
+"""
+sniffer.py
+Определение формата файла по содержимому: читаются только первые килобайты файла -
+строки заголовка листа книги или первая строка CSV, - и сравниваются с отпечатками форматов.
+Если по содержимому формат не определён, используется определение по имени файла.
+Модуль не зависит от pandas и openpyxl
+"""
+import html
+import io
+import logging
+import re
+import zipfile
+
+from core.config import *
+from core.archives import open_source, is_plain_file, source_name
+from core.formats import identific_format_file
+
+# Отпечатки форматов: тип файла и значения ячеек, которые все должны встретиться в строках заголовка.
+# Значения сравниваются после приведения к нижнему регистру и схлопывания пробелов и переводов строк
+FORMAT_FINGERPRINTS = {
+    'PYRAMIDA': ('.xlsx', {'№ п/п', 'пс', '№ счётчика', 'показания счётчика (ап)'}),
+    'TELESCOP': ('.xlsx', {'№ п/п', '№ счётчика', 'общий', 'день', 'ночь'}),
+    'EMIS': ('.xlsx', {'№ п/п', '№ счётчика', 'общий', 'pok1', 'идентификатор тарифа'}),
+    'SIMS': ('.csv', {'unicod', 'nschetch', 'data', 'pok12'}),
+}
+
+# Сколько читать из начала файла
+SNIFF_BYTES = 64 * 2 ** 10
+# Сколько первых строк листа считаются заголовком
+SNIFF_ROWS = 8
+
+_ROW = re.compile(rb'<(?:[\w.-]+:)?row\b[^>]*?(?:/>|>(.*?)</(?:[\w.-]+:)?row>)', re.S)
+_CELL = re.compile(rb'<(?:[\w.-]+:)?c\b([^>]*?)(?:/>|>(.*?)</(?:[\w.-]+:)?c>)', re.S)
+_VALUE = re.compile(rb'<(?:[\w.-]+:)?v>(.*?)</', re.S)
+_TEXT = re.compile(rb'<(?:[\w.-]+:)?t\b[^>]*>(.*?)</(?:[\w.-]+:)?t>', re.S)
+_SHARED_STRING = re.compile(rb'<(?:[\w.-]+:)?si>(.*?)</(?:[\w.-]+:)?si>', re.S)
+
+
+def normalize_header(value):
+    """
+    Приводит значение ячейки заголовка к виду для сравнения с отпечатком
+    >>> normalize_header(' № \\nСчётчика ')
+    '№ счётчика'
+    """
+    return ' '.join(str(value).split()).lower()
+
+
+def _text(xml):
+    return html.unescape(b''.join(_TEXT.findall(xml)).decode('utf-8', errors='replace'))
+
+
+def first_sheet_path(archive):
+    """Путь к первому листу книги внутри архива xlsx"""
+    try:
+        workbook = archive.read('xl/workbook.xml')
+        rels = archive.read('xl/_rels/workbook.xml.rels')
+        sheet_id = re.search(rb'<(?:[\w.-]+:)?sheet\b[^>]*?\br:id="([^"]+)"', workbook).group(1)
+        target = re.search(rb'<Relationship\b[^>]*?Id="' + re.escape(sheet_id) + rb'"[^>]*>', rels).group(0)
+        target = re.search(rb'Target="([^"]+)"', target).group(1).decode('utf-8')
+    except (KeyError, AttributeError):
+        return 'xl/worksheets/sheet1.xml'
+    return target.lstrip('/') if target.startswith('/') else 'xl/' + target
+
+
+def shared_strings_head(archive, count):
+    """Первые count общих строк книги, файл общих строк читается только до нужного места"""
+    strings, buffer = [], b''
+    try:
+        stream = archive.open('xl/sharedStrings.xml')
+    except KeyError:
+        return strings
+    with stream:
+        while len(strings) < count:
+            block = stream.read(SNIFF_BYTES)
+            buffer += block
+            position = 0
+            for match in _SHARED_STRING.finditer(buffer):
+                strings.append(_text(match.group(1)))
+                position = match.end()
+            buffer = buffer[position:]
+            if not block:
+                break
+    return strings
+
+
+def xlsx_head_rows(source, n_rows=SNIFF_ROWS):
+    """
+    Значения ячеек первых строк первого листа книги (только текст, без типов)
+
+    Параметры:
+        source: Путь к файлу xlsx или поток с его содержимым
+        n_rows (int): Число строк
+
+    Возвращает:
+        list: Список строк, каждая строка - список значений ячеек
+    """
+    with zipfile.ZipFile(source) as archive:
+        with archive.open(first_sheet_path(archive)) as stream:
+            xml = stream.read(SNIFF_BYTES)
+        rows, shared = [], []
+        for row in _ROW.finditer(xml):
+            cells = []
+            for attrs, content in _CELL.findall(row.group(1) or b''):
+                value, is_shared = _cell_value(attrs, content)
+                if value is None:
+                    continue
+                if is_shared:
+                    shared.append((len(rows), len(cells)))
+                cells.append(value)
+            rows.append(cells)
+            if len(rows) >= n_rows:
+                break
+        _resolve_shared(archive, rows, shared)
+    return rows
+
+
+def _cell_value(attrs, content):
+    """Значение ячейки листа и признак ссылки на общую строку (значение - номер строки). Для пустой ячейки None"""
+    cell_type = re.search(rb'\bt="(\w+)"', attrs)
+    cell_type = cell_type.group(1) if cell_type else b'n'
+    if cell_type == b'inlineStr':
+        return _text(content), False
+    value = _VALUE.search(content or b'')
+    if value is None:
+        return None, False
+    return html.unescape(value.group(1).decode('utf-8', errors='replace')), cell_type == b's'
+
+
+def _resolve_shared(archive, rows, shared):
+    """Заменяет номера общих строк в ячейках rows[i][j] самими строками"""
+    if not shared:
+        return
+    strings = shared_strings_head(archive, max(int(rows[i][j]) for i, j in shared) + 1)
+    for i, j in shared:
+        index = int(rows[i][j])
+        rows[i][j] = strings[index] if index < len(strings) else ''
+
+
+def column_index(ref):
+    """
+    Номер столбца (с 0) по ссылке на ячейку
+    >>> column_index('AB12')
+    27
+    """
+    index = 0
+    for letter in re.match(r'[A-Z]*', ref).group(0):
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def xlsx_sample(source, sample_bytes):
+    """
+    Начало первого листа книги для оценки размера листа: размеры из элемента dimension
+    и ячейки первых строк с номерами строк и столбцов
+
+    Параметры:
+        source: Путь к файлу xlsx или поток с его содержимым
+        sample_bytes (int): Сколько читать из начала листа
+
+    Возвращает:
+        dict: 'last_row' - номер последней строки по dimension или None, 'sheet_bytes' - размер листа
+              без сжатия, 'sample_bytes' - сколько байт листа заняли прочитанные строки,
+              'rows' - список кортежей (номер строки, {номер столбца: значение})
+    """
+    with zipfile.ZipFile(source) as archive:
+        path = first_sheet_path(archive)
+        sheet_bytes = archive.getinfo(path).file_size
+        with archive.open(path) as stream:
+            xml = stream.read(sample_bytes)
+        dimension = re.search(rb'<(?:[\w.-]+:)?dimension\b[^>]*?\bref="[A-Z]*\d*:?[A-Z]*(\d+)"', xml)
+        rows, shared, end = [], [], 0
+        for row in _ROW.finditer(xml):
+            number = re.search(rb'\br="(\d+)"', row.group(0)[:row.group(0).find(b'>')])
+            number = int(number.group(1)) if number else (rows[-1][0] + 1 if rows else 1)
+            cells = {}
+            for position, (attrs, content) in enumerate(_CELL.findall(row.group(1) or b'')):
+                value, is_shared = _cell_value(attrs, content)
+                if value is None:
+                    continue
+                ref = re.search(rb'\br="([A-Z]+)', attrs)
+                column = column_index(ref.group(1).decode()) if ref else position
+                if is_shared:
+                    shared.append((len(rows), column))
+                cells[column] = value
+            rows.append((number, cells))
+            end = row.end()
+        _resolve_shared(archive, [cells for _, cells in rows], shared)
+    return {'last_row': int(dimension.group(1)) if dimension else None, 'sheet_bytes': sheet_bytes,
+            'sample_bytes': end, 'rows': rows}
+
+
+def csv_head_rows(file_path, n_rows=SNIFF_ROWS, encoding='windows-1251', sep=';'):
+    """Значения первых строк файла CSV"""
+    with open_source(file_path) as f:
+        head = f.read(SNIFF_BYTES).decode(encoding, errors='replace')
+    return [line.split(sep) for line in head.splitlines()[:n_rows]]
+
+
+def head_rows(file_path):
+    """
+    Первые строки файла для определения формата
+
+    Возвращает:
+        tuple: (тип файла, строки) или (тип файла, None), если файл такого типа не читается
+    """
+    suffix = source_name(file_path).lower().rsplit('.', 1)[-1]
+    if suffix == 'csv':
+        return '.csv', csv_head_rows(file_path)
+    if suffix == 'xlsx':
+        if is_plain_file(file_path):
+            return '.xlsx', xlsx_head_rows(file_path)
+        with open_source(file_path) as f:
+            return '.xlsx', xlsx_head_rows(io.BytesIO(f.read()))
+    return '.' + suffix, None
+
+
+def sniff_format(file_path):
+    """
+    Определяет формат файла по строкам заголовка
+
+    Возвращает:
+        str: Формат файла или None, если содержимое не подходит ни к одному отпечатку
+    """
+    try:
+        suffix, rows = head_rows(file_path)
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+        logging.debug("Не удалось прочитать начало файла %s: %s", file_path, e)
+        return None
+    if rows is None:
+        return None
+    values = {normalize_header(value) for row in rows for value in row}
+    for format, (format_suffix, fingerprint) in FORMAT_FINGERPRINTS.items():
+        if format_suffix == suffix and fingerprint <= values:
+            return format
+    return None
+
+
+def detect_format(file_path, sniff=SNIFF_FORMATS):
+    """
+    Определяет формат файла: по содержимому, а если не удалось - по имени файла.
+    При расхождении с именем файла в лог пишется предупреждение
+
+    Возвращает:
+        str: Формат файла или None
+    """
+    by_name = identific_format_file(file_path)
+    if not sniff:
+        return by_name
+    by_content = sniff_format(file_path)
+    if by_content is None:
+        return by_name
+    if by_name is not None and by_name != by_content:
+        logging.warning(f"Файл {file_path}: по имени формат {by_name}, по содержимому {by_content}. "
+                        f"Используется {by_content}")
+    return by_content
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,287 @@
+"""
+validator.py
+Проверка правдоподобия показаний. Проверки выполняются по столбцам сразу для всех строк
+всех источников, результат каждой строки - битовая маска флагов (uint8).
+К таблице результата добавляется столбец флагов лучших показаний, по источникам выводится сводка
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from core.config import *
+from core.processor import as_of_periods, period_best_columns, latest_positions
+
+# Флаги проверки: {бит: описание}
+FLAG_NON_NUMERIC = 1  # В столбце показаний осталось нечисловое значение
+FLAG_NEGATIVE = 2  # Отрицательные показания
+FLAG_SUM_MISMATCH = 4  # День + Ночь не равно Общий
+FLAG_FUTURE_DATE = 8  # Дата КП позже сегодняшней
+FLAG_NO_DATE = 16  # Нет даты КП
+FLAG_DECREASING = 32  # Общий меньше показаний того же ПУ на более раннюю дату
+VALIDATION_FLAGS = {
+    FLAG_NON_NUMERIC: 'Нечисловые',
+    FLAG_NEGATIVE: 'Отрицательные',
+    FLAG_SUM_MISMATCH: 'День+Ночь≠Общий',
+    FLAG_FUTURE_DATE: 'Дата в будущем',
+    FLAG_NO_DATE: 'Нет даты',
+    FLAG_DECREASING: 'Убывают',
+}
+
+
+def describe_flags(mask):
+    """
+    Расшифровка битовой маски флагов
+    >>> describe_flags(FLAG_NEGATIVE | FLAG_NO_DATE)
+    'Отрицательные, Нет даты'
+    >>> describe_flags(0)
+    ''
+    """
+    return ', '.join(name for flag, name in VALIDATION_FLAGS.items() if int(mask) & flag)
+
+
+def numeric_column(table, column):
+    """
+    Значения столбца показаний как float и признак нечислового значения.
+    Числовые столбцы не преобразуются
+    """
+    if column not in table.columns:
+        return np.full(len(table), np.nan), np.zeros(len(table), dtype=bool)
+    raw = table[column]
+    if pd.api.types.is_numeric_dtype(raw):
+        return raw.to_numpy(dtype=float, na_value=np.nan), np.zeros(len(table), dtype=bool)
+    numeric = pd.to_numeric(raw, errors='coerce')
+    return numeric.to_numpy(dtype=float, na_value=np.nan), (raw.notna() & numeric.isna()).to_numpy()
+
+
+def validate_readings(table, today=None, tolerance=VALIDATION_SUM_TOLERANCE):
+    """
+    Флаги проверки каждой строки таблицы показаний, кроме FLAG_DECREASING
+
+    Параметры:
+        table (pd.DataFrame): Таблица со столбцами COLS_KP
+        today (pd.Timestamp): Сегодняшняя дата, None - текущая
+        tolerance (float): Допустимое расхождение суммы День + Ночь и Общий
+
+    Возвращает:
+        np.ndarray: Маска флагов (uint8) для каждой строки
+    """
+    flags = np.zeros(len(table), dtype=np.uint8)
+    values = {}
+    for column in ('Общий', 'День', 'Ночь'):
+        values[column], non_numeric = numeric_column(table, column)
+        flags[non_numeric] |= FLAG_NON_NUMERIC
+        flags[values[column] < 0] |= FLAG_NEGATIVE
+    with np.errstate(invalid='ignore'):
+        mismatch = np.abs(values['День'] + values['Ночь'] - values['Общий']) > tolerance
+    flags[mismatch] |= FLAG_SUM_MISMATCH
+
+    dates = pd.to_datetime(table['Дата КП'], errors='coerce')
+    today = pd.Timestamp.today() if today is None else pd.Timestamp(today)
+    flags[(dates > today.normalize() + pd.Timedelta(days=1)).to_numpy()] |= FLAG_FUTURE_DATE
+    flags[dates.isna().to_numpy()] |= FLAG_NO_DATE
+    return flags
+
+
+def meter_date_order(codes, seconds, no_date):
+    """
+    Порядок строк по коду ПУ, затем по дате (устойчивый). Код и дата объединяются в один ключ int64,
+    если он помещается, иначе сортировка по двум ключам
+    """
+    seconds = np.where(no_date, 0, seconds - (seconds[~no_date].min() if (~no_date).any() else 0))
+    span = int(seconds.max()) + 1
+    if int(codes.max()) < np.iinfo(np.int64).max // span:
+        return np.argsort(codes.astype(np.int64) * span + seconds, kind='stable')
+    return np.lexsort((seconds, codes))
+
+
+def decreasing_readings(codes, dates, totals, tolerance=VALIDATION_SUM_TOLERANCE):
+    """
+    Признак убывания: общее показание меньше максимального показания того же ПУ на более раннюю дату
+    (при равных датах - в строке, идущей раньше). Строки без даты не сравниваются
+
+    Параметры:
+        codes (np.ndarray): Целочисленный код ПУ каждой строки
+        dates (pd.Series): Даты КП
+        totals (np.ndarray): Общие показания (float)
+
+    Возвращает:
+        np.ndarray: bool для каждой строки
+    """
+    result = np.zeros(len(codes), dtype=bool)
+    if not len(codes):
+        return result
+    no_date = dates.isna().to_numpy()
+    totals = np.where(no_date, np.nan, totals)
+    order = meter_date_order(codes, dates.to_numpy(dtype='datetime64[s]').view('i8'), no_date)
+    groups = codes[order]
+    ordered = totals[order]
+    # Коды ПУ уже целые: группировка по категории с этими кодами, без повторной факторизации
+    by_meter = pd.Categorical.from_codes(groups, categories=pd.RangeIndex(int(groups.max()) + 1))
+    running_max = pd.Series(np.nan_to_num(ordered, nan=-np.inf)).groupby(by_meter, observed=False).cummax().to_numpy()
+    # Максимум предыдущих строк: сдвиг на одну строку, у первой строки каждого ПУ предыдущих нет
+    previous_max = np.empty_like(running_max)
+    previous_max[1:] = running_max[:-1]
+    previous_max[np.r_[True, groups[1:] != groups[:-1]]] = -np.inf
+    with np.errstate(invalid='ignore'):
+        result[order] = ordered < previous_max - tolerance
+    return result
+
+
+class SourceFlags:
+    """
+    Флаги проверки показаний всех источников. Строки всех источников проверяются вместе,
+    номера ПУ один раз переводятся в целые коды. Если заданы номера ПУ результата (meters), кодами служат
+    позиции ПУ в результате: номера ПУ источников сопоставляются с результатом один раз,
+    а флаги строк результата берутся по кодам без повторного поиска
+
+    Параметры:
+        date_of_files (dict): Источники {имя_файла: [df, формат]}
+        today (pd.Timestamp): Сегодняшняя дата, None - текущая
+        meters (pd.Series): Номера ПУ результата, None - коды по номерам ПУ источников
+    """
+
+    def __init__(self, date_of_files, today=None, meters=None):
+        tables, self.names = [], []
+        for name, (data, _) in date_of_files.items():
+            if 'Номер ПУ' in data.columns and not data.empty:
+                tables.append(data.reindex(columns=COLS_KP))
+                self.names.append(name)
+        table = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=COLS_KP)
+        self.sources = np.repeat(np.arange(len(tables)), [len(data) for data in tables])
+        self.codes, self.meters = meter_codes(table['Номер ПУ'], meters)
+        self.flags = validate_readings(table, today)
+        totals, _ = numeric_column(table, 'Общий')
+        self.dates = pd.to_datetime(table['Дата КП'], errors='coerce')
+        self.flags[decreasing_readings(self.codes, self.dates, totals)] |= FLAG_DECREASING
+
+    def summary(self):
+        """
+        Сводка проверки по источникам: число строк и число строк с каждым флагом
+
+        Возвращает:
+            pd.DataFrame: Строка на источник в порядке источников, столбцы 'Строк' и описания флагов
+        """
+        n_sources = len(self.names)
+        counts = {'Строк': np.bincount(self.sources, minlength=n_sources)}
+        for flag, name in VALIDATION_FLAGS.items():
+            counts[name] = np.bincount(self.sources, weights=(self.flags & flag) > 0,
+                                       minlength=n_sources).astype(np.int64)
+        return pd.DataFrame(counts, index=pd.Index(self.names, name='Источник'))
+
+    def lookup(self, meters, sources):
+        """
+        Флаги строк источников по номеру ПУ и имени источника. Если у ПУ в источнике несколько строк,
+        берётся самая свежая, как при выборе лучших показаний (см. latest_positions). Если строки нет - 0.
+        Источник должен быть один для всех строк результата с одним номером ПУ, как у лучших показаний
+
+        Возвращает:
+            np.ndarray: Маска флагов (uint8)
+        """
+        result = np.zeros(len(meters), dtype=np.uint8)
+        if not len(self.codes):
+            return result
+        codes = self.meters.get_indexer(meters)
+        source_index = source_positions(sources, self.names)
+        found = (codes >= 0) & (source_index >= 0)
+        # Источник строки результата для каждого кода ПУ и строки источников из этого источника
+        chosen = np.full(len(self.meters), -1)
+        chosen[codes[found]] = source_index[found]
+        rows = np.flatnonzero(chosen[self.codes] == self.sources)
+        if len(rows) and np.bincount(self.codes[rows]).max() > 1:
+            rows = rows[latest_positions(pd.DataFrame({'Дата КП': self.dates.to_numpy()[rows],
+                                                       'Номер ПУ': self.codes[rows]}))]
+        by_code = np.zeros(len(self.meters), dtype=np.uint8)
+        by_code[self.codes[rows]] = self.flags[rows]
+        result[found] = by_code[codes[found]]
+        return result
+
+
+def meter_codes(table_meters, meters=None):
+    """
+    Целые коды номеров ПУ строк источников. При заданных номерах ПУ результата код - позиция ПУ
+    в результате, ПУ, которых нет в результате, получают следующие коды
+
+    Возвращает:
+        tuple: (коды строк, pd.Index номеров ПУ по кодам)
+    """
+    if meters is None:
+        codes, uniques = pd.factorize(table_meters)
+        return codes, pd.Index(uniques)
+    index = pd.Index(meters)
+    if not index.is_unique:
+        index = pd.Index(pd.unique(index))
+    codes = index.get_indexer(table_meters)
+    missing = codes < 0
+    if missing.any():
+        extra_codes, extra = pd.factorize(table_meters[missing])
+        codes[missing] = extra_codes + len(index)
+        index = index.append(pd.Index(extra))
+    return codes, index
+
+
+def source_positions(sources, names):
+    """Номер источника в names для каждого значения столбца источника (категория или имя файла), -1 - нет"""
+    if isinstance(sources.dtype, pd.CategoricalDtype):
+        positions = pd.Index(names).get_indexer(sources.cat.categories)
+        return np.append(positions, -1)[sources.cat.codes.to_numpy()]
+    return pd.Index(names).get_indexer(sources)
+
+
+def add_validation_flags(result, flags, periods=None):
+    """
+    Добавляет после столбца 'Примечание' каждого периода столбец 'Флаги' - флаги проверки
+    выбранных лучших показаний. Для ПУ без показаний флаги равны 0
+
+    Параметры:
+        result (pd.DataFrame): Таблица с лучшими показаниями
+        flags (SourceFlags): Флаги проверки источников
+        periods (list): Отчётные периоды, для которых в таблице есть лучшие показания
+
+    Возвращает:
+        pd.DataFrame: Таблица со столбцами флагов
+    """
+    result = result.copy(deep=False)
+    for columns in period_best_columns(periods or [None]):
+        source_column, note_column = columns[-2], columns[-1]
+        values = flags.lookup(result['Номер ПУ'], result[source_column])
+        result.insert(result.columns.get_loc(note_column) + 1, note_column.replace('Примечание', 'Флаги'), values)
+    return result
+
+
+def validate(result, date_of_files, as_of_dates=None, today=None):
+    """
+    Проверяет показания всех источников, выводит сводку в лог и добавляет флаги к результату
+
+    Возвращает:
+        tuple: (таблица с флагами, сводка по источникам)
+    """
+    flags = SourceFlags(date_of_files, today, result['Номер ПУ'])
+    summary = flags.summary()
+    log_summary(summary)
+    return add_validation_flags(result, flags, as_of_periods(as_of_dates)), summary
+
+
+def log_summary(summary):
+    """Выводит в лог сводку проверки по источникам (результат SourceFlags.summary)"""
+    for name, row in summary.iterrows():
+        found = ', '.join(f"{flag} - {count}" for flag, count in row.items() if flag != 'Строк' and count)
+        logging.info(f"Проверка {name}: строк {row['Строк']}" + (f", {found}" if found else ", замечаний нет"))
+
+
+def combine_summaries(summaries):
+    """
+    Сводка проверки по частям данных (например, по разделам номеров ПУ), сложенная по источникам
+
+    Возвращает:
+        pd.DataFrame: Сводка в формате SourceFlags.summary
+    """
+    if not summaries:
+        return pd.DataFrame(columns=['Строк'] + list(VALIDATION_FLAGS.values()))
+    return pd.concat(summaries).groupby(level=0, sort=False).sum()
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
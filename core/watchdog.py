@@ -0,0 +1,108 @@
+"""
+watchdog.py
+Загрузка файла в отдельном процессе с ограничением по времени и памяти.
+Процесс, вышедший за бюджет, принудительно завершается, остальная обработка продолжается
+"""
+import logging
+import multiprocessing
+import os
+import time
+
+from core.config import child_logging, init_child_logging
+
+try:
+    import psutil
+except ImportError:  # psutil необязателен: на Linux память читается из /proc
+    psutil = None
+
+# Статусы выполнения задачи под контролем
+STATUS_OK = 'ok'
+STATUS_TIMEOUT = 'timeout'
+STATUS_MEMORY = 'memory'
+STATUS_ERROR = 'error'
+
+# Как часто (сек) проверять время и память дочернего процесса
+POLL_INTERVAL = 0.1
+
+
+def process_rss_mb(pid):
+    """Возвращает резидентную память процесса в мегабайтах или None, если её не удалось определить"""
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss / 2 ** 20
+        except psutil.Error:
+            return None
+    try:
+        with open(f'/proc/{pid}/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _run_child(conn, func, args, log_args=(None,)):
+    """Точка входа дочернего процесса: выполняет func и отправляет результат родителю"""
+    init_child_logging(*log_args)
+    try:
+        conn.send((STATUS_OK, func(*args)))
+    except Exception as e:
+        conn.send((STATUS_ERROR, str(e)))
+    finally:
+        conn.close()
+
+
+def run_with_budget(func, args=(), timeout=None, memory_limit_mb=None, poll_interval=POLL_INTERVAL):
+    """
+    Выполняет func(*args) в отдельном процессе под контролем времени и памяти
+
+    Параметры:
+        func (callable): Функция уровня модуля (должна сериализоваться pickle)
+        args (tuple): Аргументы функции
+        timeout (float): Ограничение времени выполнения в секундах, None - без ограничения
+        memory_limit_mb (float): Ограничение резидентной памяти процесса в МБ, None - без ограничения
+        poll_interval (float): Период проверки состояния процесса в секундах
+
+    Возвращает:
+        tuple: (статус, результат). При статусе STATUS_OK - результат func,
+               иначе - строка с описанием причины остановки
+    """
+    # spawn одинаково работает на Windows и Linux и безопасен при вызове из потоков
+    context = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_run_child, args=(child_conn, func, args, child_logging(context)),
+                              daemon=True)
+    start = time.monotonic()
+    process.start()
+    child_conn.close()
+
+    if memory_limit_mb is not None and psutil is None and not os.path.exists('/proc'):
+        logging.warning("Ограничение памяти не применяется: установите psutil")
+        memory_limit_mb = None
+
+    try:
+        while True:
+            if parent_conn.poll(poll_interval):
+                try:
+                    return parent_conn.recv()
+                except EOFError:
+                    return STATUS_ERROR, f"Процесс завершился с кодом {process.exitcode}"
+
+            elapsed = time.monotonic() - start
+            if timeout is not None and elapsed > timeout:
+                return STATUS_TIMEOUT, f"Превышено время загрузки: {elapsed:.1f} с > {timeout} с"
+
+            if memory_limit_mb is not None:
+                rss = process_rss_mb(process.pid)
+                if rss is not None and rss > memory_limit_mb:
+                    return STATUS_MEMORY, f"Превышен лимит памяти: {rss:.0f} МБ > {memory_limit_mb} МБ"
+
+            if not process.is_alive() and not parent_conn.poll():
+                return STATUS_ERROR, f"Процесс завершился с кодом {process.exitcode}"
+    finally:
+        process.join(poll_interval)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        parent_conn.close()
@@ -1,51 +1,522 @@
 #Meter reading collection
-from core.loader import *
-import pandas as pd
-from concurrent.futures import ThreadPoolExecutor
-from tqdm import tqdm  # Для прогресс-бара
+import argparse
+import importlib
 import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, as_completed
 
+from core.config import *
+from core.formats import find_all_files, identific_format_file
+from core.scheduler import load_cost_model, save_cost_model, plan_batches, update_cost_model, update_stage_model
+from core.watchdog import run_with_budget, STATUS_OK
+from core.checkpoint import DEFAULT_CHECKPOINT_FOLDER, stage_keys, load_checkpoint, save_checkpoint, file_content_hash
+from core.backends import file_suffix, benchmark_backends
+from core.sniffer import sniff_format, detect_format
+from core.planner import dry_run, plan_run
+from core.batch import batch_folders, batch_output_folders, ParseCache, MemoryBudget
 
-def main():
+# Тяжелые зависимости (pandas, openpyxl, tqdm) загружаются при первом обращении,
+# поэтому --help и проверка форматов файлов запускаются без них. {имя: (модуль, атрибут)}
+LAZY_IMPORTS = {
+    'pd': ('pandas', None),
+    'tqdm': ('tqdm', 'tqdm'),  # Для прогресс-бара
+    'process_file': ('core.loader', 'process_file'),
+    'read_excel_source': ('core.loader', 'read_excel_source'),
+    'delete_duplicates': ('core.processor', 'delete_duplicates'),
+    'add_best_readings': ('core.processor', 'add_best_readings'),
+    'as_of_periods': ('core.processor', 'as_of_periods'),
+    'add_additional_readings': ('core.processor', 'add_additional_readings'),
+    'long_readings': ('core.processor', 'long_readings'),
+    'output_tables': ('core.output', 'output_tables'),
+    'save_output': ('core.output', 'save_output'),
+    'source_table': ('core.output', 'source_table'),
+    'write_delta': ('core.delta', 'write_delta'),
+    'best_snapshot': ('core.delta', 'best_snapshot'),
+    'SnapshotSpill': ('core.delta', 'SnapshotSpill'),
+    'load_registry': ('core.registry', 'load_registry'),
+    'save_registry': ('core.registry', 'save_registry'),
+    'update_registry': ('core.registry', 'update_registry'),
+    'reading_columns': ('core.registry', 'reading_columns'),
+    'validate': ('core.validator', 'validate'),
+    'run_daemon': ('core.daemon', 'run_daemon'),
+    'SpillStore': ('core.outofcore', 'SpillStore'),
+    'process_units': ('core.outofcore', 'process_units'),
+    'write_tables_stream': ('core.outofcore', 'write_tables_stream'),
+    'submit_job': ('core.distributed', 'submit_job'),
+    'run_worker': ('core.distributed', 'run_worker'),
+    'parallel_combine_sources': ('core.parallel', 'parallel_combine_sources'),
+    'parallel_best_readings': ('core.parallel', 'parallel_best_readings'),
+}
+
+
+def __getattr__(name):
+    """Загружает тяжелую зависимость при первом обращении к ней как к атрибуту модуля"""
+    if name not in LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, attr = LAZY_IMPORTS[name]
+    value = importlib.import_module(module_name)
+    if attr is not None:
+        value = getattr(value, attr)
+    globals()[name] = value
+    return value
+
+
+# Общие файлы состояния (модель стоимости, реестр ПУ) при пакетной обработке изменяются одним потоком за раз
+STATE_LOCK = threading.Lock()
+
+
+def load_dependencies():
+    """
+    Загружает все тяжелые зависимости конвейера. Уже заданные имена (например, подмененные в тестах)
+    не перезаписываются
+    """
+    for name in LAZY_IMPORTS:
+        if name not in globals():
+            __getattr__(name)
+
+
+def configure_pandas():
+    """Включает в pandas режим копирования при записи, если он задан в config.py"""
+    if COPY_ON_WRITE:
+        pd.set_option('mode.copy_on_write', True)
+
+
+def load_file_budgeted(name):
+    """
+    Загружает один файл. Если в config.py задан бюджет загрузки, файл загружается в отдельном процессе под контролем
+
+    Возвращает:
+        tuple: (результат process_file, причина превышения бюджета или None)
     """
-    Собирает КП из нескольких файлов разных форматов в один файл
+    if LOAD_TIMEOUT_SEC is None and LOAD_MEMORY_LIMIT_MB is None:
+        return process_file(name), None
+    # Хеш содержимого уже вычислен в этом процессе (ключи контрольных точек), процесс загрузки не читает файл заново
+    status, result = run_with_budget(process_file, (name, file_content_hash(name)),
+                                     timeout=LOAD_TIMEOUT_SEC,
+                                     memory_limit_mb=LOAD_MEMORY_LIMIT_MB)
+    if status != STATUS_OK:
+        logging.warning(f"Файл {name} не загружен: {result}")
+        return None, result
+    return result, None
+
+
+def process_batch(batch, cache=None):
     """
-    name_all_files = find_all_files()
+    Обрабатывает задачу из нескольких файлов, замеряя время загрузки каждого.
+    При пакетной обработке файлы берутся из общего кеша разбора cache
+
+    Возвращает:
+        list: Список кортежей (имя файла, результат process_file, время в секундах или None для файла из кеша,
+              причина превышения бюджета или None)
+    """
+    results = []
+    for name in batch:
+        start = time.perf_counter()
+        if cache is not None:
+            result, over_budget, cached = cache.get(name, load_file_budgeted)
+        else:
+            (result, over_budget), cached = load_file_budgeted(name), False
+        results.append((name, result, None if cached else time.perf_counter() - start, over_budget))
+    return results
+
+
+def log_run_summary(name_all_files, date_of_files, over_budget_files):
+    """Выводит итоги загрузки файлов, включая файлы, превысившие бюджет времени или памяти"""
+    logging.info(f"Итоги загрузки: найдено файлов {len(name_all_files)}, загружено {len(date_of_files)}, "
+                 f"превысили бюджет {len(over_budget_files)}")
+    for name, reason in over_budget_files.items():
+        logging.warning(f"Превышен бюджет загрузки: {name} - {reason}")
+
+
+def load_sources(name_all_files, cache=None, output_folder='output'):
+    """
+    Загружает все файлы параллельно. При METER_REGISTRY сведения о ПУ переносятся в реестр
+    папки результата output_folder,
+    в таблицах источников остаются только столбцы с показаниями.
+    При пакетной обработке файлы разбираются через общий для всех папок кеш cache (см. ParseCache)
+
+    Возвращает:
+        dict: Словарь {имя_файла: [df, формат]} в порядке обнаружения файлов
+    """
+    load_dependencies()
     date_of_files = dict()
 
+    # Крупные файлы отправляем первыми, мелкие объединяем в общие задачи
+    cost_model = load_cost_model()
+    batches = plan_batches(name_all_files, cost_model)
+
     # Параллельная обработка с прогресс-баром
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        results = list(tqdm(
-            executor.map(process_file, name_all_files),
-            total=len(name_all_files),
-            desc="Обработка файлов"))
-
-    # Фильтрация None и заполнение date_of_files
-    for result in results:
-        if result is not None:
-            name, df, format = result
-            date_of_files[name] = [df, format]
-
-    if not date_of_files:
-        logging.info("Нет данных для обработки - все файлы не загрузились")
-        return
+    results = {}
+    timings = []
+    over_budget_files = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor, \
+            tqdm(total=len(name_all_files), desc="Обработка файлов") as progress:
+        for batch_results in executor.map(lambda batch: process_batch(batch, cache), batches):
+            for name, result, elapsed, over_budget in batch_results:
+                results[name] = result
+                if over_budget is not None:
+                    over_budget_files[name] = over_budget
+                elif result is not None and elapsed is not None:
+                    timings.append((name, result[2], elapsed))
+            progress.update(len(batch_results))
+
+    with STATE_LOCK:
+        # Модель перечитывается: при пакетной обработке её могли уточнить другие папки
+        cost_model = load_cost_model() if cache is not None else cost_model
+        if update_cost_model(cost_model, timings):
+            save_cost_model(cost_model)
 
-    # Собираем все таблицы в один файл
+    # Фильтрация None и заполнение date_of_files в порядке обнаружения файлов
+    with STATE_LOCK:
+        registry_path = os.path.join(output_folder, METER_REGISTRY_FILE)
+        registry = load_registry(registry_path) if METER_REGISTRY else None
+        for file_name in name_all_files:
+            result = results.get(file_name)
+            if result is not None:
+                name, df, format = result
+                if registry is not None:
+                    registry = update_registry(registry, df)
+                    df = reading_columns(df)
+                date_of_files[name] = [df, format]
+        if registry is not None and date_of_files:
+            save_registry(registry, registry_path)
+
+    log_run_summary(name_all_files, date_of_files, over_budget_files)
+    return date_of_files
+
+
+def combine_sources(date_of_files):
+    """Объединяет все загруженные таблицы в одну и удаляет дубли строк с худшими КП"""
     all_tables = [df for df, _ in date_of_files.values()]
     result = pd.concat(all_tables, ignore_index=True)
     logging.info(f'Объединено {len(all_tables)} файлов. До удаления дублей {len(result)} строк')
+    return delete_duplicates(result)
+
+
+def build_wide_table(best, date_of_files, as_of_dates=None):
+    """
+    Приклеивает КП из всех файлов к таблице лучших показаний и добавляет флаги проверки показаний
+
+    Возвращает:
+        dict: Итоговые таблицы (см. output_tables)
+    """
+    result = add_additional_readings(best, date_of_files, COLS_KP)
+    if VALIDATION:
+        result, _ = validate(result, date_of_files, as_of_dates)
+    return output_tables(result, date_of_files)
+
+
+def build_long_tables(best, date_of_files, as_of_dates=None):
+    """
+    Таблица лучших показаний с флагами проверки и отдельная таблица всех показаний в длинном формате
+
+    Возвращает:
+        dict: Итоговые таблицы (см. output_tables)
+    """
+    if VALIDATION:
+        best, _ = validate(best, date_of_files, as_of_dates)
+    return output_tables(best, date_of_files, long_readings(date_of_files, COLS_KP))
+
+
+def checkpointed(stage, keys, compute, timings=None, folder=DEFAULT_CHECKPOINT_FOLDER):
+    """
+    Возвращает результат этапа из контрольной точки в папке folder, а если её нет - вычисляет и сохраняет.
+    При keys=None контрольные точки не используются. Время вычисленных этапов записывается в timings
+    """
+    data = load_checkpoint(stage, keys[stage], folder) if keys is not None else None
+    if data is None:
+        start = time.perf_counter()
+        data = compute()
+        if timings is not None:
+            timings[stage] = time.perf_counter() - start
+        if keys is not None and data is not None and len(data):
+            save_checkpoint(data, stage, keys[stage], folder)
+    return data
+
+
+def source_stats(date_of_files):
+    """Число строк и память (байт) загруженных источников"""
+    return (sum(len(df) for df, _ in date_of_files.values()),
+            sum(int(df.memory_usage(deep=True).sum()) for df, _ in date_of_files.values()))
+
+
+def calibrate_stages(stats, process_sec, output, write_sec):
+    """
+    Уточняет модель этапов плана запуска (--dry-run) по фактическому запуску
+
+    Параметры:
+        stats (tuple): Результат source_stats для источников запуска
+        process_sec (float): Время обработки в памяти или None, если часть этапов взята из контрольных точек
+        output (dict): Записанные таблицы
+        write_sec (float): Время записи
+    """
+    try:
+        rows, input_bytes = stats
+        # Заполненные ячейки считаются по столбцам: count таблицы со столбцами Sparse приводит их к общему типу
+        cells = sum(int(column.count()) for table in output.values() for _, column in table.items())
+        if METER_REGISTRY:
+            # Сведения о ПУ из реестра добавляются к результату при записи
+            cells += len(output['Result']) * len(METER_ATTRIBUTES)
+        with STATE_LOCK:
+            model = load_cost_model()
+            if update_stage_model(model, rows, input_bytes, process_sec, cells, write_sec):
+                save_cost_model(model)
+    except Exception as e:
+        logging.warning(f"Не удалось уточнить модель этапов: {e}")
+
+
+def main_out_of_core(name_all_files, output_folder='output', as_of_dates=AS_OF_DATES, layout=OUTPUT_LAYOUT,
+                     delta=DELTA_OUTPUT):
+    """
+    Обработка данных, не помещающихся в память: каждый источник сразу после загрузки
+    сбрасывается на диск по разделам, разделы обрабатываются группами в пределах MEMORY_BUDGET_MB,
+    результат дописывается в файл по частям. Строки результата упорядочены по разделам,
+    внутри раздела - по номеру ПУ. Вид результата, флаги проверки, таблица источников и файл изменений - как в main
+    """
+    load_dependencies()
+    store = SpillStore()
+    order = {name: index for index, name in enumerate(name_all_files)}
+    batches = plan_batches(name_all_files, load_cost_model())
+    over_budget_files = {}
+    loaded = {}
+
+    # В работе не больше MAX_WORKERS задач, чтобы загруженные таблицы не копились в памяти
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor, \
+            tqdm(total=len(name_all_files), desc="Загрузка и разбиение файлов") as progress:
+        pending = set()
+        batches = iter(batches)
+        while True:
+            for batch in batches:
+                pending.add(executor.submit(process_batch, batch))
+                if len(pending) >= MAX_WORKERS:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for name, result, elapsed, over_budget in future.result():
+                    if over_budget is not None:
+                        over_budget_files[name] = over_budget
+                    elif result is not None:
+                        _, df, format = result
+                        store.add(order[name], name, df, format)
+                        loaded[name] = True
+                    progress.update(1)
+
+    log_run_summary(name_all_files, loaded, over_budget_files)
+    try:
+        if not loaded:
+            logging.info("Нет данных для обработки - все файлы не загрузились")
+            return None
+        # Для файла изменений лучшие показания каждой части сбрасываются на диск по разделам номеров ПУ
+        snapshots = SnapshotSpill(os.path.join(store.folder, 'delta')) if delta else None
+
+        def units():
+            for tables in process_units(store, as_of_dates=as_of_dates, layout=layout):
+                if snapshots is not None:
+                    snapshots.add(best_snapshot(tables['Result'], as_of_periods(as_of_dates)))
+                yield tables
+
+        paths = write_tables_stream(units(), output_folder=output_folder, spill_folder=store.folder,
+                                    sources=source_table(store.load_unit([])))
+        if snapshots is not None:
+            snapshots.write_delta(output_folder=output_folder)
+        return paths['Result']
+    finally:
+        store.cleanup()
 
-    # Удаляем дубли строк с худшими КП
-    result = delete_duplicates(result)
 
-    # Приклеиваем КП из всех файлов к общей таблице
-    result = extern_table(result, date_of_files)
+def main(as_of_dates=AS_OF_DATES, layout=OUTPUT_LAYOUT, delta=DELTA_OUTPUT, data_folder=PATH_TO_DATA,
+         output_folder='output', cache=None):
+    """
+    Собирает КП из нескольких файлов разных форматов в один файл.
+    После каждого дорогого этапа сохраняется контрольная точка, повторный запуск
+    с теми же входными файлами продолжает работу с последней из них.
+    Лучшие показания выбираются на каждую из дат as_of_dates за один проход по данным.
+    При layout='long' показания всех источников сохраняются отдельной таблицей в длинном формате.
+    При delta=True дополнительно записывается файл изменений лучших показаний относительно прошлого запуска.
+    Файлы берутся из папки data_folder, результат записывается в output_folder
+    """
+    load_dependencies()
+    name_all_files = find_all_files(data_folder)
+
+    if OUT_OF_CORE:
+        main_out_of_core(name_all_files, output_folder, as_of_dates, layout, delta)
+        return
+
+    keys = None
+    if CHECKPOINTS_ENABLED:
+        keys = stage_keys(name_all_files, as_of_periods(as_of_dates))
+    # Контрольные точки хранятся в папке результата: папки пакетной обработки не удаляют точки друг друга
+    folder = os.path.join(output_folder, CHECKPOINT_DIR)
 
-    # Сохраняем файл в новый файл
-    result_file_name = save_to_excel(result, 'Result')
+    # Последний этап зависит от вида результата: широкая таблица или лучшие показания и таблица показаний
+    stage = 'long' if layout == 'long' else 'wide'
+    output = load_checkpoint(stage, keys[stage], folder) if keys else None
+    stats, timings = None, {}
+    if output is None:
+        date_of_files = checkpointed('sources', keys, lambda: load_sources(name_all_files, cache, output_folder),
+                                     folder=folder)
+
+        if not date_of_files:
+            logging.info("Нет данных для обработки - все файлы не загрузились")
+            return
+
+        # Лучшие показания считаются по таблице без дублей строк с худшими КП.
+        # При PARALLEL_WORKERS > 1 оба этапа выполняются параллельно по разделам номеров ПУ
+        if PARALLEL_WORKERS > 1:
+            best = checkpointed('best', keys, lambda: parallel_best_readings(
+                checkpointed('dedup', keys, lambda: parallel_combine_sources(date_of_files), timings, folder),
+                date_of_files, as_of_dates=as_of_dates), timings, folder)
+        else:
+            best = checkpointed('best', keys, lambda: add_best_readings(
+                checkpointed('dedup', keys, lambda: combine_sources(date_of_files), timings, folder),
+                date_of_files, as_of_dates), timings, folder)
+
+        # Приклеиваем КП из всех файлов к общей таблице или собираем их в отдельную таблицу
+        build = build_long_tables if stage == 'long' else build_wide_table
+        output = checkpointed(stage, keys, lambda: build(best, date_of_files, as_of_dates), timings, folder)
+        stats = source_stats(date_of_files)
+        # Источники и промежуточные таблицы больше не нужны, освобождаем память до записи результата
+        del date_of_files, best
+
+    # Сохраняем файл в новый файл, сведения о ПУ и имена источников добавляются при записи
+    start = time.perf_counter()
+    result_file_name = save_output(output, output_folder=output_folder)
     logging.debug('Результат сохранен в файле ', result_file_name)
+    # Модель этапов для --dry-run уточняется, только если источники загружены в этом запуске
+    if stats is not None:
+        # Время этапа 'best' включает удаление дублей, если оно вычислено в этом же запуске
+        process_sec = timings['best'] + timings[stage] if len(timings) == 3 else None
+        calibrate_stages(stats, process_sec, output, time.perf_counter() - start)
+    if delta:
+        write_delta(output['Result'], as_of_periods(as_of_dates), output_folder=output_folder)
+
+
+def main_batch(patterns, as_of_dates=AS_OF_DATES, layout=OUTPUT_LAYOUT, output_root='output', delta=DELTA_OUTPUT):
+    """
+    Обрабатывает несколько папок с данными (например, по месяцам или ПО) одновременно: не больше BATCH_WORKERS
+    папок и MAX_WORKERS разбираемых файлов во всех папках, сумма оценок памяти папок (см. plan_run)
+    в пределах MEMORY_BUDGET_MB. Файл, который лежит в нескольких папках, разбирается один раз.
+    Результат каждой папки записывается в output_root/<имя папки>, ошибка в одной папке не останавливает остальные.
+    При delta=True файл изменений каждой папки сравнивается с прошлым запуском этой же папки
+
+    Параметры:
+        patterns (list): Пути к папкам с данными или шаблоны, например ['DATA/2025-*']
+
+    Возвращает:
+        dict: {папка с данными: папка результата} для обработанных без ошибок папок
+    """
+    load_dependencies()
+    folders = batch_folders(patterns)
+    files = {folder: find_all_files(folder) for folder in folders}
+    outputs = batch_output_folders(folders, output_root)
+    cache = ParseCache(files.values())
+    budget = MemoryBudget(MEMORY_BUDGET_MB)
+    n_periods = len(as_of_periods(as_of_dates))
+    logging.info(f"Пакетная обработка: папок {len(folders)}, файлов {sum(map(len, files.values()))}, "
+                 f"разных файлов {len(cache.waiting)}")
+
+    def run(folder):
+        memory_mb = plan_run(files[folder], layout, n_periods)['memory_mb']
+        with budget.reserve(memory_mb):
+            try:
+                main(as_of_dates, layout, delta, folder, outputs[folder], cache)
+            finally:
+                cache.release(files[folder])
+
+    done = {}
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+        futures = {executor.submit(run, folder): folder for folder in folders}
+        for future in as_completed(futures):
+            folder = futures[future]
+            try:
+                future.result()
+                done[folder] = outputs[folder]
+            except Exception as e:
+                logging.error(f"Ошибка обработки папки {folder}: {e}", exc_info=True)
+    logging.info(f"Пакетная обработка завершена: папок {len(done)} из {len(folders)}, "
+                 f"повторно использовано разобранных файлов {cache.hits}")
+    return done
+
+
+def check_formats(folder=PATH_TO_DATA):
+    """
+    Выводит формат каждого файла в папке с данными без загрузки самих данных:
+    формат по содержимому (начало файла) и по имени файла
+    """
+    if not os.path.isdir(folder):
+        print(f"Папка с данными не найдена: {folder}")
+        return
+    for name in find_all_files(folder):
+        by_content, by_name = sniff_format(name), identific_format_file(name)
+        print(f"{by_content or by_name or 'неизвестный формат'}\t"
+              f"содержимое: {by_content or '-'}, имя: {by_name or '-'}\t{name}")
+
+
+def benchmark_readers(folder=PATH_TO_DATA):
+    """Замеряет скорость движков чтения на книгах из папки с данными, результаты используются при выборе движка"""
+    load_dependencies()
+    files = [name for name in find_all_files(folder)
+             if file_suffix(name) in ('.xlsx', '.xlsb') and detect_format(name)]
+    benchmarks = benchmark_backends(files, read_excel_source)
+    for format, measured in benchmarks.items():
+        for backend, speed in sorted(measured.items(), key=lambda item: item[1]):
+            print(f"{format}\t{backend}\t{speed:.3f} сек/МБ")
+
+
+def parse_args(argv=None):
+    """Разбирает параметры командной строки"""
+    parser = argparse.ArgumentParser(description="Сбор КП из нескольких файлов разных форматов в один файл")
+    parser.add_argument('--daemon', action='store_true',
+                        help="постоянно работающий процесс: данные хранятся в памяти, папка с данными "
+                             f"отслеживается, пересборка по запросу POST http://{DAEMON_HOST}:{DAEMON_PORT}/rebuild")
+    parser.add_argument('--check-formats', action='store_true',
+                        help="вывести формат каждого файла в папке с данными и завершить работу")
+    parser.add_argument('--benchmark-readers', action='store_true',
+                        help="замерить скорость движков чтения Excel на файлах папки с данными")
+    parser.add_argument('--as-of', nargs='+', metavar='ДАТА', default=AS_OF_DATES,
+                        help="даты, на которые выбираются лучшие показания (например 2025-04-30 2025-05-31), "
+                             "для каждого периода свой набор столбцов")
+    parser.add_argument('--layout', choices=['wide', 'long'], default=OUTPUT_LAYOUT,
+                        help="вид результата: wide - показания всех источников столбцами, "
+                             "long - лучшие показания и отдельная таблица показаний (строка на ПУ и источник)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="оценить число строк, память и время запуска по началу файлов без загрузки данных")
+    parser.add_argument('--batch', nargs='+', metavar='ПАПКА',
+                        help="обработать несколько папок с данными (пути или шаблоны, например 'DATA/2025-*'), "
+                             "результат каждой папки - в output/<имя папки>")
+    parser.add_argument('--delta', action='store_true', default=DELTA_OUTPUT,
+                        help="записать также файл изменений лучших показаний относительно прошлого запуска")
+    parser.add_argument('--submit', metavar='ОЧЕРЕДЬ',
+                        help="создать задание в общей папке очереди для обработки несколькими машинами")
+    parser.add_argument('--worker', metavar='ОЧЕРЕДЬ',
+                        help="выполнять задачи задания из общей папки очереди, пока результат не будет собран")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    # Для основного режима
-    main()
+    args = parse_args()
+    if args.check_formats:
+        check_formats()
+    elif args.dry_run:
+        dry_run(layout=args.layout, n_periods=len(args.as_of or [None]))
+    else:
+        setup_logging()
+        load_dependencies()
+        configure_pandas()
+        if args.daemon:
+            run_daemon(load_sources, as_of_dates=args.as_of, layout=args.layout, delta=args.delta)
+        elif args.benchmark_readers:
+            benchmark_readers()
+        elif args.batch:
+            main_batch(args.batch, args.as_of, args.layout, delta=args.delta)
+        elif args.submit:
+            submit_job(args.submit, as_of_dates=args.as_of, layout=args.layout, delta=args.delta)
+        elif args.worker:
+            run_worker(args.worker)
+        else:
+            # Для основного режима
+            main(args.as_of, args.layout, args.delta)
@@ -7,4 +7,18 @@ def sample_dataframe():
         'Номер ПУ': ['1', '2'],
         'Дата КП': ['2023-01-01', '2023-01-02'],
         'Общий': [100, 200]
-    })
\ No newline at end of file
+    })
+
+
+@pytest.fixture
+def make_source():
+    """Фабрика загруженных источников в формате, который возвращает load_file"""
+    def factory(meters, total, date, day=None, night=None):
+        return pd.DataFrame({
+            'ПО': 'ПО', 'РЭС': 'РЭС', 'Населенный пункт': 'НП', 'ТП': 'ТП', 'Адрес точки учёта': 'Адрес',
+            'Потребитель': 'Потребитель', 'Лицевой счет': 'ЛС', 'Тип ПУ': 'Тип',
+            'Номер ПУ': meters,
+            'Дата КП': pd.to_datetime(date),
+            'Общий': total, 'День': day, 'Ночь': night,
+        })
+    return factory
@@ -0,0 +1,64 @@
+import gzip
+import os
+import shutil
+import zipfile
+
+import pandas as pd
+import pytest
+
+from core.archives import *
+from core.checkpoint import file_content_hash
+from core.formats import find_all_files, identific_format_file
+from core.loader import load_file, load_file_reduced
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), '..', 'TEST_DATA')
+SIMS_FILE = '2025-05-19 Симс.csv'
+PYRAMIDA_FILE = '2025-06-18 Отчет КУЭМ (20).xlsx'
+
+
+@pytest.fixture
+def packed_dir(tmp_path):
+    """Папка с данными: сжатый CSV и архив с книгой и CSV внутри вложенной папки"""
+    with open(os.path.join(TEST_DATA, SIMS_FILE), 'rb') as src, \
+            gzip.open(tmp_path / (SIMS_FILE + '.gz'), 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    with zipfile.ZipFile(tmp_path / 'май.zip', 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.write(os.path.join(TEST_DATA, PYRAMIDA_FILE), PYRAMIDA_FILE)
+        archive.write(os.path.join(TEST_DATA, SIMS_FILE), 'сводка/' + SIMS_FILE)
+        archive.writestr('readme.txt', 'не данные')
+    (tmp_path / 'notes.txt.gz').write_bytes(gzip.compress(b'x'))
+    return tmp_path
+
+
+def test_find_all_files_lists_compressed_and_archived(packed_dir):
+    files = sorted(find_all_files(str(packed_dir)))
+    archive = os.path.join(str(packed_dir), 'май.zip')
+    assert files == sorted([
+        os.path.join(str(packed_dir), SIMS_FILE + '.gz'),
+        archive + ARCHIVE_MEMBER_SEP + PYRAMIDA_FILE,
+        archive + ARCHIVE_MEMBER_SEP + 'сводка/' + SIMS_FILE,
+    ])
+    assert [identific_format_file(name) for name in sorted(files)] == ['SIMS', 'PYRAMIDA', 'SIMS']
+
+
+@pytest.mark.parametrize('name, plain, format', [
+    (SIMS_FILE + '.gz', SIMS_FILE, 'SIMS'),
+    ('май.zip::сводка/' + SIMS_FILE, SIMS_FILE, 'SIMS'),
+    ('май.zip::' + PYRAMIDA_FILE, PYRAMIDA_FILE, 'PYRAMIDA'),
+])
+def test_load_packed_file_matches_plain(packed_dir, name, plain, format):
+    path = os.path.join(str(packed_dir), name)
+    expected = load_file(os.path.join(TEST_DATA, plain), format)
+    assert source_exists(path)
+    pd.testing.assert_frame_equal(load_file(path, format), expected)
+    pd.testing.assert_frame_equal(load_file_reduced(path, format),
+                                  load_file_reduced(os.path.join(TEST_DATA, plain), format))
+
+
+def test_open_source_and_hash(packed_dir):
+    path = os.path.join(str(packed_dir), 'май.zip') + ARCHIVE_MEMBER_SEP + 'сводка/' + SIMS_FILE
+    with open_source(path) as f, open(os.path.join(TEST_DATA, SIMS_FILE), 'rb') as plain:
+        assert f.read() == plain.read()
+    assert file_content_hash(path) == file_content_hash(os.path.join(TEST_DATA, SIMS_FILE))
+    assert not source_exists(path + '.нет')
+    assert source_size(path) > 0
@@ -0,0 +1,66 @@
+import os
+
+import pandas as pd
+import pytest
+
+import core.backends as backends
+from core.backends import *
+from core.loader import load_file, excel_serial_dates
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), '..', 'TEST_DATA')
+PYRAMIDA_FILE = os.path.join(TEST_DATA, '2025-06-18 Отчет КУЭМ (20).xlsx')
+
+
+@pytest.fixture
+def installed(monkeypatch):
+    """Подменяет набор установленных движков"""
+    def install(*names):
+        monkeypatch.setattr(backends, 'backend_installed', lambda backend: backend in names)
+    return install
+
+
+def test_available_backends_by_file_type(installed):
+    installed('openpyxl', 'calamine', 'pyxlsb')
+    assert available_backends('Отчет КУЭМ.xlsx') == ['calamine', 'openpyxl']
+    assert available_backends('май.zip::Отчет КУЭМ.xlsb') == ['calamine', 'pyxlsb']
+    installed('openpyxl')
+    assert available_backends('Отчет КУЭМ.xlsb') == []
+
+
+def test_select_backend(installed):
+    installed('openpyxl', 'calamine')
+    benchmarks = {'PYRAMIDA': {'calamine': 0.5, 'openpyxl': 0.2, 'pyxlsb': 0.01}}
+    # Без замеров - порядок по умолчанию, с замерами - самый быстрый из установленных
+    assert select_backend('Отчет КУЭМ (1).xlsx', benchmarks={}, backend=None) == 'calamine'
+    assert select_backend('Отчет КУЭМ (1).xlsx', benchmarks=benchmarks, backend=None) == 'openpyxl'
+    # Явно заданный движок важнее замеров
+    assert select_backend('Отчет КУЭМ (1).xlsx', benchmarks=benchmarks, backend='calamine') == 'calamine'
+    assert select_backend('Отчет КУЭМ (1).xlsb', benchmarks=benchmarks, backend=None) == 'calamine'
+    installed('openpyxl')
+    with pytest.raises(ValueError, match='python-calamine, pyxlsb'):
+        select_backend('Отчет КУЭМ (1).xlsb', benchmarks=benchmarks, backend=None)
+
+
+def test_benchmark_backends(tmp_path, installed):
+    installed('openpyxl')
+    path = str(tmp_path / 'bench.json')
+    calls = []
+    result = benchmark_backends([PYRAMIDA_FILE, 'нет такого файла.xlsx'],
+                                lambda *args: calls.append(args), path=path)
+    assert calls == [(PYRAMIDA_FILE, 'PYRAMIDA', 'openpyxl')]
+    assert set(result) == {'PYRAMIDA'}
+    assert load_benchmarks(path) == result
+
+
+@pytest.mark.parametrize('engine', [name for name in EXCEL_BACKENDS
+                                    if '.xlsx' in EXCEL_BACKENDS[name][1] and backend_installed(name)])
+def test_load_file_same_for_every_backend(monkeypatch, engine):
+    expected = load_file(PYRAMIDA_FILE, 'PYRAMIDA')
+    monkeypatch.setattr('core.loader.select_backend', lambda *args: engine)
+    pd.testing.assert_frame_equal(load_file(PYRAMIDA_FILE, 'PYRAMIDA'), expected)
+
+
+def test_excel_serial_dates():
+    result = excel_serial_dates(pd.Series([45826.5, None, '18.06.2025']))
+    assert result.tolist()[0] == pd.Timestamp('2025-06-18 12:00')
+    assert pd.isna(result[1]) and result[2] == '18.06.2025'
@@ -0,0 +1,60 @@
+import threading
+import time
+
+from core.batch import *
+
+
+def test_parse_cache_parses_shared_file_once(tmp_path):
+    folders = []
+    for month in ('05', '06'):
+        folder = tmp_path / month
+        folder.mkdir()
+        (folder / 'Симс.csv').write_text('общая выгрузка')
+        (folder / f'{month} Симс.csv').write_text(f'выгрузка {month}')
+        folders.append([str(folder / 'Симс.csv'), str(folder / f'{month} Симс.csv')])
+
+    calls = []
+
+    def load(name):
+        calls.append(name)
+        time.sleep(0.05)
+        return (name, 'таблица ' + name, 'SIMS'), None
+
+    cache = ParseCache(folders)
+    results = {}
+    threads = [threading.Thread(target=lambda name=name: results.setdefault(name, cache.get(name, load)))
+               for files in folders for name in files]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 3 and cache.hits == 1
+    # Имя источника - путь в своей папке, таблица общая
+    first, second = folders[0][0], folders[1][0]
+    assert results[first][0][0] == first and results[second][0][0] == second
+    assert results[first][0][1] == results[second][0][1]
+    # Все папки получили файлы - кеш пуст
+    assert cache.entries == {}
+
+
+def test_memory_budget_waits_for_free_memory():
+    budget = MemoryBudget(100)
+    order = []
+
+    def run(name, memory_mb, delay):
+        time.sleep(delay)
+        with budget.reserve(memory_mb):
+            order.append(('start', name))
+            time.sleep(0.1)
+            order.append(('end', name))
+
+    threads = [threading.Thread(target=run, args=('a', 80, 0)), threading.Thread(target=run, args=('b', 50, 0.02))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert order == [('start', 'a'), ('end', 'a'), ('start', 'b'), ('end', 'b')]
+    # Папка больше бюджета запускается, когда бюджет свободен
+    with budget.reserve(500):
+        assert budget.used_mb == 500
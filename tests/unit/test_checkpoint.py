@@ -0,0 +1,78 @@
+import datetime
+import os
+
+import pandas as pd
+import pytest
+import core.checkpoint
+from core.checkpoint import *
+
+
+def test_save_and_load_checkpoint(tmp_path):
+    df = pd.DataFrame({'Номер ПУ': ['1', '2'], 'Общий': [1.0, 2.0]})
+    folder = str(tmp_path)
+
+    assert load_checkpoint('dedup', 'key', folder) is None
+    assert save_checkpoint(df, 'dedup', 'key', folder) is not None
+    assert load_checkpoint('dedup', 'key', folder).equals(df)
+
+    # Точка с новым ключом вытесняет старую
+    save_checkpoint(df, 'dedup', 'key2', folder)
+    assert load_checkpoint('dedup', 'key', folder) is None
+
+
+def test_corrupted_checkpoint(tmp_path):
+    path = checkpoint_path('wide', 'key', str(tmp_path))
+    with open(path, 'wb') as f:
+        f.write(b'not a pickle')
+    assert load_checkpoint('wide', 'key', str(tmp_path)) is None
+
+
+def test_stage_keys_follow_content(tmp_path):
+    test_file = tmp_path / "Симс.csv"
+    test_file.write_text('1;2;3')
+    keys = stage_keys([str(test_file)], (6, 2025))
+    assert keys == stage_keys([str(test_file)], (6, 2025))
+    assert set(keys) == set(STAGES)
+
+    # Другой месяц меняет только ключи лучших показаний
+    other_month = stage_keys([str(test_file)], (7, 2025))
+    assert other_month['dedup'] == keys['dedup']
+    assert other_month['best'] != keys['best']
+
+    test_file.write_text('1;2;4')
+    assert stage_keys([str(test_file)], (6, 2025))['sources'] != keys['sources']
+
+
+def test_file_content_hash_reads_file_once(tmp_path, monkeypatch):
+    test_file = tmp_path / "Симс.csv"
+    test_file.write_text('1;2;3')
+    reads = []
+    read_content_hash = core.checkpoint._read_content_hash
+    monkeypatch.setattr('core.checkpoint._read_content_hash', lambda path: reads.append(path) or read_content_hash(path))
+
+    first = file_content_hash(str(test_file))
+    stage_keys([str(test_file)], (6, 2025))
+    assert file_content_hash(str(test_file)) == first and len(reads) == 1
+
+    # Изменённый файл хешируется заново
+    test_file.write_text('1;2;4')
+    os.utime(test_file, ns=(0, 0))
+    assert file_content_hash(str(test_file)) != first and len(reads) == 2
+
+
+def test_stage_keys_follow_settings_and_date(tmp_path, monkeypatch):
+    test_file = tmp_path / "Симс.csv"
+    test_file.write_text('1;2;3')
+    keys = stage_keys([str(test_file)], (6, 2025), datetime.date(2025, 6, 18))
+
+    # На следующий день флаги проверки пересчитываются, лучшие показания берутся из точки
+    next_day = stage_keys([str(test_file)], (6, 2025), datetime.date(2025, 6, 19))
+    assert next_day['best'] == keys['best']
+    assert next_day['wide'] != keys['wide'] and next_day['long'] != keys['long']
+
+    # Настройки движка чтения и проверки меняют ключи всех этапов
+    monkeypatch.setattr('core.checkpoint.VALIDATION_SUM_TOLERANCE', 0.1)
+    tolerance = stage_keys([str(test_file)], (6, 2025), datetime.date(2025, 6, 18))
+    assert tolerance['sources'] != keys['sources']
+    monkeypatch.setattr('core.checkpoint.EXCEL_BACKEND', 'calamine')
+    assert stage_keys([str(test_file)], (6, 2025), datetime.date(2025, 6, 18))['sources'] != tolerance['sources']
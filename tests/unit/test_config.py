@@ -22,6 +22,61 @@ def test_config_constants():
     assert isinstance(COLS_KP, list)
 
 
-def test_logging_config():
+def test_logging_config(tmp_path):
     import logging
-    assert logging.getLogger().level == logging.INFO
\ No newline at end of file
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    try:
+        listener = setup_logging(str(tmp_path / 'app.log'))
+        assert root.level == logging.INFO
+        logging.info('проверка %s', 'записи')
+        listener.stop()
+        text = (tmp_path / 'app.log').read_text(encoding='utf-8')
+        assert 'level=INFO' in text and 'msg=проверка записи' in text
+        assert '\x1b[' not in text
+    finally:
+        import core.config
+        core.config._child_logging.clear()
+        for handler in root.handlers:
+            handler.close()
+        root.handlers[:] = handlers
+        root.setLevel(level)
+
+
+def test_child_process_logging(tmp_path):
+    import logging
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    import core.config
+    from core.watchdog import run_with_budget, STATUS_OK
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    try:
+        listener = setup_logging(str(tmp_path / 'app.log'))
+        # Процессы spawn не наследуют обработчики родителя, записи передаются через очередь child_logging
+        assert run_with_budget(logging.warning, ('запись процесса под контролем',), timeout=60)[0] == STATUS_OK
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=init_child_logging,
+                                 initargs=child_logging(context)) as executor:
+            executor.submit(logging.warning, 'запись процесса пула').result()
+        listener.stop()
+        for _, child_listener in core.config._child_logging['queues'].values():
+            child_listener.stop()
+        text = (tmp_path / 'app.log').read_text(encoding='utf-8')
+        assert 'msg=запись процесса под контролем' in text and 'msg=запись процесса пула' in text
+    finally:
+        core.config._child_logging.clear()
+        for handler in root.handlers:
+            handler.close()
+        root.handlers[:] = handlers
+        root.setLevel(level)
+
+
+def test_import_has_no_side_effects(tmp_path):
+    import os
+    import subprocess
+    import sys
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    subprocess.run([sys.executable, '-c', 'import core.config, core.loader'],
+                   cwd=tmp_path, env={**os.environ, 'PYTHONPATH': root}, check=True)
+    assert not (tmp_path / 'app.log').exists()
\ No newline at end of file
@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+import urllib.request
+import pandas as pd
+import pytest
+from core.daemon import *
+
+
+@pytest.fixture
+def warm_state(tmp_path, make_source):
+    data_dir = tmp_path / "DATA"
+    data_dir.mkdir()
+    calls = []
+    sources = {
+        'a.csv': make_source(['1', '2'], 100.0, '2025-01-01'),
+        'b.csv': make_source(['2', '3'], 200.0, '2025-02-01'),
+    }
+
+    def load_sources(files, output_folder='output'):
+        calls.append(sorted(os.path.basename(f) for f in files))
+        return {f: [sources[os.path.basename(f)], 'SIMS'] for f in files}
+
+    (data_dir / 'a.csv').write_text('a')
+    state = WarmState(str(data_dir), load_sources, output_folder=str(tmp_path / 'output'))
+    return state, data_dir, calls
+
+
+def test_rebuild_loads_only_new_files(warm_state):
+    state, data_dir, calls = warm_state
+    assert state.rebuild() is not None
+    assert not state.has_changes()
+
+    (data_dir / 'b.csv').write_text('b')
+    assert state.has_changes()
+    state.rebuild()
+    assert calls == [['a.csv'], ['b.csv']]
+
+    expected = add_best_readings(state.main_table, state.sources)
+    pd.testing.assert_frame_equal(state.best_table.reset_index(drop=True), expected.reset_index(drop=True))
+    assert state.best_table.set_index('Номер ПУ').loc['2', 'Общий'] == 200.0
+
+
+def test_rebuild_uses_as_of_dates(warm_state):
+    state, data_dir, calls = warm_state
+    state.as_of_dates = ['2025-01-31', '2025-02-28']
+    state.rebuild()
+    (data_dir / 'b.csv').write_text('b')
+    state.rebuild()
+    assert calls == [['a.csv'], ['b.csv']]
+
+    # Пересчёт только новых ПУ даёт те же столбцы и показания, что и полный расчёт на эти даты
+    expected = add_best_readings(state.main_table, state.sources, state.as_of_dates)
+    pd.testing.assert_frame_equal(state.best_table.reset_index(drop=True), expected.reset_index(drop=True))
+    assert state.best_table.set_index('Номер ПУ').loc['2', 'Общий 02.2025'] == 200.0
+
+
+def test_rebuild_after_removal(warm_state):
+    state, data_dir, calls = warm_state
+    (data_dir / 'b.csv').write_text('b')
+    state.rebuild()
+    os.remove(data_dir / 'b.csv')
+    state.rebuild()
+    assert list(state.sources) == [str(data_dir / 'a.csv')]
+    assert state.best_table['Номер ПУ'].tolist() == ['1', '2']
+
+
+def test_rebuild_long_layout(warm_state):
+    state, data_dir, calls = warm_state
+    state.layout = 'long'
+    (data_dir / 'b.csv').write_text('b')
+    path = state.rebuild()
+    result = pd.read_excel(path)
+    assert result['Номер ПУ'].astype(str).tolist() == ['1', '2', '3']
+    assert not any(col.startswith('Файл_') for col in result.columns)
+    assert [name for name in os.listdir(state.output_folder) if name.endswith('_Readings.xlsx')]
+
+
+def test_rebuild_writes_delta(warm_state):
+    state, data_dir, calls = warm_state
+    state.delta = True
+    state.rebuild()
+    (data_dir / 'b.csv').write_text('b')
+    state.rebuild()
+    names = os.listdir(state.output_folder)
+    assert DELTA_STATE_FILE in names
+    delta, = [name for name in names if name.endswith('_Delta.xlsx')]
+    changes = pd.read_excel(os.path.join(state.output_folder, delta))
+    assert sorted(changes['Номер ПУ'].astype(str)) == ['2', '3']
+
+
+def test_status_endpoint(warm_state):
+    state, data_dir, calls = warm_state
+    rebuild_event = threading.Event()
+    server = make_server(state, rebuild_event, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+        with urllib.request.urlopen(url + '/status') as response:
+            assert json.loads(response.read())['state'] == 'idle'
+        request = urllib.request.Request(url + '/rebuild', method='POST')
+        with urllib.request.urlopen(request) as response:
+            assert response.status == 202
+        assert rebuild_event.is_set()
+    finally:
+        server.shutdown()
+        server.server_close()
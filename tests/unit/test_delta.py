@@ -0,0 +1,70 @@
+import glob
+import pickle
+
+import pandas as pd
+
+from core.delta import *
+from core.processor import delete_duplicates, add_best_readings
+
+
+def best_table(sources):
+    main_table = delete_duplicates(pd.concat([df for df, _ in sources.values()], ignore_index=True))
+    return add_best_readings(main_table, sources, ['2025-06-30'])
+
+
+def test_diff_best_statuses(make_source):
+    previous = best_snapshot(best_table({
+        'a.csv': [make_source(['1', '2', '3'], [100.0, 50.0, None], '2025-06-01'), 'SIMS'],
+    }))
+    current = best_snapshot(best_table({
+        'a.csv': [make_source(['1', '2', '4'], [100.0, 60.0, 10.0], '2025-06-01'), 'SIMS'],
+    }))
+    delta = diff_best(current, previous)
+    assert dict(zip(delta['Номер ПУ'], delta['Статус'])) == {'2': STATUS_CHANGED, '4': STATUS_NEW, '3': STATUS_REMOVED}
+    assert delta.set_index('Номер ПУ').loc['2', 'Общий'] == 60.0
+    # Без изменений - пустая таблица изменений
+    assert diff_best(current, current).empty
+
+
+def test_write_delta_uses_previous_run(tmp_path, make_source):
+    state = str(tmp_path / 'last_best.pkl')
+    first = best_table({'a.csv': [make_source(['1', '2'], [100.0, 50.0], '2025-06-01'), 'SIMS']})
+    assert write_delta(first, output_folder=str(tmp_path), state_path=state) is None
+
+    # Источник с тем же именем в другой позиции: коды источников различаются, имена - нет
+    second = best_table({
+        'b.csv': [make_source(['3'], [1.0], '2025-05-01'), 'SIMS'],
+        'a.csv': [make_source(['1', '2'], [100.0, 70.0], '2025-06-01'), 'SIMS'],
+    })
+    path = write_delta(second, output_folder=str(tmp_path), state_path=state)
+    written = pd.read_excel(path, dtype={'Номер ПУ': str})
+    assert written[['Статус', 'Номер ПУ']].values.tolist() == [[STATUS_CHANGED, '2'], [STATUS_NEW, '3']]
+    assert write_delta(second, output_folder=str(tmp_path), state_path=state) is None
+    assert len(glob.glob(str(tmp_path / '*_Delta.xlsx'))) == 1
+
+
+def test_snapshot_spill_matches_in_memory_delta(tmp_path, make_source):
+    first = best_snapshot(best_table({'a.csv': [make_source(['1', '2', '3'], [100.0, 50.0, 5.0], '2025-06-01'), 'SIMS']}))
+    second = best_snapshot(best_table({'a.csv': [make_source(['1', '2', '4'], [100.0, 70.0, 1.0], '2025-06-01'), 'SIMS']}))
+    # Файл прошлых версий: вся таблица одним объектом
+    with open(tmp_path / 'memory.pkl', 'wb') as f:
+        pickle.dump(first, f)
+    save_snapshot(first, str(tmp_path / 'spill.pkl'))
+
+    expected = write_snapshot_delta(second, str(tmp_path / 'memory'), str(tmp_path / 'memory.pkl'))
+    spill = SnapshotSpill(str(tmp_path / 'parts'), n_partitions=4)
+    spill.add(second.iloc[:2])
+    spill.add(second.iloc[2:])
+    path = spill.write_delta(str(tmp_path / 'spill'), str(tmp_path / 'spill.pkl'))
+
+    def read(path):
+        return pd.read_excel(path, dtype={'Номер ПУ': str}).sort_values('Номер ПУ', ignore_index=True)
+
+    pd.testing.assert_frame_equal(read(path), read(expected))
+    assert dict(zip(read(path)['Номер ПУ'], read(path)['Статус'])) == {
+        '2': STATUS_CHANGED, '3': STATUS_REMOVED, '4': STATUS_NEW}
+    # Сохранены лучшие показания этого запуска, при следующем запуске изменений нет
+    pd.testing.assert_frame_equal(load_snapshot(str(tmp_path / 'spill.pkl')).sort_index(), second.sort_index())
+    spill = SnapshotSpill(str(tmp_path / 'parts'), n_partitions=4)
+    spill.add(second)
+    assert spill.write_delta(str(tmp_path / 'spill'), str(tmp_path / 'spill.pkl')) is None
@@ -0,0 +1,101 @@
+import os
+import shutil
+import subprocess
+import sys
+import pandas as pd
+from core.distributed import *
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+
+
+def test_lease_is_exclusive_and_stale_lease_is_taken_over(tmp_path):
+    os.makedirs(tmp_path / 'leases')
+    token_a = try_lease(str(tmp_path), 'part-0001', 'a')
+    assert token_a and try_lease(str(tmp_path), 'part-0001', 'b') is None
+
+    # Аренда без продления дольше срока переходит другому обработчику
+    lease = tmp_path / 'leases' / 'part-0001.lease'
+    os.utime(lease, (0, 0))
+    token_b = try_lease(str(tmp_path), 'part-0001', 'b')
+    assert token_b.startswith('b:') and read_lease(str(tmp_path), 'part-0001') == token_b
+    assert try_lease(str(tmp_path), 'part-0001', 'c') is None
+
+    # Прежний владелец не освобождает чужую аренду
+    release_lease(str(tmp_path), 'part-0001', token_a)
+    assert read_lease(str(tmp_path), 'part-0001') == token_b
+    release_lease(str(tmp_path), 'part-0001', token_b)
+    assert try_lease(str(tmp_path), 'part-0001', 'c')
+
+
+def test_takeover_race_keeps_live_lease(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'leases')
+    token_b = try_lease(str(tmp_path), 'part-0001', 'b')
+    # Обработчик c увидел аренду просроченной, но до переименования её уже забрал и создал заново b
+    getmtime, first_check = os.path.getmtime, [True]
+
+    def stale_once(path):
+        if first_check:
+            first_check.pop()
+            return 0
+        return getmtime(path)
+
+    monkeypatch.setattr(os.path, 'getmtime', stale_once)
+    assert try_lease(str(tmp_path), 'part-0001', 'c') is None
+    assert read_lease(str(tmp_path), 'part-0001') == token_b
+    assert os.listdir(tmp_path / 'leases') == ['part-0001.lease']
+
+
+def test_heartbeat_reports_lost_lease(tmp_path):
+    os.makedirs(tmp_path / 'leases')
+    token = try_lease(str(tmp_path), 'part-0001', 'a')
+    with heartbeat(str(tmp_path), 'part-0001', token, interval=0.01) as lost:
+        (tmp_path / 'leases' / 'part-0001.lease').write_text('b:1', encoding='utf-8')
+        assert lost.wait(5)
+
+
+def test_workers_share_queue_and_match_in_memory_result(tmp_path, monkeypatch):
+    shutil.copytree(os.path.join(ROOT, 'tests', 'TEST_DATA'), tmp_path / 'data')
+    monkeypatch.chdir(tmp_path)
+    data = str(tmp_path / 'data')
+    queue = str(tmp_path / 'queue')
+    job = submit_job(queue, data, ['2025-05-31'], str(tmp_path / 'out'), n_partitions=4)
+    assert submit_job(queue, data) is None
+
+    code = (f"import sys; sys.path.insert(0, {os.path.abspath(ROOT)!r}); "
+            f"from core.distributed import run_worker; run_worker({queue!r}, poll_sec=0.1)")
+    workers = [subprocess.Popen([sys.executable, '-c', code], cwd=str(tmp_path)) for _ in range(3)]
+    assert all(worker.wait(timeout=300) == 0 for worker in workers)
+
+    with open(os.path.join(queue, 'done', REDUCE_TASK), encoding='utf-8') as f:
+        path = json.load(f)['result']
+    result = pd.read_excel(path)
+    assert len(job_phases(job)[0]) == len(job['files'])
+    assert [name for name in os.listdir(tmp_path / 'out') if name.endswith('_Sources.xlsx')]
+    # Все задачи выполнены, аренды освобождены
+    assert sorted(os.listdir(os.path.join(queue, 'done'))) == sorted(sum(job_phases(job), []))
+    assert not os.listdir(os.path.join(queue, 'leases'))
+
+    # Тот же результат, что у обработки в памяти: строки упорядочены по разделам, поэтому сравниваются по номеру ПУ
+    from main import main
+    main(['2025-05-31'], 'wide', False, data, 'in_memory')
+    expected, = [name for name in os.listdir('in_memory') if name.endswith('_Result.xlsx')]
+    expected = pd.read_excel(os.path.join('in_memory', expected))
+    assert sorted(result.columns) == sorted(expected.columns)
+    pd.testing.assert_frame_equal(result[expected.columns].sort_values('Номер ПУ', ignore_index=True),
+                                  expected.sort_values('Номер ПУ', ignore_index=True))
+
+
+def test_job_with_long_layout_and_delta(tmp_path, monkeypatch):
+    shutil.copytree(os.path.join(ROOT, 'tests', 'TEST_DATA'), tmp_path / 'data')
+    monkeypatch.chdir(tmp_path)
+    out = tmp_path / 'out'
+    for run in ('first', 'second'):
+        queue = str(tmp_path / run)
+        submit_job(queue, str(tmp_path / 'data'), ['2025-05-31'], str(out), n_partitions=2, layout='long', delta=True)
+        run_worker(queue, poll_sec=0.01)
+    names = os.listdir(out)
+    result = pd.read_excel(out / sorted(name for name in names if name.endswith('_Result.xlsx'))[-1])
+    assert len(result) == 70 and not any(col.startswith('Файл_') for col in result.columns)
+    assert [name for name in names if name.endswith('_Readings.xlsx')]
+    # Второй запуск на тех же данных: прошлые лучшие показания сохранены, изменений нет
+    assert DELTA_STATE_FILE in names and not [name for name in names if name.endswith('_Delta.xlsx')]
@@ -0,0 +1,105 @@
+import datetime
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from core.intrafile import (use_intra_file, read_sheet_data, read_excel_parallel, iter_excel_chunks,
+                            split_csv_ranges, read_csv_parallel)
+
+
+@pytest.fixture
+def big_workbook(tmp_path):
+    """Книга с метастроками, пропущенными строками, датами, числами и пустыми ячейками"""
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(['Отчет'])
+    sheet.append([])
+    sheet.append(['Номер ПУ', 'Дата КП', 'Общий', 'Примечание'])
+    for i in range(300):
+        if i % 50 == 7:
+            sheet.append([])
+            continue
+        sheet.append([f'{i:08d}' if i % 3 else i,
+                      datetime.datetime(2025, 6, 1 + i % 28),
+                      None if i % 11 == 0 else i * 1.5,
+                      'текст & <знаки>' if i % 5 == 0 else None])
+    sheet.cell(row=400, column=6, value='последняя')
+    path = tmp_path / 'book.xlsx'
+    workbook.save(path)
+    return str(path)
+
+
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'header': 2},
+    {'header': 2, 'usecols': [0, 2], 'names': ['Номер ПУ', 'Общий']},
+])
+def test_read_excel_parallel_matches_read_excel(big_workbook, kwargs):
+    expected = pd.read_excel(big_workbook, **kwargs)
+    result = read_excel_parallel(big_workbook, workers=3, block_mb=0.002, **kwargs)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_read_sheet_data_keeps_row_positions(big_workbook):
+    data = read_sheet_data(big_workbook, workers=2, block_mb=0.001)
+    assert len(data) == 400
+    assert data[0][0] == 'Отчет'
+    assert data[-1][5] == 'последняя'
+
+
+def test_iter_excel_chunks_matches_read_excel(big_workbook):
+    kwargs = {'header': 2, 'usecols': [0, 1, 2], 'names': ['Номер ПУ', 'Дата КП', 'Общий']}
+    expected = pd.read_excel(big_workbook, **kwargs)
+    chunks = list(iter_excel_chunks(big_workbook, 64, **kwargs))
+    assert len(chunks) > 1
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+
+
+def test_whole_file_reading_without_private_openpyxl_api(big_workbook, monkeypatch):
+    monkeypatch.setattr('core.intrafile.WorkSheetParser', None)
+    kwargs = {'header': 2, 'usecols': [0, 2], 'names': ['Номер ПУ', 'Общий']}
+    expected = pd.read_excel(big_workbook, **kwargs)
+    pd.testing.assert_frame_equal(read_excel_parallel(big_workbook, workers=2, **kwargs), expected)
+    chunks = list(iter_excel_chunks(big_workbook, 64, **kwargs))
+    assert len(chunks) == 1
+    pd.testing.assert_frame_equal(chunks[0], expected)
+    with pytest.raises(ValueError):
+        read_sheet_data(big_workbook)
+
+
+def write_csv(path, lines):
+    path.write_bytes(('\n'.join(lines) + '\n').encode('windows-1251'))
+    return str(path)
+
+
+def test_read_csv_parallel_matches_read_csv(tmp_path):
+    lines = ['A;B;C', 'пропускаемая;строка;1']
+    lines += [f'{i};{i},5;адрес {i}' for i in range(200)]
+    # Текст в конце файла делает столбец B текстовым во всём файле
+    lines += ['201;нет данных;адрес']
+    path = write_csv(tmp_path / 'data.csv', lines)
+    kwargs = dict(sep=';', encoding='windows-1251', header=1, usecols=[0, 1, 2],
+                  names=['Номер ПУ', 'Общий', 'Адрес'], decimal=',')
+
+    expected = pd.read_csv(path, **kwargs)
+    result = read_csv_parallel(path, workers=4, **kwargs)
+    pd.testing.assert_frame_equal(result, expected)
+    assert result['Общий'].iloc[0] == '0,5'
+
+
+def test_split_csv_ranges(tmp_path):
+    path = write_csv(tmp_path / 'data.csv', ['h1', 'h2'] + [str(i) for i in range(100)])
+    ranges = split_csv_ranges(path, 4, skip_lines=2)
+    assert len(ranges) == 4
+    assert ranges[0][0] == 0 and ranges[-1][1] == (tmp_path / 'data.csv').stat().st_size
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+
+    quoted = write_csv(tmp_path / 'quoted.csv', ['a', '"b', 'c"'])
+    assert split_csv_ranges(quoted, 2) is None
+
+
+def test_use_intra_file(big_workbook):
+    assert not use_intra_file(big_workbook, workers=1, min_mb=0)
+    assert use_intra_file(big_workbook, workers=2, min_mb=0)
+    assert not use_intra_file(big_workbook, workers=2, min_mb=100)
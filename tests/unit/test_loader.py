@@ -66,6 +66,20 @@ def test_cached_load_file(tmp_path, monkeypatch):
         result_cached = cached_load_file(str(test_file), 'PYRAMIDA')
         assert result.equals(result_cached)
 
+
+def test_cached_load_file_reloads_changed_file(tmp_path, monkeypatch):
+    test_file = tmp_path / "Симс.csv"
+    test_file.write_text('a')
+    calls = []
+    monkeypatch.setattr('core.loader.load_file', lambda path, format: calls.append(path) or pd.DataFrame())
+    cached_load_file(str(test_file), 'SIMS')
+    cached_load_file(str(test_file), 'SIMS')
+    assert len(calls) == 1
+    # Изменённый файл (другой размер) загружается заново
+    test_file.write_text('ab')
+    cached_load_file(str(test_file), 'SIMS')
+    assert len(calls) == 2
+
 def test_optimize_dataframe():
     data = {
         'Общий': ['100', '200'],
@@ -77,4 +91,18 @@ def test_optimize_dataframe():
 
     assert pd.api.types.is_float_dtype(result['Общий'])
     assert pd.api.types.is_categorical_dtype(result['ПО'])
-    assert pd.api.types.is_datetime64_any_dtype(result['Дата КП'])
\ No newline at end of file
+    assert pd.api.types.is_datetime64_any_dtype(result['Дата КП'])
+
+
+def test_load_file_reduced_matches_full_load(tmp_path):
+    test_file = tmp_path / "Симс.csv"
+    lines = ['header1', 'header2']
+    for i in range(30):
+        lines.append(f'РЭС;Адрес {i % 7};Тип;{i % 7:05d};{1 + i % 28:02d}.05.2025 0:00;{i},5;;')
+    test_file.write_text('\n'.join(lines), encoding='windows-1251')
+
+    expected = delete_duplicates(load_file(str(test_file), 'SIMS'))
+    result = load_file_reduced(str(test_file), 'SIMS', chunk_rows=4)
+
+    pd.testing.assert_frame_equal(result, expected)
+    assert len(result) == 7
@@ -5,7 +5,9 @@ from unittest.mock import patch, MagicMock
 
 @patch('main.find_all_files')
 @patch('main.process_file')
-def test_main(mock_process_file, mock_find_all_files):
+def test_main(mock_process_file, mock_find_all_files, tmp_path, monkeypatch):
+    # Результат и реестр ПУ пишутся во временную папку, а не в output рабочей папки
+    monkeypatch.chdir(tmp_path)
     # Настраиваем моки
     mock_find_all_files.return_value = ['file1.xlsx', 'file2.csv']
     mock_df = MagicMock()
@@ -20,8 +22,83 @@ def test_main(mock_process_file, mock_find_all_files):
 
 
 @patch('main.find_all_files')
-def test_main_no_files(mock_find_all_files, capsys):
+def test_main_no_files(mock_find_all_files, capsys, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
     mock_find_all_files.return_value = []
     main()
     captured = capsys.readouterr()
-    assert "Нет данных для обработки" in captured.out
\ No newline at end of file
+    assert "Нет данных для обработки" in captured.out
+
+
+def test_cheap_commands_do_not_import_pandas():
+    import os
+    import subprocess
+    import sys
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    code = 'import sys, main; main.parse_args([]); print("pandas" in sys.modules)'
+    result = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
+
+
+def test_check_formats(tmp_path, capsys):
+    (tmp_path / 'Отчет КУЭМ (1).xlsx').write_bytes(b'')
+    (tmp_path / 'другой.csv').write_bytes(b'')
+    check_formats(str(tmp_path))
+    captured = capsys.readouterr()
+    assert 'PYRAMIDA' in captured.out
+    assert 'неизвестный формат' in captured.out
+
+
+def test_main_batch_writes_each_folder(tmp_path, monkeypatch):
+    import glob
+    import os
+    import shutil
+    import pandas as pd
+    test_data = os.path.join(os.path.dirname(__file__), '..', 'TEST_DATA')
+    for month in ('2025-05', '2025-06'):
+        shutil.copytree(test_data, tmp_path / 'in' / month)
+    os.remove(tmp_path / 'in' / '2025-06' / '2025-05-19 Сииимс.csv')
+    monkeypatch.chdir(tmp_path)
+    # Каждый файл читается для хеша один раз: кеш разбора, контрольные точки и таблица источников берут его из памяти
+    import core.checkpoint
+    reads = []
+    read_content_hash = core.checkpoint._read_content_hash
+    monkeypatch.setattr('core.checkpoint._read_content_hash', lambda path: reads.append(path) or read_content_hash(path))
+
+    done = main_batch(['in/2025-*'], ['2025-06-30'], delta=True)
+    assert reads and len(reads) == len(set(reads))
+    assert sorted(done.values()) == [os.path.join('output', '2025-05'), os.path.join('output', '2025-06')]
+    may, = glob.glob(os.path.join('output', '2025-05', '*_Result.xlsx'))
+    june, = glob.glob(os.path.join('output', '2025-06', '*_Result.xlsx'))
+    # В июньской папке на один источник меньше - на пять столбцов показаний
+    assert pd.read_excel(may).shape == (70, 51) and pd.read_excel(june).shape == (70, 46)
+    sources = pd.read_excel(glob.glob(os.path.join('output', '2025-06', '*_Sources.xlsx'))[0])
+    assert all(name.startswith(os.path.join('in', '2025-06')) for name in sources['Файл'])
+    # Контрольные точки каждой папки хранятся в её папке результата и не удаляют точки других папок
+    for month in ('2025-05', '2025-06'):
+        stages = {name.split('-')[0] for name in os.listdir(os.path.join('output', month, CHECKPOINT_DIR))}
+        assert {'sources', 'dedup', 'best', 'wide'} <= stages
+        # У каждой папки результата свой реестр ПУ и свой прошлый запуск для файла изменений
+        assert os.path.exists(os.path.join('output', month, METER_REGISTRY_FILE))
+        assert os.path.exists(os.path.join('output', month, DELTA_STATE_FILE))
+    assert not os.path.exists(os.path.join('output', METER_REGISTRY_FILE))
+    assert not os.path.exists(os.path.join('output', DELTA_STATE_FILE))
+
+
+def test_main_out_of_core_long_layout_and_delta(tmp_path, monkeypatch):
+    import glob
+    import os
+    import shutil
+    import pandas as pd
+    shutil.copytree(os.path.join(os.path.dirname(__file__), '..', 'TEST_DATA'), tmp_path / 'in')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('main.OUT_OF_CORE', True)
+
+    main(['2025-05-31'], 'long', True, 'in', 'output')
+    main(['2025-05-31'], 'long', True, 'in', 'output')
+    result = pd.read_excel(sorted(glob.glob(os.path.join('output', '*_Result.xlsx')))[-1])
+    assert len(result) == 70 and not any(col.startswith('Файл_') for col in result.columns)
+    assert glob.glob(os.path.join('output', '*_Readings.xlsx'))
+    # Второй запуск на тех же данных: прошлые лучшие показания сохранены, изменений нет
+    assert os.path.exists(os.path.join('output', DELTA_STATE_FILE))
+    assert not glob.glob(os.path.join('output', '*_Delta.xlsx'))
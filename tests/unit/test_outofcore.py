@@ -0,0 +1,96 @@
+import pandas as pd
+import pytest
+import core.outofcore
+from core.outofcore import *
+from core.output import source_table
+from core.validator import validate
+
+
+@pytest.fixture
+def sources(make_source):
+    return {
+        'a.csv': [make_source([str(i) for i in range(1, 40)], 100.0, '2025-01-01'), 'SIMS'],
+        'b.csv': [make_source([str(i) for i in range(20, 60)], 200.0, '2025-02-01'), 'SIMS'],
+        'c.csv': [make_source(['5', '77'], 50.0, '2025-03-01'), 'SIMS'],
+    }
+
+
+def test_partitioned_result_matches_in_memory(tmp_path, sources):
+    store = SpillStore(str(tmp_path / 'spill'), n_partitions=8)
+    # Порядок добавления не влияет на нумерацию источников
+    for index, name in reversed(list(enumerate(sources))):
+        df, format = sources[name]
+        store.add(index, name, df, format)
+
+    parts = [tables['Result'] for tables in process_units(store, memory_budget_mb=0.001)]
+    assert len(parts) > 1
+    result = pd.concat(parts).sort_values('Номер ПУ').reset_index(drop=True)
+
+    main_table = delete_duplicates(pd.concat([df for df, _ in sources.values()], ignore_index=True))
+    expected = add_additional_readings(add_best_readings(main_table, sources), sources, COLS_KP)
+    expected, _ = validate(expected, sources)
+    expected = expected.sort_values('Номер ПУ').reset_index(drop=True)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+    store.cleanup()
+    assert not os.path.exists(store.folder)
+
+
+def test_partitioned_result_uses_as_of_dates(tmp_path, sources):
+    store = SpillStore(str(tmp_path / 'spill'), n_partitions=4)
+    for index, name in enumerate(sources):
+        df, format = sources[name]
+        store.add(index, name, df, format)
+    as_of_dates = ['2025-01-31', '2025-02-28']
+
+    result = pd.concat(tables['Result'] for tables in process_units(store, as_of_dates=as_of_dates))
+    result = result.sort_values('Номер ПУ').reset_index(drop=True)
+    main_table = delete_duplicates(pd.concat([df for df, _ in sources.values()], ignore_index=True))
+    expected = add_additional_readings(add_best_readings(main_table, sources, as_of_dates), sources, COLS_KP)
+    expected, _ = validate(expected, sources, as_of_dates)
+    expected = expected.sort_values('Номер ПУ').reset_index(drop=True)
+    assert list(result.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_long_layout_streams_readings_to_second_file(tmp_path, sources):
+    store = SpillStore(str(tmp_path / 'spill'), n_partitions=4)
+    for index, name in enumerate(sources):
+        df, format = sources[name]
+        store.add(index, name, df, format)
+
+    units = list(process_units(store, memory_budget_mb=0.001, layout='long'))
+    assert len(units) > 1 and all(set(tables) == {'Result', 'Readings'} for tables in units)
+    paths = write_tables_stream(iter(units), output_folder=str(tmp_path / 'out'), spill_folder=store.folder)
+    readings = pd.concat(pd.read_excel(paths['Readings'], sheet_name=None).values())
+    assert len(readings) == sum(len(df) for df, _ in sources.values())
+    assert len(pd.read_excel(paths['Result'])) == 60
+    assert not [name for name in os.listdir(store.folder) if name.startswith('readings-')]
+
+
+def test_write_tables_stream_writes_sources_and_codes(tmp_path, sources):
+    store = SpillStore(str(tmp_path / 'spill'), n_partitions=4)
+    for index, name in enumerate(sources):
+        df, format = sources[name]
+        store.add(index, name, df, format)
+
+    paths = write_tables_stream(process_units(store), output_folder=str(tmp_path / 'out'), spill_folder=store.folder,
+                                sources=source_table(store.load_unit([])), codes=True)
+    result = pd.read_excel(paths['Result'])
+    assert set(result['Источник'].dropna()) <= {1, 2, 3} and set(result['Файл_3'].dropna()) == {3}
+    table, = [name for name in os.listdir(tmp_path / 'out') if name.endswith('_Sources.xlsx')]
+    assert pd.read_excel(tmp_path / 'out' / table)['Файл'].tolist() == list(sources)
+
+
+def test_write_excel_stream_rolls_over_sheets(tmp_path, monkeypatch):
+    monkeypatch.setattr(core.outofcore, 'EXCEL_MAX_ROWS', 3)
+    frames = [pd.DataFrame({'A': [1, 2], 'B': [None, 'x']}), pd.DataFrame({'A': [3, 4], 'B': ['y', None]})]
+
+    path = write_excel_stream(iter(frames), 'test', output_folder=str(tmp_path))
+    sheets = pd.read_excel(path, sheet_name=None)
+    assert [len(sheet) for sheet in sheets.values()] == [3, 1]
+    assert pd.concat(sheets.values())['A'].tolist() == [1, 2, 3, 4]
+
+
+def test_write_excel_stream_empty(tmp_path):
+    assert write_excel_stream(iter([]), 'test', output_folder=str(tmp_path)) is None
@@ -0,0 +1,56 @@
+import glob
+
+import pandas as pd
+
+from core.checkpoint import file_content_hash
+from core.config import COLS_KP
+from core.output import *
+from core.processor import delete_duplicates, add_best_readings, add_additional_readings
+
+
+def make_sources(tmp_path, make_source):
+    a, b = tmp_path / 'a.csv', tmp_path / 'b.csv'
+    a.write_text('a')
+    b.write_text('b')
+    sources = {
+        str(a): [make_source(['1', '2'], [100.0, 50.0], '2025-05-01'), 'SIMS'],
+        str(b): [make_source(['2', '3'], [90.0, 10.0], '2025-06-01'), 'EMIS'],
+    }
+    sources[str(a)][0].attrs['Загружен'] = pd.Timestamp('2025-06-18 10:00')
+    return sources
+
+
+def test_source_table_and_codes(tmp_path, make_source):
+    sources = make_sources(tmp_path, make_source)
+    table = source_table(sources)
+    assert table['Код'].tolist() == [1, 2]
+    assert table['Формат'].tolist() == ['SIMS', 'EMIS']
+    assert table['Хеш'][0] == file_content_hash(str(tmp_path / 'a.csv'))
+    assert table['Загружен'][0] == pd.Timestamp('2025-06-18 10:00') and pd.isna(table['Загружен'][1])
+    # Хеш, вычисленный при загрузке, берётся из атрибутов источника, файл не читается заново
+    sources[str(tmp_path / 'a.csv')][0].attrs['Хеш'] = 'abc'
+    assert source_table(sources)['Хеш'].tolist() == ['abc', table['Хеш'][1]]
+
+    main_table = delete_duplicates(pd.concat([df for df, _ in sources.values()], ignore_index=True))
+    result = add_additional_readings(add_best_readings(main_table, sources), sources, COLS_KP)
+    # Источники хранятся кодами категории, имя файла - один раз в категориях
+    assert result['Источник'].dtype == 'category' and result['Файл_2'].dtype == 'category'
+    assert result['Источник'].tolist() == [str(tmp_path / 'a.csv'), str(tmp_path / 'b.csv'), str(tmp_path / 'b.csv')]
+
+    encoded = encode_sources(result)
+    assert encoded['Источник'].tolist() == [1, 2, 2]
+    assert encoded['Файл_2'].isna().tolist() == [True, False, False]
+    assert encoded['Файл_2'].dropna().tolist() == [2, 2]
+
+
+def test_save_output_with_codes(tmp_path, make_source, monkeypatch):
+    monkeypatch.setattr('core.output.METER_REGISTRY', False)
+    sources = make_sources(tmp_path, make_source)
+    main_table = delete_duplicates(pd.concat([df for df, _ in sources.values()], ignore_index=True))
+    tables = output_tables(add_best_readings(main_table, sources), sources)
+    save_output(tables, output_folder=str(tmp_path / 'out'), codes=True)
+
+    result, = glob.glob(str(tmp_path / 'out' / '*_Result.xlsx'))
+    written_sources, = glob.glob(str(tmp_path / 'out' / '*_Sources.xlsx'))
+    assert pd.read_excel(result)['Источник'].tolist() == [1, 2, 2]
+    assert pd.read_excel(written_sources)['Файл'].tolist() == list(sources)
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+from core.parallel import *
+
+
+@pytest.fixture
+def sources(make_source):
+    rng = np.random.default_rng(1)
+    date_of_files = {}
+    for i in range(4):
+        meters = rng.integers(0, 60, 80).astype(str)
+        dates = rng.choice(['2025-01-01', '2025-02-01', None], 80)
+        df = make_source(meters, rng.choice([100.0, 200.0], 80), dates)
+        date_of_files[f'source_{i}.csv'] = [delete_duplicates(df), 'SIMS']
+    return date_of_files
+
+
+def test_split_sources_keeps_meters_together(sources):
+    partitions = split_sources(sources, 5)
+    seen = {}
+    for partition, date_of_files in enumerate(partitions):
+        assert list(date_of_files) == list(sources)
+        for df, _ in date_of_files.values():
+            for meter in df['Номер ПУ']:
+                assert seen.setdefault(meter, partition) == partition
+
+
+def test_parallel_matches_single_process(sources):
+    all_tables = [df for df, _ in sources.values()]
+    expected = delete_duplicates(pd.concat(all_tables, ignore_index=True))
+    result = parallel_combine_sources(sources, workers=2)
+    pd.testing.assert_frame_equal(result, expected)
+
+    pd.testing.assert_frame_equal(parallel_best_readings(expected, sources, workers=2),
+                                  add_best_readings(expected, sources))
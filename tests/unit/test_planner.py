@@ -0,0 +1,66 @@
+import gzip
+import os
+import re
+import shutil
+import zipfile
+
+from core.formats import find_all_files
+from core.loader import load_file
+from core.planner import *
+from core.scheduler import DEFAULT_COST_MODEL
+from core.sniffer import detect_format
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), '..', 'TEST_DATA')
+SIMS_FILE = '2025-05-19 Симс.csv'
+PYRAMIDA_FILE = '2025-06-18 Отчет КУЭМ (20).xlsx'
+
+
+def test_plan_matches_loaded_data():
+    files = find_all_files(TEST_DATA)
+    plan = plan_run(files, model=DEFAULT_COST_MODEL)
+    for name, format, rows, cost in plan['files']:
+        assert rows == len(load_file(name, format)), name
+    # Ширина и строки результата совпадают с фактическим результатом по TEST_DATA
+    assert (plan['result_rows'], plan['result_columns']) == (70, 51)
+    assert plan['fits_memory']
+
+    long_plan = plan_run(files, layout='long', n_periods=2, model=DEFAULT_COST_MODEL)
+    assert long_plan['readings_rows'] == long_plan['rows'] == plan['rows']
+    assert long_plan['result_columns'] == 1 + 2 * 7 + 8
+
+
+def test_rows_of_compressed_and_undimensioned_files(tmp_path):
+    sims = os.path.join(TEST_DATA, SIMS_FILE)
+    with open(sims, 'rb') as src, gzip.open(tmp_path / (SIMS_FILE + '.gz'), 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    assert sample_file(str(tmp_path / (SIMS_FILE + '.gz')), 'SIMS') == sample_file(sims, 'SIMS')
+
+    # Книга без элемента dimension: строки оцениваются по размеру листа
+    stripped = tmp_path / PYRAMIDA_FILE
+    with zipfile.ZipFile(os.path.join(TEST_DATA, PYRAMIDA_FILE)) as src, zipfile.ZipFile(stripped, 'w') as dst:
+        for item in src.infolist():
+            data = src.read(item)
+            if item.filename == 'xl/worksheets/sheet1.xml':
+                data = re.sub(rb'<dimension[^>]*/>', b'', data)
+            dst.writestr(item, data)
+    expected, meters = sample_file(os.path.join(TEST_DATA, PYRAMIDA_FILE), 'PYRAMIDA')
+    rows, stripped_meters = sample_file(str(stripped), 'PYRAMIDA')
+    assert stripped_meters == meters and abs(rows - expected) <= 2
+    assert detect_format(str(stripped)) == 'PYRAMIDA'
+
+
+def test_compressed_xlsx_is_estimated_by_size(tmp_path, monkeypatch):
+    book = os.path.join(TEST_DATA, PYRAMIDA_FILE)
+    with open(book, 'rb') as src, gzip.open(tmp_path / (PYRAMIDA_FILE + '.gz'), 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    with zipfile.ZipFile(tmp_path / 'data.zip', 'w') as archive:
+        archive.write(book, PYRAMIDA_FILE)
+
+    # Книга не распаковывается: строки оцениваются по размеру файла без сжатия
+    def no_read(*args):
+        raise AssertionError('книга прочитана')
+
+    monkeypatch.setattr('core.planner.xlsx_sample', no_read)
+    expected = (round(os.path.getsize(book) / PLAN_XLSX_BYTES_PER_ROW), [])
+    assert sample_file(str(tmp_path / (PYRAMIDA_FILE + '.gz')), 'PYRAMIDA') == expected
+    assert sample_file(str(tmp_path / 'data.zip') + '::' + PYRAMIDA_FILE, 'PYRAMIDA') == expected
@@ -1,42 +1,170 @@
-import pytest
-from core.processor import *
-from datetime import datetime
-import pandas as pd
-import os
-
-
-def test_find_all_files():
-    files = find_all_files('TEST_DATA')
-    assert len(files) > 0
-    assert all(f.endswith(('.xlsx', '.csv')) for f in files)
-
-
-def test_identific_format_file():
-    assert identific_format_file('test_Отчет КУЭМ.xlsx') == 'PYRAMIDA'
-    assert identific_format_file('test_типом ПУ без AD.xlsx') == 'TELESCOP'
-    assert identific_format_file('test_Симс.csv') == 'SIMS'
-    assert identific_format_file('test_ЭМИС.xlsx') == 'EMIS'
-    assert identific_format_file('unknown.txt') is None
-
-
-def test_delete_duplicates():
-    data = {
-        'Номер ПУ': ['1', '1', '2', '2'],
-        'Дата КП': ['2023-01-01', '2023-01-02', '2023-01-01', '2023-01-03'],
-        'Общий': [100, 200, 300, 400]
-    }
-    df = pd.DataFrame(data)
-    df['Дата КП'] = pd.to_datetime(df['Дата КП'])
-
-    result = delete_duplicates(df)
-    assert len(result) == 2
-    assert result['Номер ПУ'].tolist() == ['1', '2']
-    assert result['Общий'].tolist() == [200, 400]
-
-
-def test_save_to_excel(tmp_path):
-    df = pd.DataFrame({'A': [1, 2], 'B': [3, 4]})
-    output_folder = tmp_path / "output"
-    filepath = save_to_excel(df, 'test', output_folder=str(output_folder))
-    assert os.path.exists(filepath)
+import pytest
+from core.processor import *
+from datetime import datetime
+import pandas as pd
+import os
+
+
+def test_find_all_files():
+    files = find_all_files('TEST_DATA')
+    assert len(files) > 0
+    assert all(f.endswith(('.xlsx', '.csv')) for f in files)
+
+
+def test_identific_format_file():
+    assert identific_format_file('test_Отчет КУЭМ.xlsx') == 'PYRAMIDA'
+    assert identific_format_file('test_типом ПУ без AD.xlsx') == 'TELESCOP'
+    assert identific_format_file('test_Симс.csv') == 'SIMS'
+    assert identific_format_file('test_ЭМИС.xlsx') == 'EMIS'
+    assert identific_format_file('unknown.txt') is None
+
+
+def test_delete_duplicates():
+    data = {
+        'Номер ПУ': ['1', '1', '2', '2'],
+        'Дата КП': ['2023-01-01', '2023-01-02', '2023-01-01', '2023-01-03'],
+        'Общий': [100, 200, 300, 400]
+    }
+    df = pd.DataFrame(data)
+    df['Дата КП'] = pd.to_datetime(df['Дата КП'])
+
+    result = delete_duplicates(df)
+    assert len(result) == 2
+    assert result['Номер ПУ'].tolist() == ['1', '2']
+    assert result['Общий'].tolist() == [200, 400]
+
+
+def test_reduce_latest_readings_matches_delete_duplicates():
+    df = pd.DataFrame({
+        'Номер ПУ': ['001', '1', '2', '3', '2', '1', '3'],
+        'Дата КП': pd.to_datetime(['2023-01-01', '2023-01-03', '2023-01-02', None,
+                                   '2023-01-02', '2023-01-03', None]),
+        'Общий': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0]
+    })
+    chunks = [df.iloc[i:i + 2].copy() for i in range(0, len(df), 2)]
+
+    result = reduce_latest_readings(chunks)
+    pd.testing.assert_frame_equal(result, delete_duplicates(df))
+    # При равных датах остается запись, встретившаяся раньше
+    assert result['Общий'].tolist() == [2.0, 3.0, 4.0]
+    assert reduce_latest_readings([]) is None
+
+
+def test_add_best_readings_for_several_periods_matches_reference(make_source):
+    sources = {
+        'a.csv': [make_source(['1', '2', '3'], [100.0, 500.0, 50.0], ['2025-04-10', '2025-05-02', None]), 'SIMS'],
+        'b.csv': [make_source(['1', '2', '4'], [90.0, 400.0, 70.0], ['2025-05-20', '2025-04-01', '2025-03-01']), 'SIMS'],
+        'c.csv': [make_source(['1', '2'], [100.0, 600.0], ['2025-04-01', '2025-03-15']), 'SIMS'],
+    }
+    main_table = delete_duplicates(pd.concat([df for df, _ in sources.values()], ignore_index=True))
+    main_table = pd.concat([main_table, pd.DataFrame({'Номер ПУ': ['5']})], ignore_index=True)
+    periods = [(4, 2025), (5, 2025), (1, 2024)]
+    result = add_best_readings(main_table, sources, ['2025-04-30', '2025-05-31', '2024-01-15'])
+
+    kp_data_list = [(name, df) for name, (df, _) in sources.items()]
+    for period, columns in zip(periods, period_best_columns(periods)):
+        assert columns[0] in result.columns
+        for _, row in result.iterrows():
+            expected = get_best_readings(row['Номер ПУ'], kp_data_list, period)
+            for col, name in zip(BEST_COLUMNS, columns):
+                assert row[name] == expected[col] or (pd.isna(row[name]) and pd.isna(expected[col]))
+    # Один период - столбцы без суффикса, как раньше
+    single = add_best_readings(main_table, sources, ['2025-05-31'])
+    assert list(single.columns[:len(BEST_COLUMNS)]) == BEST_COLUMNS
+    assert single['Источник'].tolist()[:2] == ['b.csv', 'a.csv']
+
+
+def test_add_best_readings_ranks_empty_totals_and_dates(make_source):
+    # В get_best_readings пустые общее значение и дата несравнимы с остальными, выбор зависит от порядка источников.
+    # add_best_readings выбирает одинаково при любом порядке: без общего значения и без даты - после остальных
+    a = make_source(['1', '2', '3'], [None, 50.0, None], ['2025-05-15', None, None])
+    b = make_source(['1', '2'], [100.0, 50.0], ['2025-05-01', '2025-04-10'])
+    for names in (['a.csv', 'b.csv'], ['b.csv', 'a.csv']):
+        sources = {name: [{'a.csv': a, 'b.csv': b}[name], 'SIMS'] for name in names}
+        main_table = delete_duplicates(pd.concat([df for df, _ in sources.values()], ignore_index=True))
+        best = add_best_readings(main_table, sources, ['2025-05-31']).set_index('Номер ПУ')
+        # Показание отчётного месяца без общего значения уступает показанию с общим значением
+        assert best.loc['1', ['Общий', 'Источник']].tolist() == [100.0, 'b.csv']
+        # При равном общем значении показание с датой лучше показания без даты
+        assert best.loc['2', ['Источник', 'Примечание']].tolist() == ['b.csv', 'Из предыдущих месяцев']
+        # Единственное показание без даты и общего значения всё равно выбирается
+        assert best.loc['3', 'Источник'] == 'a.csv' and best.loc['3', 'Примечание'] == 'Нет даты'
+        assert pd.isna(best.loc['3', 'Общий'])
+
+
+def test_pipeline_peak_memory_with_copy_on_write():
+    import tracemalloc
+    import numpy as np
+    rng = np.random.default_rng(0)
+    sources = {}
+    for index in range(4):
+        meters = rng.choice(20000, size=10000, replace=False).astype(str)
+        total = rng.random(len(meters)) * 1000
+        sources[f'{index}.csv'] = [pd.DataFrame({
+            'Номер ПУ': meters,
+            'Дата КП': pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 180, len(meters)), 'D'),
+            'Общий': total, 'День': total, 'Ночь': total}), 'SIMS']
+    input_bytes = sum(df.memory_usage(deep=True).sum() for df, _ in sources.values())
+
+    with pd.option_context('mode.copy_on_write', True):
+        tracemalloc.start()
+        main_table = delete_duplicates(pd.concat([df for df, _ in sources.values()], ignore_index=True))
+        best = add_best_readings(main_table, sources, ['2025-06-30'])
+        del main_table
+        result = add_additional_readings(best, sources, COLS_KP)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    assert len(result) == len(best)
+    # Защита от возврата лишних копий: до перехода на copy-on-write пик был около 3.9 объёма источников
+    assert peak < 3.5 * input_bytes
+
+
+def test_long_readings_hold_same_readings_as_wide_table(make_source):
+    sources = {
+        'a.csv': [make_source(['2', '1'], [100.0, 50.0], '2025-05-01'), 'SIMS'],
+        'b.csv': [make_source(['1', '3'], [90.0, 10.0], ['2025-06-01', None]), 'SIMS'],
+        'c.csv': [pd.DataFrame({'Адрес': ['без номера ПУ']}), 'SIMS'],
+    }
+    readings = long_readings(sources, COLS_KP)
+    assert list(readings.columns) == ['Номер ПУ', 'Источник', 'Дата КП', 'Общий', 'День', 'Ночь']
+    assert readings['Источник'].dtype == 'category'
+    assert list(zip(readings['Номер ПУ'], readings['Источник'])) == [
+        ('1', 'a.csv'), ('1', 'b.csv'), ('2', 'a.csv'), ('3', 'b.csv')]
+
+    # Те же показания, что в столбцах каждого источника широкой таблицы
+    wide = add_additional_readings(pd.DataFrame({'Номер ПУ': ['1', '2', '3']}), sources, COLS_KP)
+    for counter, name in enumerate(['a.csv', 'b.csv'], start=1):
+        expected = wide.dropna(subset=[f'Файл_{counter}']).set_index('Номер ПУ')[f'Общий_{counter}'].sparse.to_dense()
+        actual = readings[readings['Источник'] == name].set_index('Номер ПУ')['Общий']
+        pd.testing.assert_series_equal(actual, expected, check_names=False)
+
+
+def test_additional_readings_are_sparse_and_empty_cells_are_not_written(tmp_path, make_source):
+    import zipfile
+    sources = {
+        'a.csv': [make_source(['1'], 100.0, '2025-05-01'), 'SIMS'],
+        'b.csv': [make_source(['2', '2'], [90.0, 80.0], '2025-06-01'), 'SIMS'],
+    }
+    wide = add_additional_readings(pd.DataFrame({'Номер ПУ': ['1', '2', '3']}), sources, COLS_KP)
+    assert isinstance(wide['Общий_1'].dtype, pd.SparseDtype)
+    assert wide['Файл_2'].dtype == 'category'
+    # Повтор ПУ в источнике размножает строку результата, как pd.merge
+    assert wide['Номер ПУ'].tolist() == ['1', '2', '2', '3']
+    assert wide['Общий_2'].sparse.to_dense().tolist()[1:3] == [90.0, 80.0]
+
+    filepath = save_to_excel(wide, 'test', output_folder=str(tmp_path))
+    with zipfile.ZipFile(filepath) as book:
+        sheet = book.read('xl/worksheets/sheet1.xml').decode('utf-8')
+    # Заголовок, номера ПУ, у источника 'a.csv' одна строка и у 'b.csv' две: дата, общий и файл
+    assert sheet.count('<c ') == len(wide.columns) + 4 + 3 + 6
+    written = pd.read_excel(filepath, dtype={'Номер ПУ': str})
+    assert written['Общий_2'].tolist()[1:3] == [90.0, 80.0]
+    assert written['Файл_1'][0] == 'a.csv' and pd.isna(written['Файл_1'][1])
+
+
+def test_save_to_excel(tmp_path):
+    df = pd.DataFrame({'A': [1, 2], 'B': [3, 4]})
+    output_folder = tmp_path / "output"
+    filepath = save_to_excel(df, 'test', output_folder=str(output_folder))
+    assert os.path.exists(filepath)
     assert 'test' in filepath
\ No newline at end of file
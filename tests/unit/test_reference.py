@@ -0,0 +1,25 @@
+import pandas as pd
+
+from core.processor import add_best_readings
+from core.reference import *
+
+
+def test_engines_match_reference():
+    report = run_checks(n_cases=6, as_of_dates=('2025-05-31', '2025-04-30'))
+    assert report.empty, report.to_string()
+
+
+def test_mismatches_reported_by_row_and_column():
+    def broken_best(main_table, date_of_files, as_of_dates):
+        result = add_best_readings(main_table, date_of_files, as_of_dates)
+        return result.assign(**{'Общий': result['Общий'].fillna(0.0)})
+
+    report = run_checks({'add_best_readings': broken_best}, n_cases=3)
+    assert not report.empty and set(report['Столбец']) == {'Общий'}
+    assert report['Ожидается'].isna().all() and (report['Получено'] == 0.0).all()
+
+    expected = pd.DataFrame({'Номер ПУ': ['1', '2'], 'Общий': [1.0, None]})
+    actual = pd.DataFrame({'Номер ПУ': ['1', '2'], 'Общий': pd.arrays.SparseArray([1.0, 5.0])})
+    (row, meter, col, left, right), = compare_tables(expected, actual)
+    assert (row, meter, col, right) == (1, '2', 'Общий', 5.0) and pd.isna(left)
+    assert compare_tables(expected, actual[['Номер ПУ']]) == [(None, None, 'Общий', 'столбец', 'нет столбца')]
@@ -0,0 +1,47 @@
+import pandas as pd
+
+from core.config import COLS_KP, METER_ATTRIBUTES
+from core.processor import delete_duplicates
+from core.registry import *
+
+
+def test_update_registry_keeps_attributes_of_latest_reading(make_source):
+    first = make_source(['1', '2'], 100.0, '2025-02-01')
+    second = make_source(['2', '3'], 200.0, ['2025-02-01', '2025-03-01'])
+    second['Адрес точки учёта'] = 'Новый адрес'
+    registry = update_registry(update_registry(empty_registry(), first), second)
+    # При равной дате остаются сведения источника, встретившегося раньше, как в delete_duplicates
+    expected = delete_duplicates(pd.concat([first, second], ignore_index=True)).set_index('Номер ПУ')
+    assert registry['Адрес точки учёта'].sort_index().tolist() == expected['Адрес точки учёта'].tolist()
+
+    newer = make_source(['1'], 300.0, '2025-04-01')
+    newer['Потребитель'] = 'Другой'
+    registry = update_registry(registry, newer)
+    assert registry.loc['1', 'Потребитель'] == 'Другой'
+    assert len(registry) == 3
+
+
+def test_save_and_load_registry(tmp_path, make_source):
+    path = str(tmp_path / 'registry.pkl')
+    assert load_registry(path).empty
+    registry = update_registry(empty_registry(), make_source(['1'], 100.0, '2025-02-01'))
+    save_registry(registry, path)
+    pd.testing.assert_frame_equal(load_registry(path), registry)
+    (tmp_path / 'registry.pkl').write_bytes(b'broken')
+    assert load_registry(path).empty
+
+
+def test_attach_attributes_restores_full_table(make_source):
+    source = make_source(['1', '2'], 100.0, '2025-02-01')
+    source['Лицевой счет'] = ['ЛС1', 'ЛС2']
+    registry = update_registry(empty_registry(), source)
+    readings = reading_columns(source)
+    assert list(readings.columns) == COLS_KP
+
+    result = attach_attributes(readings.iloc[::-1], registry)
+    assert list(result.columns) == COLS_KP[:-1] + METER_ATTRIBUTES + ['Номер ПУ']
+    assert result['Лицевой счет'].tolist() == ['ЛС2', 'ЛС1']
+    # Неизвестный ПУ остаётся без сведений, таблица с полными сведениями не меняется
+    unknown = attach_attributes(pd.DataFrame({'Номер ПУ': ['9']}), registry)
+    assert unknown['Адрес точки учёта'].isna().all()
+    assert attach_attributes(source, registry) is source
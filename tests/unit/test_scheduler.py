@@ -0,0 +1,63 @@
+import json
+import pytest
+from core.scheduler import *
+
+
+def test_plan_batches_largest_first(tmp_path):
+    big = tmp_path / "big Отчет КУЭМ .xlsx"
+    small = tmp_path / "small Отчет КУЭМ .xlsx"
+    big.write_bytes(b'0' * 2 ** 20)
+    small.write_bytes(b'0' * 2 ** 10)
+
+    batches = plan_batches([str(small), str(big)], DEFAULT_COST_MODEL, small_cost=0.5)
+    assert batches[0] == [str(big)]
+    assert batches[1] == [str(small)]
+
+
+def test_plan_batches_groups_small_files():
+    model = {None: {'overhead': 0.1, 'sec_per_mb': 0.0}}
+    files = [f'file{i}.csv' for i in range(10)]
+
+    batches = plan_batches(files, model, small_cost=0.5, target_cost=0.5)
+    assert sorted(sum(batches, [])) == sorted(files)
+    assert len(batches) == 2
+
+
+def test_update_cost_model(tmp_path):
+    test_file = tmp_path / "Симс.csv"
+    test_file.write_bytes(b'0' * 2 ** 20)
+    model = load_cost_model(str(tmp_path / 'missing.json'))
+
+    assert update_cost_model(model, [(str(test_file), 'SIMS', 10.0)])
+    assert model['SIMS']['sec_per_mb'] > DEFAULT_COST_MODEL['SIMS']['sec_per_mb']
+
+    model_file = tmp_path / 'model.json'
+    save_cost_model(model, str(model_file))
+    assert load_cost_model(str(model_file)) == model
+    assert 'null' in json.loads(model_file.read_text(encoding='utf-8'))
+
+
+def test_update_cost_model_skips_missing_files():
+    model = load_cost_model('missing.json')
+    assert not update_cost_model(model, [('missing.csv', 'SIMS', 1.0)])
+
+
+def test_update_cost_model_skips_small_files(tmp_path):
+    test_file = tmp_path / "Симс.csv"
+    test_file.write_bytes(b'0' * 2600)
+    model = load_cost_model(str(tmp_path / 'missing.json'))
+    assert not update_cost_model(model, [(str(test_file), 'SIMS', 0.1)])
+    assert model['SIMS'] == DEFAULT_COST_MODEL['SIMS']
+
+
+def test_update_stage_model():
+    model = load_cost_model('нет такого файла.json')
+    assert not update_stage_model(model, 10, 1000, 1.0, 100, 1.0)
+    assert 'stages' not in model
+
+    assert update_stage_model(model, 10 ** 6, 200 * 10 ** 6, None, 10 ** 6, 40.0)
+    stages = stage_model(model)
+    assert stages['bytes_per_row'] > DEFAULT_STAGE_MODEL['bytes_per_row']
+    assert stages['write_sec_per_mcell'] > DEFAULT_STAGE_MODEL['write_sec_per_mcell']
+    # Время обработки из контрольных точек не используется
+    assert stages['process_sec_per_mrow'] == DEFAULT_STAGE_MODEL['process_sec_per_mrow']
@@ -0,0 +1,54 @@
+import logging
+import os
+import shutil
+import zipfile
+
+import pytest
+from openpyxl import Workbook
+
+from core.sniffer import *
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), '..', 'TEST_DATA')
+
+
+@pytest.mark.parametrize('name, format', [
+    ('2025-05-19 Симс.csv', 'SIMS'),
+    ('2025-06-18 Отчет КУЭМ (20).xlsx', 'PYRAMIDA'),
+    ('2025-06-18 Ведомость опроса для выгрузки в КУЭМ по ЭМИС.xlsx', 'EMIS'),
+    ('2025-06-18 Ведомость опроса для выгрузки в КУЭМ (с типом ПУ без AD) (тчк).xlsx', 'TELESCOP'),
+])
+def test_renamed_file_detected_by_content(tmp_path, name, format):
+    renamed = str(tmp_path / ('выгрузка' + os.path.splitext(name)[1]))
+    shutil.copy(os.path.join(TEST_DATA, name), renamed)
+    assert identific_format_file(renamed) is None
+    assert sniff_format(renamed) == format
+    assert detect_format(renamed) == format
+
+
+def test_inline_strings_and_unknown_content(tmp_path):
+    workbook = Workbook()
+    workbook.active.append(['Просто таблица', 1, 2])
+    path = str(tmp_path / 'Отчет КУЭМ (1).xlsx')
+    workbook.save(path)
+    assert xlsx_head_rows(path) == [['Просто таблица', '1', '2']]
+    # Содержимое не узнано - формат определяется по имени
+    assert sniff_format(path) is None
+    assert detect_format(path) == 'PYRAMIDA'
+
+
+def test_damaged_file_falls_back_to_name(tmp_path):
+    path = tmp_path / '2025-05-19 Симс.xlsx'
+    path.write_bytes(b'not a zip')
+    assert sniff_format(str(path)) is None
+    assert detect_format(str(path)) == 'SIMS'
+    assert detect_format(os.path.join(TEST_DATA, '2025-05-19 Симс.csv'), sniff=False) == 'SIMS'
+
+
+def test_content_wins_over_name_in_archive(tmp_path, caplog):
+    archive = tmp_path / 'май.zip'
+    with zipfile.ZipFile(archive, 'w') as f:
+        f.write(os.path.join(TEST_DATA, '2025-05-19 Симс.csv'), 'Отчет КУЭМ (1).csv')
+    path = str(archive) + '::Отчет КУЭМ (1).csv'
+    with caplog.at_level(logging.WARNING):
+        assert detect_format(path) == 'SIMS'
+    assert 'по содержимому SIMS' in caplog.text
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+from core.processor import add_best_readings, delete_duplicates
+from core.validator import *
+
+TODAY = pd.Timestamp('2025-06-18')
+
+
+def test_validate_readings_flags():
+    table = pd.DataFrame({
+        'Номер ПУ': ['1', '2', '3', '4', '5', '6'],
+        'Дата КП': pd.to_datetime(['2025-06-01', '2025-06-01', '2025-06-01', '2025-07-01', None,
+                                   '2025-06-18 23:00'], format='mixed'),
+        'Общий': [100.0, 100.0, -5.0, 10.0, 10.0, 10.0],
+        'День': [60.0, 60.01, None, 6.0, 6.0, 'x'],
+        'Ночь': [40.0, 50.0, None, 4.0, 4.0, None],
+    })
+    flags = validate_readings(table, today=TODAY)
+    assert flags.tolist() == [0, FLAG_SUM_MISMATCH, FLAG_NEGATIVE, FLAG_FUTURE_DATE, FLAG_NO_DATE, FLAG_NON_NUMERIC]
+    assert flags.dtype == np.uint8
+
+
+def test_decreasing_readings_matches_brute_force():
+    rng = np.random.default_rng(0)
+    n = 500
+    codes = rng.integers(0, 60, n)
+    dates = pd.Series(pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 30, n), 'D'))
+    dates[rng.random(n) < 0.1] = pd.NaT
+    totals = rng.integers(0, 100, n).astype(float)
+    totals[rng.random(n) < 0.1] = np.nan
+
+    expected = []
+    for i in range(n):
+        earlier = [totals[j] for j in range(n) if codes[j] == codes[i] and pd.notna(dates[j]) and pd.notna(dates[i])
+                   and (dates[j] < dates[i] or (dates[j] == dates[i] and j < i))]
+        expected.append(bool(earlier) and totals[i] < np.nanmax(earlier + [-np.inf]) - 0.05)
+    assert decreasing_readings(codes, dates, totals).tolist() == expected
+
+
+def test_validate_adds_flags_and_summary(make_source):
+    sources = {
+        'a.csv': [make_source(['1', '2'], [100.0, 50.0], '2025-05-01', day=[60.0, 50.0], night=[40.0, 0.0]), 'SIMS'],
+        'b.csv': [make_source(['1', '3'], [90.0, 10.0], ['2025-06-01', None], day=[50.0, 5.0], night=[40.0, 5.0]),
+                  'SIMS'],
+    }
+    main_table = delete_duplicates(pd.concat([df for df, _ in sources.values()], ignore_index=True))
+    best = add_best_readings(main_table, sources, ['2025-06-30'])
+    result, summary = validate(best, sources, ['2025-06-30'], today=TODAY)
+
+    columns = list(result.columns)
+    assert columns[columns.index('Примечание') + 1] == 'Флаги'
+    flags = dict(zip(result['Номер ПУ'], result['Флаги']))
+    assert flags == {'1': FLAG_DECREASING, '2': 0, '3': FLAG_NO_DATE}
+    assert summary.loc['b.csv', 'Строк'] == 2
+    assert summary.loc['b.csv', 'Убывают'] == 1 and summary.loc['a.csv', 'Убывают'] == 0
+
+    # Для нескольких периодов флаги добавляются к каждому периоду
+    several = add_best_readings(main_table, sources, ['2025-05-31', '2025-06-30'])
+    result, _ = validate(several, sources, ['2025-05-31', '2025-06-30'], today=TODAY)
+    assert {'Флаги 05.2025', 'Флаги 06.2025'} <= set(result.columns)
+
+
+def test_lookup_uses_latest_row_and_result_codes(make_source):
+    # У ПУ '1' в источнике две строки: флаги берутся у самой свежей, как при выборе лучших показаний
+    source = make_source(['1', '1', '2'], [-5.0, 100.0, 10.0], ['2025-05-01', '2025-06-01', '2025-06-01'])
+    sources = {'a.csv': [source, 'SIMS']}
+    best = add_best_readings(delete_duplicates(source), sources, ['2025-06-30'])
+    flags = SourceFlags(sources, TODAY, best['Номер ПУ'])
+    assert flags.lookup(best['Номер ПУ'], best['Источник']).tolist() == [0, 0]
+    # Коды ПУ - позиции ПУ в результате, ПУ не из результата получают следующие коды
+    assert list(flags.meters) == list(best['Номер ПУ'])
+    codes, meters = meter_codes(pd.Series(['3', '1', '3']), pd.Series(['1', '2']))
+    assert codes.tolist() == [2, 0, 2] and list(meters) == ['1', '2', '3']
@@ -0,0 +1,36 @@
+import time
+import pytest
+from core.watchdog import *
+
+
+def allocate_memory(size_mb):
+    data = bytearray(size_mb * 2 ** 20)
+    time.sleep(30)
+    return len(data)
+
+
+def raise_error():
+    raise ValueError('Поврежденный файл')
+
+
+def test_run_with_budget_ok():
+    assert run_with_budget(len, ('abc',), timeout=30) == (STATUS_OK, 3)
+
+
+def test_run_with_budget_timeout():
+    start = time.monotonic()
+    status, reason = run_with_budget(time.sleep, (30,), timeout=0.5)
+    assert status == STATUS_TIMEOUT
+    assert time.monotonic() - start < 20
+
+
+def test_run_with_budget_error():
+    status, reason = run_with_budget(raise_error, timeout=30)
+    assert status == STATUS_ERROR
+    assert 'Поврежденный файл' in reason
+
+
+@pytest.mark.skipif(process_rss_mb(os.getpid()) is None, reason="Память процесса недоступна")
+def test_run_with_budget_memory():
+    status, reason = run_with_budget(allocate_memory, (400,), timeout=60, memory_limit_mb=200)
+    assert status == STATUS_MEMORY